@@ -0,0 +1,173 @@
+"""Local stand-ins for Google Maps, Nominatim and OpenWeather, for benchmarks.
+
+Responses have the same shape as the real APIs. Addresses geocode to a stable point inside a small box in
+Delhi, so every pair is within the hyperlocal limit. Each service's latency, jitter, error rate and quota
+can be changed at runtime. Calls beyond a service's quota (rate_per_second, 0 for none) are refused the way
+the real service does: OVER_QUERY_LIMIT from Google, HTTP 429 from the others.
+
+    python benchmarks/fake_upstreams.py --port 8900
+    curl -X POST localhost:8900/_config -d '{"google": {"latency_ms": 80, "error_rate": 0.2}}'
+    curl -X POST localhost:8900/_config -d '{"nominatim": {"rate_per_second": 1}}'
+
+Point the API at it with GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8900/maps/api,
+NOMINATIM_BASE_URL=http://127.0.0.1:8900/nominatim and OPENWEATHER_BASE_URL=http://127.0.0.1:8900/data/2.5.
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SERVICES = ("google", "nominatim", "openweather")
+# South-west corner and size of the box addresses are placed in (~9 km across)
+BOX_LAT, BOX_LNG, BOX_SIZE = 28.58, 77.16, 0.08
+ROAD_FACTOR = 1.3
+SPEED_KMH = 25.0
+
+app = FastAPI(title="fake-upstreams")
+config: Dict[str, Dict[str, float]] = {
+    name: {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "rate_per_second": 0.0} for name in SERVICES
+}
+calls: Counter = Counter()
+errors: Counter = Counter()
+throttled: Counter = Counter()
+# Calls each service accepted in the current one-second window: service -> (window start, count)
+windows: Dict[str, tuple[float, int]] = {}
+
+
+# Function to place an address at a stable pseudo-random point inside the box
+def locate(address: str) -> tuple[float, float]:
+    digest = hashlib.blake2b(address.strip().lower().encode(), digest_size=8).digest()
+    u = int.from_bytes(digest[:4], "big") / 2**32
+    v = int.from_bytes(digest[4:], "big") / 2**32
+    return round(BOX_LAT + u * BOX_SIZE, 6), round(BOX_LNG + v * BOX_SIZE, 6)
+
+
+def parse_point(value: str) -> tuple[float, float]:
+    lat, lng = value.split(",")
+    return float(lat), float(lng)
+
+
+# Road distance (metres) and duration (seconds) between two points
+def route(origin: tuple[float, float], destination: tuple[float, float]) -> tuple[int, int]:
+    dlat = math.radians(destination[0] - origin[0])
+    dlng = math.radians(destination[1] - origin[1])
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(origin[0])) * math.cos(math.radians(destination[0])) * math.sin(dlng / 2) ** 2
+    metres = 2 * 6371000 * math.asin(math.sqrt(min(a, 1.0))) * ROAD_FACTOR
+    return int(metres), int(metres / 1000 / SPEED_KMH * 3600)
+
+
+# Function to count a call against the service's quota; False when it is over
+def within_quota(service: str) -> bool:
+    limit = config[service]["rate_per_second"]
+    if limit <= 0:
+        return True
+    now = time.monotonic()
+    start, count = windows.get(service, (now, 0))
+    if now - start >= 1.0:
+        start, count = now, 0
+    windows[service] = (start, count + 1)
+    return count < limit
+
+
+# Function to apply a service's configured quota, latency and error rate; returns an error response or None
+async def simulate(service: str):
+    calls[service] += 1
+    settings = config[service]
+    if not within_quota(service):
+        throttled[service] += 1
+        if service == "google":
+            return JSONResponse(content={"status": "OVER_QUERY_LIMIT", "error_message": "You have exceeded your rate-limit"})
+        return JSONResponse(status_code=429, content={"error": "Too Many Requests"})
+    delay = settings["latency_ms"] + random.uniform(0, settings["jitter_ms"])
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if random.random() < settings["error_rate"]:
+        errors[service] += 1
+        return JSONResponse(status_code=503, content={"status": "UNAVAILABLE"})
+    return None
+
+
+@app.get("/maps/api/geocode/json")
+async def google_geocode(address: str):
+    if (failure := await simulate("google")) is not None:
+        return failure
+    lat, lng = locate(address)
+    return {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+
+
+@app.get("/maps/api/directions/json")
+async def google_directions(origin: str, destination: str):
+    if (failure := await simulate("google")) is not None:
+        return failure
+    metres, seconds = route(parse_point(origin), parse_point(destination))
+    leg = {
+        "distance": {"value": metres},
+        "duration": {"value": seconds},
+        "duration_in_traffic": {"value": int(seconds * 1.2)},
+    }
+    return {"status": "OK", "routes": [{"legs": [leg], "overview_polyline": {"points": ""}}]}
+
+
+@app.get("/maps/api/distancematrix/json")
+async def google_distance_matrix(origins: str, destinations: str):
+    if (failure := await simulate("google")) is not None:
+        return failure
+    targets = [parse_point(p) for p in destinations.split("|")]
+    rows = []
+    for origin in (parse_point(p) for p in origins.split("|")):
+        elements = []
+        for destination in targets:
+            metres, seconds = route(origin, destination)
+            elements.append({
+                "status": "OK",
+                "distance": {"value": metres},
+                "duration": {"value": seconds},
+                "duration_in_traffic": {"value": int(seconds * 1.2)},
+            })
+        rows.append({"elements": elements})
+    return {"status": "OK", "rows": rows}
+
+
+@app.get("/nominatim/search")
+async def nominatim_search(q: str):
+    if (failure := await simulate("nominatim")) is not None:
+        return failure
+    lat, lng = locate(q)
+    return [{"lat": str(lat), "lon": str(lng)}]
+
+
+@app.get("/data/2.5/weather")
+async def openweather_current(lat: float, lon: float):
+    if (failure := await simulate("openweather")) is not None:
+        return failure
+    return {"weather": [{"main": "Clear"}], "main": {"temp": 31.0, "humidity": 48}, "wind": {"speed": 3.2}}
+
+
+# Update latency/jitter/error rate/quota per service; omitted services and fields keep their settings
+@app.post("/_config")
+async def update_config(request: Request) -> Dict[str, Any]:
+    for service, settings in (await request.json()).items():
+        config[service].update({k: float(v) for k, v in settings.items() if k in config[service]})
+    return config
+
+
+@app.get("/_stats")
+async def stats() -> Dict[str, Any]:
+    return {"calls": dict(calls), "errors": dict(errors), "throttled": dict(throttled), "config": config}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve fake Google Maps, Nominatim and OpenWeather APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
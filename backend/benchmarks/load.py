@@ -0,0 +1,296 @@
+"""End-to-end load test for POST /predict-eta against local upstream stand-ins.
+
+Starts fake_upstreams.py and the API (uvicorn, SQLite database) as subprocesses. Each scenario is then run at
+each fixed concurrency level, reporting req/s, latency percentiles and upstream calls per request:
+
+  cold_cache        every request uses new addresses: geocoding and directions go upstream
+  warm_cache        a small set of trips, primed first: served from caches, model loaded
+  slow_upstream     new addresses while Google and OpenWeather answer after 5 s: hedged Nominatim geocoding,
+                    then offline routing and default weather at the request deadline
+  upstream_failure  new addresses while Google and OpenWeather fail: Nominatim, offline routing, default weather
+  fallback_path     warm_cache against a server with no model: compare with warm_cache for the cost of ML
+
+    python benchmarks/load.py --concurrency 1 8 32 --requests 300 --out load.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import httpx
+import numpy as np
+
+from startup import SRC_DIR, free_port
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ["cold_cache", "warm_cache", "slow_upstream", "upstream_failure", "fallback_path"]
+WARM_TRIPS = 20
+
+
+# Function to start a subprocess and wait until `probe` says it is up
+@contextmanager
+def serve(args: list[str], cwd: str, env: Dict[str, str], base_url: str, probe: Callable[[httpx.Client], bool],
+          log_path: str, timeout: float = 60.0) -> Iterator[None]:
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + timeout
+        with httpx.Client(base_url=base_url, timeout=1.0) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{args[-1]} exited during startup; see {log_path}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{args[-1]} did not start within {timeout:.0f} s; see {log_path}")
+                try:
+                    if probe(client):
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+        yield
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+# The API is up once the database is bound and the model has either loaded or definitively failed
+def api_warmed_up(client: httpx.Client) -> bool:
+    components = client.get("/ready").json()["components"]
+    return components["database"]["state"] == "ready" and components["model"]["state"] != "pending"
+
+
+def trip(restaurant: str, customer: str) -> Dict[str, Any]:
+    return {
+        "restaurant_address": restaurant,
+        "delivery_address": customer,
+        "delivery_person_age": 29,
+        "delivery_person_rating": 4.6,
+        "vehicle_type": "bike",
+        "vehicle_condition": 2,
+        "multiple_deliveries": 1,
+        "order_time": "2025-05-01T19:30:00",
+    }
+
+
+def fresh_trip(_: int) -> Dict[str, Any]:
+    key = uuid.uuid4().hex[:12]
+    return trip(f"Restaurant {key}, Delhi", f"Customer {key}, Delhi")
+
+
+def warm_trip(i: int) -> Dict[str, Any]:
+    return trip(f"Restaurant {i % WARM_TRIPS}, Delhi", f"Customer {i % WARM_TRIPS}, Delhi")
+
+
+# Function to send `total` requests with `concurrency` in flight and collect per-request latency and status
+async def drive(base_url: str, make_trip: Callable[[int], Dict[str, Any]], total: int, concurrency: int) -> Dict[str, Any]:
+    latencies_ms: list[float] = []
+    statuses: Counter = Counter()
+    next_index = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def worker() -> None:
+            for i in next_index:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/predict-eta", json=make_trip(i))
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies_ms.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "requests": total,
+        "ok": statuses.get("200", 0),
+        "statuses": dict(statuses),
+        "duration_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "latency_ms": {
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "mean": round(float(np.mean(latencies_ms)), 2),
+            "max": round(float(np.max(latencies_ms)), 2),
+        },
+    }
+
+
+def upstream_calls(fakes: httpx.Client) -> Counter:
+    return Counter(fakes.get("/_stats").json()["calls"])
+
+
+# Function to run one scenario at every concurrency level, recording upstream calls made per request
+def run_scenario(
+    name: str, api_url: str, fakes: httpx.Client, make_trip: Callable[[int], Dict[str, Any]], args: argparse.Namespace
+) -> list[Dict[str, Any]]:
+    results = []
+    for concurrency in args.concurrency:
+        before = upstream_calls(fakes)
+        result = asyncio.run(drive(api_url, make_trip, args.requests, concurrency))
+        made = upstream_calls(fakes) - before
+        result.update(
+            scenario=name,
+            concurrency=concurrency,
+            upstream_calls_per_request={k: round(v / args.requests, 3) for k, v in sorted(made.items())},
+        )
+        print(
+            f"{name:<17} c={concurrency:<4} {result['rps']:>8.1f} req/s  p50 {result['latency_ms']['p50']:>8.2f}  "
+            f"p95 {result['latency_ms']['p95']:>8.2f}  p99 {result['latency_ms']['p99']:>8.2f} ms  "
+            f"ok {result['ok']}/{args.requests}", file=sys.stderr
+        )
+        results.append(result)
+    return results
+
+
+def healthy_upstreams(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    return {
+        service: {"latency_ms": args.upstream_latency_ms, "jitter_ms": args.upstream_jitter_ms, "error_rate": args.upstream_error_rate}
+        for service in ("google", "nominatim", "openweather")
+    }
+
+
+def api_env(workdir: str, name: str, fake_url: str, model_dir: Optional[str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, name + '.db')}",
+        GEOCODE_CACHE_PATH=os.path.join(workdir, name + "-geocode.sqlite3"),
+        GOOGLE_MAPS_API_KEY="benchmark",
+        OPENWEATHER_API_KEY="benchmark",
+        GOOGLE_MAPS_BASE_URL=f"{fake_url}/maps/api",
+        NOMINATIM_BASE_URL=f"{fake_url}/nominatim",
+        OPENWEATHER_BASE_URL=f"{fake_url}/data/2.5",
+        MODEL_WATCH_SECONDS="0",
+    )
+    # The fakes have no quotas unless configured, so the API's call budgets should not shape the results
+    for provider in ("GOOGLE_MAPS", "NOMINATIM", "OPENWEATHER"):
+        env.setdefault(f"{provider}_RATE_PER_SECOND", "100000")
+        env.setdefault(f"{provider}_BURST", "100000")
+    if model_dir is not None:
+        env["MODEL_DIR"] = model_dir
+    return env
+
+
+# Function to run the scenarios against one API process (with or without a model)
+def run_server(
+    name: str, scenarios: list[str], workdir: str, fake_url: str, fakes: httpx.Client, model_dir: Optional[str],
+    args: argparse.Namespace
+) -> list[Dict[str, Any]]:
+    port = free_port()
+    api_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+    env = api_env(workdir, name, fake_url, model_dir)
+    results = []
+    with serve(command, SRC_DIR, env, api_url, api_warmed_up, os.path.join(workdir, f"{name}.log")):
+        for scenario in scenarios:
+            fakes.post("/_config", json=healthy_upstreams(args))
+            if scenario in ("warm_cache", "fallback_path"):
+                asyncio.run(drive(api_url, warm_trip, WARM_TRIPS, 1))
+                results += run_scenario(scenario, api_url, fakes, warm_trip, args)
+            elif scenario == "cold_cache":
+                results += run_scenario(scenario, api_url, fakes, fresh_trip, args)
+            elif scenario == "slow_upstream":
+                fakes.post("/_config", json={"google": {"latency_ms": 5000}, "openweather": {"latency_ms": 5000}})
+                results += run_scenario(scenario, api_url, fakes, fresh_trip, args)
+            elif scenario == "upstream_failure":
+                fakes.post("/_config", json={"google": {"error_rate": 1.0}, "openweather": {"error_rate": 1.0}})
+                results += run_scenario(scenario, api_url, fakes, fresh_trip, args)
+    return results
+
+
+# Function to print rps and p99 changes against an earlier results file
+def compare(results: list[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}", file=sys.stderr)
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        rps_change = (result["rps"] / before["rps"] - 1) * 100
+        p99_change = (result["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1) * 100
+        print(
+            f"{result['scenario']:<17} c={result['concurrency']:<4} req/s {rps_change:+6.1f}%  p99 {p99_change:+6.1f}%",
+            file=sys.stderr
+        )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test /predict-eta against fake upstreams")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario and concurrency level")
+    parser.add_argument("--upstream-latency-ms", type=float, default=40.0)
+    parser.add_argument("--upstream-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0, help="error rate outside upstream_failure")
+    parser.add_argument("--out", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results: list[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        fake_port = free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        fake_command = [sys.executable, os.path.join(BENCHMARK_DIR, "fake_upstreams.py"), "--port", str(fake_port)]
+        fake_up = lambda client: client.get("/_stats").status_code == 200  # noqa: E731
+        with serve(fake_command, BENCHMARK_DIR, dict(os.environ), fake_url, fake_up, os.path.join(workdir, "fakes.log")), \
+                httpx.Client(base_url=fake_url) as fakes:
+            with_model = [s for s in args.scenarios if s != "fallback_path"]
+            if with_model:
+                results += run_server("model", with_model, workdir, fake_url, fakes, None, args)
+            if "fallback_path" in args.scenarios:
+                # An empty model directory: the model never loads and every prediction takes the heuristic path
+                results += run_server("no-model", ["fallback_path"], workdir, fake_url, fakes, workdir, args)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "requests": args.requests,
+            "upstream": {
+                "latency_ms": args.upstream_latency_ms,
+                "jitter_ms": args.upstream_jitter_ms,
+                "error_rate": args.upstream_error_rate,
+            },
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.baseline:
+        compare(results, args.baseline)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Startup-time benchmark for the API.
+
+Measures, in fresh processes so nothing is warm:
+  * import   - time to `import main`, and which heavy modules the import pulled in
+  * listen   - time from spawning uvicorn until /health answers
+  * ready    - time from spawning uvicorn until /ready returns 200
+
+The run is network-free: API keys are removed from the environment and the database is a throwaway SQLite file.
+Pass thresholds to turn it into a regression check (exit code 1 when any is exceeded):
+
+    python benchmarks/startup.py --runs 5 --max-import-ms 1500 --max-ready-ms 5000 --out startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# Modules that must only be imported by background warm-up, never by `import main`
+HEAVY_MODULES = ["xgboost", "sklearn", "pandas", "scipy", "joblib", "geopy", "googlemaps"]
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"import_ms": elapsed_ms, "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+# Function to build the environment for a benchmark process: no upstream keys, a private SQLite database
+def benchmark_env(workdir: str) -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_MAPS_API_KEY", "OPENWEATHER_API_KEY")}
+    env.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        GEOCODE_CACHE_PATH=os.path.join(workdir, "geocode.sqlite3"),
+        MODEL_WATCH_SECONDS="0",
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Function to time `import main` in a fresh interpreter
+def measure_import(env: Dict[str, str]) -> Dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Function to start uvicorn and time how long it takes to listen and to report ready
+def measure_serve(env: Dict[str, str], timeout: float) -> Dict[str, Optional[float]]:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    timings: Dict[str, Optional[float]] = {"listen_ms": None, "ready_ms": None, "server_ready_ms": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - start < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {server.returncode} during startup")
+                try:
+                    if timings["listen_ms"] is None:
+                        client.get("/health")
+                        timings["listen_ms"] = (time.perf_counter() - start) * 1000
+                    response = client.get("/ready")
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                if response.status_code == 200:
+                    timings["ready_ms"] = (time.perf_counter() - start) * 1000
+                    timings["server_ready_ms"] = response.json()["ready_ms"]
+                    break
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return timings
+
+
+def summarize(samples: list[Optional[float]]) -> Optional[Dict[str, float]]:
+    values = [s for s in samples if s is not None]
+    if not values:
+        return None
+    return {
+        "min": round(min(values), 1),
+        "median": round(statistics.median(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark API cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /ready per run")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time exceeds this")
+    parser.add_argument("--max-ready-ms", type=float, help="fail if the median time to ready exceeds this")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    imports, serves = [], []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = benchmark_env(workdir)
+        for _ in range(args.runs):
+            imports.append(measure_import(env))
+            serves.append(measure_serve(env, args.timeout))
+
+    report = {
+        "runs": args.runs,
+        "import_ms": summarize([i["import_ms"] for i in imports]),
+        "listen_ms": summarize([s["listen_ms"] for s in serves]),
+        "ready_ms": summarize([s["ready_ms"] for s in serves]),
+        "server_ready_ms": summarize([s["server_ready_ms"] for s in serves]),
+        "heavy_modules_on_import": sorted({m for i in imports for m in i["heavy_modules"]}),
+        "failures": [],
+    }
+    if report["heavy_modules_on_import"]:
+        report["failures"].append(f"import main loaded {', '.join(report['heavy_modules_on_import'])}")
+    if any(s["ready_ms"] is None for s in serves):
+        report["failures"].append(f"server did not become ready within {args.timeout:.0f} s")
+    if args.max_import_ms is not None and report["import_ms"]["median"] > args.max_import_ms:
+        report["failures"].append(f"median import {report['import_ms']['median']} ms > {args.max_import_ms} ms")
+    if args.max_ready_ms is not None and report["ready_ms"] and report["ready_ms"]["median"] > args.max_ready_ms:
+        report["failures"].append(f"median time to ready {report['ready_ms']['median']} ms > {args.max_ready_ms} ms")
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Memory and cache-sharing benchmark for multi-worker serving.
+
+Starts the API with N workers, once per mode, against fake_upstreams.py:
+
+  uvicorn   `uvicorn main:app --workers N`: every worker imports the app and loads the model itself
+  prefork   `python src/prefork.py --workers N`: the model is loaded once and workers share it copy-on-write
+
+After a round of warm-cache requests it reads /proc for every process of the server and reports total RSS and
+PSS, each worker's private memory, and the PSS added per worker beyond the first. It also sends new trips once
+to each worker and counts the upstream calls per trip: with the shared directions and weather stores, a trip
+fetched by one worker is a cache hit for the others. Linux only.
+
+    python benchmarks/workers.py --workers 1 2 4 --out workers.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+import httpx
+
+from load import BENCHMARK_DIR, api_env, api_warmed_up, drive, serve, trip, upstream_calls, warm_trip
+from startup import SRC_DIR, free_port
+
+sys.path.insert(0, SRC_DIR)
+from metrics import process_memory  # noqa: E402
+
+MODES = ["uvicorn", "prefork"]
+
+
+def _mb(value: float) -> float:
+    return round(value / (1 << 20), 1)
+
+
+def parent_pid(pid: int) -> int:
+    with open(f"/proc/{pid}/stat") as f:
+        return int(f.read().rsplit(")", 1)[1].split()[1])
+
+
+# Function to list a process and all of its descendants
+def process_tree(root: int) -> list[int]:
+    children: Dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                children.setdefault(parent_pid(int(entry)), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+# Function to find the server's top process from the port on its command line. Forked workers share the
+# supervisor's command line, so the top one is the match whose parent is not a match.
+def server_pid(port: int) -> int:
+    matches = set()
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/cmdline") as f:
+                    cmdline = f.read().split("\0")
+            except OSError:
+                continue
+            if str(port) in cmdline and ("main:app" in cmdline or any(arg.endswith("prefork.py") for arg in cmdline)):
+                matches.add(int(entry))
+    for pid in matches:
+        if parent_pid(pid) not in matches:
+            return pid
+    raise RuntimeError(f"No server process found for port {port}")
+
+
+def measure(mode: str, workers: int, workdir: str, fake_url: str, fakes: httpx.Client, args: argparse.Namespace) -> Dict[str, Any]:
+    port = free_port()
+    api_url = f"http://127.0.0.1:{port}"
+    name = f"{mode}-{workers}"
+    env = api_env(workdir, name, fake_url, None)
+    env["SHARED_CACHE_PATH"] = os.path.join(workdir, f"{name}-shared.sqlite3")
+    if mode == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+        env.pop("SHARED_CACHE_PATH")
+    else:
+        command = [sys.executable, "prefork.py", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+
+    with serve(command, SRC_DIR, env, api_url, api_warmed_up, os.path.join(workdir, f"{name}.log")):
+        # Readiness is answered by whichever worker accepts the probe; give the others time to finish warming up
+        time.sleep(args.settle_seconds)
+        before = upstream_calls(fakes)
+        result = asyncio.run(drive(api_url, warm_trip, args.requests, args.concurrency))
+        made = upstream_calls(fakes) - before
+        # New trips, each sent once per worker on fresh connections so they land on different workers
+        before = upstream_calls(fakes)
+        with httpx.Client(base_url=api_url, timeout=60.0, headers={"Connection": "close"}) as client:
+            for i in range(args.spread_trips):
+                spread_trip = trip(f"Restaurant {i}, Spread Street, Delhi", f"Customer {i}, Spread Street, Delhi")
+                for _ in range(workers):
+                    client.post("/predict-eta", json=spread_trip)
+        spread = upstream_calls(fakes) - before
+        time.sleep(1)
+
+        root = server_pid(port)
+        processes = {pid: process_memory(pid) for pid in process_tree(root)}
+        processes = {pid: memory for pid, memory in processes.items() if memory}
+        served_by = set()
+        with httpx.Client(base_url=api_url) as client:
+            for _ in range(workers * 10):
+                served_by.add(client.get("/health", headers={"Connection": "close"}).json()["process"]["pid"])
+
+    worker_memory = [memory for pid, memory in processes.items() if pid in served_by]
+    report = {
+        "mode": mode,
+        "workers": workers,
+        "processes": len(processes),
+        "workers_seen": len(served_by),
+        "total_rss_mb": _mb(sum(m["rss"] for m in processes.values())),
+        "total_pss_mb": _mb(sum(m["pss"] for m in processes.values())),
+        "worker_private_mb": [_mb(m["private"]) for m in worker_memory],
+        "ok": result["ok"],
+        "rps": result["rps"],
+        "upstream_calls": dict(sorted(made.items())),
+        "upstream_calls_per_spread_trip": {k: round(v / args.spread_trips, 2) for k, v in sorted(spread.items())},
+    }
+    print(
+        f"{mode:<8} workers={workers:<3} pss {report['total_pss_mb']:>7.1f} MB  rss {report['total_rss_mb']:>7.1f} MB  "
+        f"private/worker {report['worker_private_mb']}  upstream calls per spread trip "
+        f"{report['upstream_calls_per_spread_trip']}", file=sys.stderr
+    )
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare memory per worker for uvicorn --workers and prefork.py")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--spread-trips", type=int, default=20, help="new trips sent once to each worker")
+    parser.add_argument("--settle-seconds", type=float, default=3.0)
+    parser.add_argument("--out", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        fake_port = free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        fake_command = [sys.executable, os.path.join(BENCHMARK_DIR, "fake_upstreams.py"), "--port", str(fake_port)]
+        fake_up = lambda client: client.get("/_stats").status_code == 200  # noqa: E731
+        with serve(fake_command, BENCHMARK_DIR, dict(os.environ), fake_url, fake_up, os.path.join(workdir, "fakes.log")), \
+                httpx.Client(base_url=fake_url) as fakes:
+            for mode in args.modes:
+                for workers in args.workers:
+                    results.append(measure(mode, workers, workdir, fake_url, fakes, args))
+
+    # Memory added by each worker beyond the first, from the growth of total PSS
+    for mode in args.modes:
+        runs = sorted((r for r in results if r["mode"] == mode), key=lambda r: r["workers"])
+        for run in runs[1:]:
+            run["pss_per_extra_worker_mb"] = round(
+                (run["total_pss_mb"] - runs[0]["total_pss_mb"]) / (run["workers"] - runs[0]["workers"]), 1
+            )
+
+    output = json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0 if all(r["ok"] == args.requests for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
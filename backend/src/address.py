@@ -0,0 +1,43 @@
+import re
+import unicodedata
+
+# Common street-address abbreviations expanded to one canonical spelling
+ABBREVIATIONS = {
+    "rd": "road",
+    "st": "street",
+    "str": "street",
+    "ave": "avenue",
+    "av": "avenue",
+    "blvd": "boulevard",
+    "ln": "lane",
+    "hwy": "highway",
+    "sq": "square",
+    "apt": "apartment",
+    "apts": "apartments",
+    "bldg": "building",
+    "fl": "floor",
+    "flr": "floor",
+    "opp": "opposite",
+    "nr": "near",
+    "sec": "sector",
+    "sect": "sector",
+    "ph": "phase",
+    "ext": "extension",
+    "extn": "extension",
+    "mkt": "market",
+    "ngr": "nagar",
+    "clny": "colony",
+}
+
+# Runs of single letters left by dotted initials, e.g. "m g" from "M.G. Road"
+INITIALS = re.compile(r"\b(?:[a-z] )+[a-z]\b")
+
+
+# Function to normalize an address into a cache key: case, punctuation, whitespace, initials and abbreviations
+def normalize_address(address: str) -> str:
+    text = unicodedata.normalize("NFKC", address).casefold()
+    # Keep letters, digits and combining marks (needed for Indic scripts); everything else separates tokens
+    text = "".join(c if unicodedata.category(c)[0] in "LNM" else " " for c in text)
+    text = " ".join(text.split())
+    text = INITIALS.sub(lambda match: match.group(0).replace(" ", ""), text)
+    return " ".join(ABBREVIATIONS.get(token, token) for token in text.split())
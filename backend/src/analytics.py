@@ -0,0 +1,219 @@
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from spatial import cell_center, grid_cell
+
+logger = logging.getLogger(__name__)
+
+# Columns the hourly rollup is grouped by, and the running sums kept per group (means are sum / orders)
+ROLLUP_DIMENSIONS = ("vehicle_type", "traffic_density", "weather_condition")
+ROLLUP_SUMS = ("sum_predicted_eta", "sum_google_eta", "sum_abs_difference", "sum_distance_km", "sum_confidence")
+INTERVALS = ("hour", "day", "total")
+# delivery_eta columns the rollup is computed from
+ROLLUP_SOURCE_COLUMNS = ("created_at", *ROLLUP_DIMENSIONS, "predicted_eta", "google_eta", "distance_km", "confidence")
+
+
+# Function to name the analytics grid cell containing a point, e.g. "3168:8578"
+def cell_key(lat: float, lng: float, cell_meters: float) -> str:
+    x, y = grid_cell(lat, lng, cell_meters)
+    return f"{x}:{y}"
+
+
+# Function to return the centre of an analytics grid cell named by cell_key
+def cell_key_center(key: str, cell_meters: float) -> tuple[float, float]:
+    x, y = key.split(":")
+    return cell_center((int(x), int(y)), cell_meters)
+
+
+# Function to truncate a timestamp to its UTC hour; naive timestamps (SQLite) are already UTC
+def hour_bucket(at: datetime) -> datetime:
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _as_utc(at: datetime) -> datetime:
+    return at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at.astimezone(timezone.utc)
+
+
+# Hourly rollup of delivery_eta by vehicle type, traffic density and weather. apply() folds each write-behind
+# batch into the rollup inside the batch's own transaction, so dashboards read a few rows per hour instead of
+# scanning the prediction table; rebuild() recomputes it from the table, e.g. to backfill after an upgrade.
+class HourlyRollup:
+    def __init__(self, table: Any):
+        self.table = table
+        # Serializes incremental updates against a rebuild
+        self.lock = threading.Lock()
+        self.stats = {"batches": 0, "rows": 0, "rebuilds": 0}
+
+    # Function to sum rows into {(bucket, vehicle type, traffic density, weather): {orders, sums...}}
+    @staticmethod
+    def aggregate(rows: Iterable[Dict[str, Any]]) -> Dict[tuple, Dict[str, float]]:
+        groups: Dict[tuple, Dict[str, float]] = {}
+        for row in rows:
+            if row.get("created_at") is None:
+                continue
+            key = (hour_bucket(row["created_at"]), *(row.get(d) or "unknown" for d in ROLLUP_DIMENSIONS))
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"orders": 0, **{name: 0.0 for name in ROLLUP_SUMS}}
+            predicted, google = row.get("predicted_eta") or 0.0, row.get("google_eta") or 0.0
+            group["orders"] += 1
+            group["sum_predicted_eta"] += predicted
+            group["sum_google_eta"] += google
+            group["sum_abs_difference"] += abs(predicted - google)
+            group["sum_distance_km"] += row.get("distance_km") or 0.0
+            group["sum_confidence"] += row.get("confidence") or 0.0
+        return groups
+
+    # Add aggregated groups to the rollup: one upsert on Postgres and SQLite, update-or-insert elsewhere
+    def merge(self, connection: Connection, groups: Dict[tuple, Dict[str, float]]) -> None:
+        if not groups:
+            return
+        values = [
+            {"bucket_start": key[0], **dict(zip(ROLLUP_DIMENSIONS, key[1:])), **sums} for key, sums in groups.items()
+        ]
+        dialect = connection.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            statement = upsert(self.table)
+            statement = statement.on_conflict_do_update(
+                index_elements=["bucket_start", *ROLLUP_DIMENSIONS],
+                set_={
+                    name: self.table.c[name] + statement.excluded[name] for name in ("orders", *ROLLUP_SUMS)
+                },
+            )
+            connection.execute(statement, values)
+            return
+
+        for value in values:
+            match = and_(*(self.table.c[name] == value[name] for name in ("bucket_start", *ROLLUP_DIMENSIONS)))
+            increments = {name: self.table.c[name] + value[name] for name in ("orders", *ROLLUP_SUMS)}
+            if connection.execute(update(self.table).where(match).values(**increments)).rowcount == 0:
+                connection.execute(insert(self.table), [value])
+
+    # Write-behind hook: fold a batch of delivery_eta rows into the rollup within the batch's transaction
+    def apply(self, connection: Connection, rows: list[Dict[str, Any]]) -> None:
+        groups = self.aggregate(rows)
+        with self.lock:
+            self.merge(connection, groups)
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+
+    # Recompute the rollup from the source table, streaming it in chunks, plus any rows already moved out of
+    # the table (archived chunks of row dicts). Returns (rows scanned, groups).
+    def rebuild(
+        self, engine: Engine, source: Any, archived: Iterable[list[Dict[str, Any]]] = (), chunk_size: int = 5000
+    ) -> tuple[int, int]:
+        columns = [source.c[name] for name in ROLLUP_SOURCE_COLUMNS]
+        groups: Dict[tuple, Dict[str, float]] = {}
+        scanned = 0
+        with self.lock, engine.begin() as connection:
+            connection.execute(delete(self.table))
+            result = connection.execution_options(yield_per=chunk_size).execute(select(*columns))
+            for chunk in itertools.chain(archived, result.mappings().partitions()):
+                scanned += len(chunk)
+                for key, sums in self.aggregate(chunk).items():
+                    group = groups.setdefault(key, {"orders": 0, **{name: 0.0 for name in ROLLUP_SUMS}})
+                    for name, value in sums.items():
+                        group[name] += value
+            self.merge(connection, groups)
+        self.stats["rebuilds"] += 1
+        logger.info(f"Rebuilt {self.table.name}: {scanned} rows into {len(groups)} groups")
+        return scanned, len(groups)
+
+    # Read the rollup for the hours from since up to until, grouped by the given dimensions per hour, per day
+    # or in total. The window is widened to the start of since's hour, since hours are the rollup's resolution.
+    def query(
+        self, connection: Any, since: datetime, until: datetime, group_by: list[str] = (),
+        filters: Optional[Dict[str, str]] = None, interval: str = "hour"
+    ) -> list[Dict[str, Any]]:
+        table = self.table
+        dimensions = [table.c[name] for name in group_by]
+        # Totals are summed by the database; hours are kept apart for the hourly and daily views
+        buckets = [table.c.bucket_start] if interval != "total" else []
+        statement = (
+            select(*buckets, *dimensions, func.sum(table.c.orders), *(func.sum(table.c[n]) for n in ROLLUP_SUMS))
+            .where(table.c.bucket_start >= hour_bucket(since), table.c.bucket_start < until)
+            .group_by(*buckets, *dimensions)
+            .order_by(*buckets)
+        )
+        for name, value in (filters or {}).items():
+            statement = statement.where(table.c[name] == value)
+
+        # Hourly rows are few, so coarser intervals are merged here rather than with dialect-specific SQL
+        merged: Dict[tuple, list] = {}
+        for row in connection.execute(statement).all():
+            bucket_start, rest = (None, row) if interval == "total" else (_as_utc(row[0]), row[1:])
+            if interval == "day":
+                bucket_start = bucket_start.replace(hour=0)
+            keys, totals = tuple(rest[:len(group_by)]), rest[len(group_by):]
+            entry = merged.setdefault((bucket_start, *keys), [0.0] * len(totals))
+            for i, value in enumerate(totals):
+                entry[i] += value or 0
+
+        buckets = []
+        for (bucket_start, *keys), (orders, predicted, google, difference, distance, confidence) in merged.items():
+            orders = int(orders)
+            buckets.append({
+                "bucket_start": bucket_start.isoformat() if bucket_start is not None else None,
+                **dict(zip(group_by, keys)),
+                "orders": orders,
+                "mean_predicted_eta": round(predicted / orders, 2) if orders else None,
+                "mean_google_eta": round(google / orders, 2) if orders else None,
+                "mean_abs_difference": round(difference / orders, 2) if orders else None,
+                "mean_distance_km": round(distance / orders, 3) if orders else None,
+                "mean_confidence": round(confidence / orders, 3) if orders else None,
+            })
+        return buckets
+
+
+# Function to summarize predictions per delivery cell in [since, until), busiest cells first. Served by the
+# created_at index for the window and the (delivery_cell, created_at) index when one cell is requested.
+def cell_summary(
+    connection: Any, table: Any, since: datetime, until: datetime, cell_meters: float, cell: Optional[str] = None,
+    limit: int = 50
+) -> list[Dict[str, Any]]:
+    orders = func.count()
+    statement = (
+        select(
+            table.c.delivery_cell, orders, func.avg(table.c.predicted_eta), func.avg(table.c.google_eta),
+            func.avg(func.abs(table.c.predicted_eta - table.c.google_eta)), func.avg(table.c.distance_km)
+        )
+        .where(table.c.created_at >= since, table.c.created_at < until, table.c.delivery_cell.is_not(None))
+        .group_by(table.c.delivery_cell)
+        .order_by(orders.desc())
+        .limit(limit)
+    )
+    if cell is not None:
+        statement = statement.where(table.c.delivery_cell == cell)
+    cells = []
+    for key, count, predicted, google, difference, distance in connection.execute(statement).all():
+        lat, lng = cell_key_center(key, cell_meters)
+        cells.append({
+            "cell": key,
+            "center_lat": round(lat, 6),
+            "center_lng": round(lng, 6),
+            "orders": count,
+            "mean_predicted_eta": round(predicted, 2) if predicted is not None else None,
+            "mean_google_eta": round(google, 2) if google is not None else None,
+            "mean_abs_difference": round(difference, 2) if difference is not None else None,
+            "mean_distance_km": round(distance, 3) if distance is not None else None,
+        })
+    return cells
+
+
+# Function to resolve an analytics time window; defaults to the last `default_days` days
+def time_window(since: Optional[datetime], until: Optional[datetime], default_days: float = 7) -> tuple[datetime, datetime]:
+    until = _as_utc(until) if until is not None else datetime.now(timezone.utc)
+    since = _as_utc(since) if since is not None else until - timedelta(days=default_days)
+    return since, until
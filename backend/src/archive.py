@@ -0,0 +1,384 @@
+"""Archival of old delivery_eta rows to compressed, date-partitioned Parquet files.
+
+    python src/archive.py run --retention-days 30     # move rows older than 30 days out of the database
+    python src/archive.py show                        # partitions, files and rows in the archive
+
+Rows are streamed out oldest first, in chunks read through a server-side cursor, so memory stays bounded however
+many rows are due. Each chunk is written to ARCHIVE_DIR/delivery_eta/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+(zstd) together with the reported delivery time and the id of its delivery_outcome row, if any, and only then
+deleted from the table, in one transaction per pass.
+Until that delete commits, the pass's files are listed in a _pending-*.json journal. A run interrupted in between
+leaves the journal behind, and the next run first drops those files' rows that are still in the table (they are
+archived again) and removes leftover .part-*.partial files, so interrupted runs never duplicate rows. Run one
+archiver at a time.
+
+Readers (training pipelines, the analytics rollup rebuild) scan the archive with scan_archive() / iter_frames(),
+which prune partitions by date.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, Table, create_engine, delete, select, tuple_
+from sqlalchemy.engine import Engine
+
+from model_store import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "30"))
+# Rows archived per pass: written to files, then deleted, before the next pass is read
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "50000"))
+# Rows held in memory at a time while a pass is streamed from the cursor
+ARCHIVE_FETCH_ROWS = int(os.getenv("ARCHIVE_FETCH_ROWS", "5000"))
+# Rows per DELETE statement, keeping statements small; a pass's statements commit together
+ARCHIVE_DELETE_BATCH = int(os.getenv("ARCHIVE_DELETE_BATCH", "5000"))
+COMPRESSION = "zstd"
+TABLE_NAME = "delivery_eta"
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+ARROW_TYPES = {
+    int: pa.int64(),
+    float: pa.float64(),
+    str: pa.string(),
+    bool: pa.bool_(),
+    datetime: pa.timestamp("us", tz="UTC"),
+}
+
+
+# Function to resolve the database URL the API writes predictions to (same rules as the API and train_model.py)
+def database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL environment variable is not set")
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+# Function to build the archive schema from the reflected table, plus the reported delivery time and its
+# delivery_outcome id (the retraining watermark, see train_model.py)
+def archive_schema(table: Table) -> pa.Schema:
+    fields = []
+    for column in table.columns:
+        try:
+            arrow_type = ARROW_TYPES.get(column.type.python_type, pa.string())
+        except NotImplementedError:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields + [pa.field("actual_minutes", pa.float64()), pa.field("outcome_id", pa.int64())])
+
+
+# Function to pick a row's partition: the UTC date it was created (naive timestamps are already UTC)
+def partition_date(created_at: datetime) -> str:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date().isoformat()
+
+
+# Writes one pass's rows, which arrive in created_at order, into one file per date. Files are written under a
+# temporary name and renamed once complete, so readers never see a partial file. Each file is added to the
+# pass's journal before it is renamed into place.
+class PartitionWriter:
+    def __init__(self, directory: str, schema: pa.Schema, journal_path: str):
+        self.directory = directory
+        self.schema = schema
+        self.journal_path = journal_path
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.date: Optional[str] = None
+        self.path: Optional[str] = None
+        self.first_id: Optional[int] = None
+        self.last_id: Optional[int] = None
+        self.files: list[str] = []
+        self.bytes = 0
+
+    def write(self, rows: list[Dict[str, Any]]) -> None:
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or partition_date(rows[i]["created_at"]) != partition_date(rows[start]["created_at"]):
+                self._write_run(rows[start:i])
+                start = i
+
+    def _write_run(self, rows: list[Dict[str, Any]]) -> None:
+        day = partition_date(rows[0]["created_at"])
+        if day != self.date:
+            self.close()
+            partition = os.path.join(self.directory, f"date={day}")
+            os.makedirs(partition, exist_ok=True)
+            self.date = day
+            self.path = os.path.join(partition, f".part-{os.getpid()}.partial")
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=COMPRESSION)
+            self.first_id = rows[0]["id"]
+        columns = {field.name: [row[field.name] for row in rows] for field in self.schema}
+        self.writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=self.schema))
+        self.first_id = min(self.first_id, min(row["id"] for row in rows))
+        self.last_id = max(self.last_id or 0, max(row["id"] for row in rows))
+
+    # Finish the open file and give it its final name
+    def close(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        final_path = os.path.join(os.path.dirname(self.path), f"part-{self.first_id:012d}-{self.last_id:012d}.parquet")
+        self.files.append(final_path)
+        write_json_atomic(self.journal_path, {"files": [os.path.relpath(path, self.directory) for path in self.files]})
+        os.replace(self.path, final_path)
+        self.bytes += os.path.getsize(final_path)
+        self.writer, self.date, self.path, self.first_id, self.last_id = None, None, None, None, None
+
+    # Drop the open file after a failed read; files already closed stay listed in the journal
+    def abort(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.remove(self.path)
+        self.writer, self.date, self.path, self.first_id, self.last_id = None, None, None, None, None
+
+
+# Function to delete a pass's archived rows by id, in batches of statements that commit together: either all of
+# the pass's rows leave the table or none do
+def delete_rows(engine: Engine, table: Table, ids: list[int], batch_size: int) -> int:
+    deleted = 0
+    with engine.begin() as connection:
+        for start in range(0, len(ids), batch_size):
+            deleted += connection.execute(delete(table).where(table.c.id.in_(ids[start:start + batch_size]))).rowcount
+    return deleted
+
+
+# Function to find which of the given ids are still in the table
+def live_ids(engine: Engine, table: Table, ids: list[int], batch_size: int = ARCHIVE_DELETE_BATCH) -> set[int]:
+    live: set[int] = set()
+    with engine.connect() as connection:
+        for start in range(0, len(ids), batch_size):
+            live.update(connection.execute(select(table.c.id).where(table.c.id.in_(ids[start:start + batch_size]))).scalars())
+    return live
+
+
+# Function to undo what interrupted runs left behind: temporary files, and files of passes whose delete never
+# committed (or that ran with --keep). Rows of those files still in the table are dropped from the archive, as
+# this run archives them again. Returns the number of rows dropped.
+def recover_archive(engine: Engine, table: Table, directory: str) -> int:
+    if not os.path.isdir(directory):
+        return 0
+    for partition in os.listdir(directory):
+        partition_dir = os.path.join(directory, partition)
+        if os.path.isdir(partition_dir):
+            for name in os.listdir(partition_dir):
+                if name.startswith(".part-") and name.endswith(".partial"):
+                    os.remove(os.path.join(partition_dir, name))
+                    logger.warning(f"Removed incomplete archive file {partition}/{name}")
+
+    dropped = 0
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("_pending-") and name.endswith(".json")):
+            continue
+        journal_path = os.path.join(directory, name)
+        with open(journal_path) as f:
+            files = json.load(f)["files"]
+        for relative in files:
+            path = os.path.join(directory, relative)
+            if not os.path.exists(path):
+                continue
+            data = pq.read_table(path)
+            ids = data.column("id").to_pylist()
+            live = live_ids(engine, table, ids)
+            if not live:
+                continue
+            dropped += len(live)
+            if len(live) == len(ids):
+                os.remove(path)
+            else:
+                kept = data.filter(pc.invert(pc.is_in(data.column("id"), pa.array(sorted(live), pa.int64()))))
+                tmp_path = os.path.join(os.path.dirname(path), f".part-{os.getpid()}.partial")
+                pq.write_table(kept, tmp_path, compression=COMPRESSION)
+                os.replace(tmp_path, path)
+            logger.warning(f"Dropped {len(live)} rows still in {TABLE_NAME} from {relative}")
+        os.remove(journal_path)
+    return dropped
+
+
+# Function to move rows created before `cutoff` from delivery_eta into the archive. Returns a run report.
+def archive_rows(
+    engine: Engine, archive_dir: str = ARCHIVE_DIR, cutoff: Optional[datetime] = None,
+    chunk_rows: int = ARCHIVE_CHUNK_ROWS, fetch_rows: int = ARCHIVE_FETCH_ROWS,
+    delete_batch: int = ARCHIVE_DELETE_BATCH, delete_archived: bool = True
+) -> Dict[str, Any]:
+    if cutoff is None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=ARCHIVE_RETENTION_DAYS)
+    start = time.perf_counter()
+    metadata = MetaData()
+    eta = Table(TABLE_NAME, metadata, autoload_with=engine)
+    outcome = Table("delivery_outcome", metadata, autoload_with=engine)
+    schema = archive_schema(eta)
+    directory = os.path.join(archive_dir, TABLE_NAME)
+
+    report = {"cutoff": cutoff.isoformat(), "rows": 0, "deleted": 0, "passes": 0, "files": 0, "bytes": 0, "partitions": []}
+    report["recovered_rows"] = recover_archive(engine, eta, directory)
+    os.makedirs(directory, exist_ok=True)
+    partitions = set()
+    # Keyset position of the last archived row, so a pass never re-reads rows even when they are kept
+    last: Optional[tuple[datetime, int]] = None
+    while True:
+        query = (
+            select(*eta.c, outcome.c.actual_minutes, outcome.c.id.label("outcome_id"))
+            .join_from(eta, outcome, eta.c.prediction_id == outcome.c.prediction_id, isouter=True)
+            .where(eta.c.created_at < cutoff)
+            .order_by(eta.c.created_at, eta.c.id)
+            .limit(chunk_rows)
+        )
+        if last is not None:
+            query = query.where(tuple_(eta.c.created_at, eta.c.id) > tuple_(*last))
+
+        journal_path = os.path.join(directory, f"_pending-{os.getpid()}-{report['passes']:06d}.json")
+        writer = PartitionWriter(directory, schema, journal_path)
+        ids: list[int] = []
+        try:
+            # stream_results keeps the result set on the server (a named cursor on Postgres); only fetch_rows
+            # rows at a time are held here
+            with engine.connect() as connection:
+                result = connection.execution_options(stream_results=True, yield_per=fetch_rows).execute(query)
+                for rows in result.mappings().partitions():
+                    rows = [dict(row) for row in rows]
+                    writer.write(rows)
+                    ids.extend(row["id"] for row in rows)
+                    last = (rows[-1]["created_at"], rows[-1]["id"])
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        if not ids:
+            break
+
+        report["passes"] += 1
+        report["rows"] += len(ids)
+        report["files"] += len(writer.files)
+        report["bytes"] += writer.bytes
+        partitions.update(os.path.basename(os.path.dirname(path)) for path in writer.files)
+        # Rows leave the table only once every file holding them is complete; with the delete committed the
+        # pass's files are final. Kept rows leave their journal, so the next deleting run replaces those files.
+        if delete_archived:
+            report["deleted"] += delete_rows(engine, eta, ids, delete_batch)
+            os.remove(journal_path)
+        logger.info(f"Archived {len(ids)} rows into {len(writer.files)} file(s)")
+
+    report["partitions"] = sorted(partitions)
+    report["wall_time_s"] = round(time.perf_counter() - start, 2)
+    report["rows_per_s"] = round(report["rows"] / report["wall_time_s"], 1) if report["wall_time_s"] else None
+    logger.info(
+        f"Archive run: {report['rows']} rows older than {cutoff.isoformat()} in {report['files']} file(s), "
+        f"{report['bytes'] / 1e6:.1f} MB, {report['deleted']} deleted, {report['wall_time_s']}s"
+    )
+    return report
+
+
+# Function to open the archive as a pyarrow dataset (partition column "date"), or None when it is empty
+def open_archive(archive_dir: str = ARCHIVE_DIR) -> Optional[ds.Dataset]:
+    directory = os.path.join(archive_dir, TABLE_NAME)
+    if not os.path.isdir(directory):
+        return None
+    # Files still being written are hidden (".part-*.partial") and never scanned
+    dataset = ds.dataset(directory, format="parquet", partitioning=PARTITIONING, ignore_prefixes=[".", "_"])
+    if not dataset.files:
+        return None
+    # Files written before a column was added lack it; scan every file with the union schema so it reads as null
+    schemas = {pq.read_schema(path) for path in dataset.files}
+    if len(schemas) > 1:
+        schema = pa.unify_schemas([*schemas, pa.schema([("date", pa.string())])])
+        dataset = ds.dataset(dataset.files, schema=schema, format="parquet", partitioning=PARTITIONING, partition_base_dir=directory)
+    return dataset
+
+
+# Function to stream archived rows created in [since, until) as record batches. Whole date partitions outside
+# the window are skipped without being opened; `columns` limits what is read from each file.
+def scan_archive(
+    archive_dir: str = ARCHIVE_DIR, columns: Optional[list[str]] = None, since: Optional[datetime] = None,
+    until: Optional[datetime] = None, batch_size: int = 65536, labelled_only: bool = False
+) -> Iterator[pa.RecordBatch]:
+    dataset = open_archive(archive_dir)
+    if dataset is None:
+        return
+    condition = ds.field("actual_minutes").is_valid() if labelled_only else None
+    if since is not None:
+        since = since if since.tzinfo is not None else since.replace(tzinfo=timezone.utc)
+        lower = (ds.field("date") >= partition_date(since)) & (ds.field("created_at") >= pa.scalar(since, pa.timestamp("us", tz="UTC")))
+        condition = lower if condition is None else condition & lower
+    if until is not None:
+        until = until if until.tzinfo is not None else until.replace(tzinfo=timezone.utc)
+        upper = (ds.field("date") <= partition_date(until)) & (ds.field("created_at") < pa.scalar(until, pa.timestamp("us", tz="UTC")))
+        condition = upper if condition is None else condition & upper
+    yield from dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size)
+
+
+# Function to stream archived rows as pandas DataFrames, e.g. labelled rows for outcome_features() in train_model.py
+def iter_frames(
+    archive_dir: str = ARCHIVE_DIR, columns: Optional[list[str]] = None, since: Optional[datetime] = None,
+    until: Optional[datetime] = None, labelled_only: bool = False, batch_size: int = 65536
+) -> Iterator[Any]:
+    for batch in scan_archive(archive_dir, columns, since, until, batch_size, labelled_only):
+        frame = batch.to_pandas()
+        if not frame.empty:
+            yield frame
+
+
+# Function to summarize the archive from Parquet footers only: rows, files and bytes per date partition
+def describe_archive(archive_dir: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    dataset = open_archive(archive_dir)
+    if dataset is None:
+        return {"partitions": {}, "rows": 0, "files": 0, "bytes": 0}
+    partitions: Dict[str, Dict[str, int]] = {}
+    for path in dataset.files:
+        day = os.path.basename(os.path.dirname(path)).split("=", 1)[1]
+        entry = partitions.setdefault(day, {"rows": 0, "files": 0, "bytes": 0})
+        entry["rows"] += pq.ParquetFile(path).metadata.num_rows
+        entry["files"] += 1
+        entry["bytes"] += os.path.getsize(path)
+    return {
+        "partitions": dict(sorted(partitions.items())),
+        "rows": sum(p["rows"] for p in partitions.values()),
+        "files": sum(p["files"] for p in partitions.values()),
+        "bytes": sum(p["bytes"] for p in partitions.values()),
+    }
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Archive old delivery_eta rows to Parquet")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run_parser = subcommands.add_parser("run", help="archive rows older than the retention window, then delete them")
+    run_parser.add_argument("--dir", default=ARCHIVE_DIR)
+    run_parser.add_argument("--retention-days", type=float, default=ARCHIVE_RETENTION_DAYS)
+    run_parser.add_argument("--before", type=date.fromisoformat, help="archive rows created before this date instead")
+    run_parser.add_argument("--chunk-rows", type=int, default=ARCHIVE_CHUNK_ROWS)
+    run_parser.add_argument(
+        "--keep", action="store_true", help="write the files but leave the rows in the table; the next run replaces those files"
+    )
+    subcommands.add_parser("show", help="summarize the archive").add_argument("--dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.before is not None:
+            cutoff = datetime.combine(args.before, datetime.min.time(), tzinfo=timezone.utc)
+        else:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=args.retention_days)
+        report = archive_rows(
+            create_engine(database_url()), args.dir, cutoff, chunk_rows=args.chunk_rows, delete_archived=not args.keep
+        )
+    else:
+        report = describe_archive(args.dir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+from metrics import REGISTRY, Histogram
+
+# Rows scored in one model call at most; a batch this size is scored without waiting
+BATCH_MAX_ROWS = int(os.getenv("INFERENCE_BATCH_MAX_ROWS", "64"))
+# Longest a request waits for others to join its batch. At 0 only requests that reach inference in the same
+# event loop tick are batched; that already gives most of the throughput gain with the lowest added latency
+BATCH_MAX_WAIT_MS = float(os.getenv("INFERENCE_BATCH_MAX_WAIT_MS", "0"))
+
+BATCH_ROWS = REGISTRY.register(Histogram(
+    "eta_inference_batch_rows", "Rows per micro-batched model call", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+))
+BATCH_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "eta_inference_batch_wait_seconds", "Time a request waited for its micro-batch to be scored"
+))
+
+
+# Dynamic micro-batching: predictions requested close together are scored with one preprocessor transform and
+# one model call, and each caller gets its own rows back. The first request of a batch schedules the flush:
+# at the end of the current event loop tick, which already batches requests that became ready together, or,
+# when the previous batch held more than one request and traffic is evidently concurrent, after max_wait_ms
+# so more can join. A lone request is never delayed, and under load the added wait is capped at max_wait_ms.
+# Scoring runs on the event loop, as the unbatched path did; batches are small enough not to need a thread.
+class InferenceBatcher:
+    def __init__(self, max_rows: int = BATCH_MAX_ROWS, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.pending: list[tuple] = []  # (model, columns, n_rows, future, enqueued_at)
+        self.pending_rows = 0
+        self.flush_handle: Optional[asyncio.Handle] = None
+        self.concurrent = False
+        self.stats: Dict[str, Any] = {"requests": 0, "batches": 0, "rows": 0, "max_batch_rows": 0, "windows": 0, "errors": 0}
+
+    # Score columns with model, batched with any concurrent callers. Returns the predictions for these rows
+    # and the compute time of the model call that produced them.
+    async def predict(self, model: Any, columns: Mapping[str, Sequence[Any]]) -> tuple[np.ndarray, float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        n_rows = len(next(iter(columns.values())))
+        self.pending.append((model, columns, n_rows, future, time.perf_counter()))
+        self.pending_rows += n_rows
+        self.stats["requests"] += 1
+
+        if self.pending_rows >= self.max_rows:
+            self.flush()
+        elif self.flush_handle is None:
+            if self.max_wait > 0 and self.concurrent:
+                self.stats["windows"] += 1
+                self.flush_handle = loop.call_later(self.max_wait, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+        return await future
+
+    # Score everything pending; called by the scheduled flush or when a batch fills up
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        jobs, self.pending, self.pending_rows = self.pending, [], 0
+        if not jobs:
+            return
+        self.concurrent = len(jobs) > 1
+
+        # A model reload can land between requests; each version scores its own requests
+        by_model: Dict[int, list[tuple]] = {}
+        for job in jobs:
+            by_model.setdefault(id(job[0]), []).append(job)
+        dispatched = time.perf_counter()
+        for job in jobs:
+            BATCH_WAIT_SECONDS.observe(dispatched - job[4])
+
+        for group in by_model.values():
+            model = group[0][0]
+            if len(group) == 1:
+                columns = group[0][1]
+            else:
+                columns = {name: [value for job in group for value in job[1][name]] for name in group[0][1]}
+            n_rows = sum(job[2] for job in group)
+            start = time.perf_counter()
+            try:
+                predictions = model.predict(columns)
+            except Exception as e:
+                self.stats["errors"] += 1
+                for job in group:
+                    if not job[3].done():
+                        job[3].set_exception(e)
+                continue
+            compute_ms = (time.perf_counter() - start) * 1000
+
+            self.stats["batches"] += 1
+            self.stats["rows"] += n_rows
+            self.stats["max_batch_rows"] = max(self.stats["max_batch_rows"], n_rows)
+            BATCH_ROWS.observe(n_rows)
+            offset = 0
+            for job in group:
+                # A caller cancelled while waiting has no one left to hand results to
+                if not job[3].done():
+                    job[3].set_result((predictions[offset:offset + job[2]], compute_ms))
+                offset += job[2]
+
+    def metrics(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "mean_batch_rows": round(self.stats["rows"] / batches, 2) if batches else None,
+            "pending": len(self.pending),
+            "max_rows": self.max_rows,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Durable key/value cache in a local SQLite file. WAL mode lets every uvicorn worker on the
+# host read and write the same file concurrently, and entries survive restarts. On tmpfs (e.g. /dev/shm)
+# it is a shared-memory store: workers read each other's entries straight from the page cache.
+class PersistentCache:
+    def __init__(self, path: str, namespace: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = f"cache_{namespace}"
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL skips the fsync on every commit; a crash can lose the last few entries, never corrupt the file
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        self.stats["hits" if row else "misses"] += 1
+        return json.loads(row[0]) if row else None
+
+    # Return (value, expires_at) even for an expired entry, so callers can serve it stale while refreshing
+    def get_entry(self, key: str) -> Optional[tuple[Any, float]]:
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        self.stats["hits" if row else "misses"] += 1
+        return (json.loads(row[0]), row[1]) if row else None
+
+    # Store a value; an existing entry keeps the later of its current and new expiry
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self.lock:
+            self.connection.execute(
+                f"INSERT INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?) "
+                f"ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                f"expires_at = MAX({self.table}.expires_at, excluded.expires_at)",
+                (key, json.dumps(value), time.time() + ttl)
+            )
+        self.stats["writes"] += 1
+
+    def purge_expired(self) -> int:
+        with self.lock:
+            cursor = self.connection.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "path": self.path, "namespace": self.table[len("cache_"):]}
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,158 @@
+import logging
+import time
+from typing import Any, Dict, MutableMapping, Optional
+
+from spatial import grid_cell, haversine_km, neighbor_cells
+
+logger = logging.getLogger(__name__)
+
+
+# Directions cache keyed on (origin cell, destination cell) instead of exact coordinates.
+# A lookup tries the exact cell pair, then every neighbouring pair, and corrects the cached
+# route by the haversine difference between the cached and requested endpoints.
+# An optional longer-lived stale mapping keeps expired routes around for stale-while-revalidate.
+# An optional shared store (a PersistentCache every worker on the host reads) is consulted by exact cell pair
+# when the in-process mappings miss, so a route fetched by one worker serves them all.
+class SpatialRouteCache:
+    def __init__(self, routes: MutableMapping, cell_meters: float, stale: Optional[MutableMapping] = None):
+        self.routes = routes
+        self.cell_meters = cell_meters
+        self.stale = stale
+        self.shared: Optional[Any] = None
+        self.stats = {"hits": 0, "neighbor_hits": 0, "shared_hits": 0, "stale_hits": 0, "misses": 0}
+
+    def _key(self, origin_cell: tuple[int, int], dest_cell: tuple[int, int]) -> tuple:
+        return origin_cell + dest_cell
+
+    def key(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> tuple:
+        return self._key(grid_cell(origin_lat, origin_lng, self.cell_meters), grid_cell(dest_lat, dest_lng, self.cell_meters))
+
+    def get(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Optional[Dict[str, Any]]:
+        entry, exact = self._lookup(self.routes, origin_lat, origin_lng, dest_lat, dest_lng)
+        if entry is None:
+            entry, fresh = self._shared_lookup(self.key(origin_lat, origin_lng, dest_lat, dest_lng))
+            if entry is None or not fresh:
+                return None
+            self.stats["shared_hits"] += 1
+        else:
+            self.stats["hits" if exact else "neighbor_hits"] += 1
+        return self.corrected(entry, origin_lat, origin_lng, dest_lat, dest_lng)
+
+    # Look up an expired route; counts as a miss of the fresh cache plus a stale hit
+    def get_stale(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Optional[Dict[str, Any]]:
+        self.stats["misses"] += 1
+        if self.stale is None:
+            return None
+        entry, _ = self._lookup(self.stale, origin_lat, origin_lng, dest_lat, dest_lng)
+        if entry is None:
+            entry, _ = self._shared_lookup(self.key(origin_lat, origin_lng, dest_lat, dest_lng))
+        if entry is None:
+            return None
+        self.stats["stale_hits"] += 1
+        return self.corrected(entry, origin_lat, origin_lng, dest_lat, dest_lng)
+
+    # Return (entry, exact_cell_match) from a mapping, or (None, False)
+    def _lookup(self, routes: MutableMapping, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> tuple[Optional[Dict[str, Any]], bool]:
+        origin_cell = grid_cell(origin_lat, origin_lng, self.cell_meters)
+        dest_cell = grid_cell(dest_lat, dest_lng, self.cell_meters)
+
+        entry = routes.get(self._key(origin_cell, dest_cell))
+        if entry is not None:
+            return entry, True
+
+        # Pick the cached neighbouring route whose endpoints are closest to the requested ones
+        best, best_offset = None, float("inf")
+        for o_cell in neighbor_cells(origin_cell):
+            for d_cell in neighbor_cells(dest_cell):
+                candidate = routes.get(self._key(o_cell, d_cell))
+                if candidate is None:
+                    continue
+                offset = (
+                    haversine_km(origin_lat, origin_lng, candidate["origin"][0], candidate["origin"][1])
+                    + haversine_km(dest_lat, dest_lng, candidate["destination"][0], candidate["destination"][1])
+                )
+                if offset < best_offset:
+                    best, best_offset = candidate, offset
+        return best, False
+
+    # Return (entry, fresh) from the shared store, or (None, False). Entries are kept there for the stale window;
+    # a fresh one is copied into the in-process mappings, an expired one only into the stale mapping.
+    def _shared_lookup(self, key: tuple) -> tuple[Optional[Dict[str, Any]], bool]:
+        if self.shared is None:
+            return None, False
+        try:
+            found = self.shared.get_entry(":".join(map(str, key)))
+        except Exception as e:
+            logger.warning(f"Shared directions cache read failed: {e}")
+            return None, False
+        if found is None:
+            return None, False
+        entry, expires_at = found
+        entry["origin"], entry["destination"] = tuple(entry["origin"]), tuple(entry["destination"])
+        written_at = expires_at - self._shared_ttl()
+        if time.time() < written_at + getattr(self.routes, "ttl", 0):
+            self.routes[key] = entry
+            if self.stale is not None:
+                self.stale[key] = entry
+            return entry, True
+        if self.stale is not None:
+            self.stale[key] = entry
+            return entry, False
+        return None, False
+
+    def _shared_ttl(self) -> float:
+        return getattr(self.stale if self.stale is not None else self.routes, "ttl", 0)
+
+    # Wrap a route for the cache without storing it
+    def entry(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **result,
+            "origin": (origin_lat, origin_lng),
+            "destination": (dest_lat, dest_lng),
+            "straight_km": haversine_km(origin_lat, origin_lng, dest_lat, dest_lng),
+        }
+
+    def put(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float, result: Dict[str, Any]) -> Dict[str, Any]:
+        key = self.key(origin_lat, origin_lng, dest_lat, dest_lng)
+        entry = self.entry(origin_lat, origin_lng, dest_lat, dest_lng, result)
+        self.routes[key] = entry
+        if self.stale is not None:
+            self.stale[key] = entry
+        if self.shared is not None:
+            try:
+                self.shared.set(":".join(map(str, key)), entry, self._shared_ttl())
+            except Exception as e:
+                logger.warning(f"Shared directions cache write failed: {e}")
+        return entry
+
+    # Shift the cached road distance by the change in straight-line distance and keep the cached speed. The cached
+    # polyline is kept while both endpoints are in the cells it was fetched for; a route borrowed from a
+    # neighbouring cell starts or ends on other streets, so it is returned without one (like the haversine fallback).
+    def corrected(self, entry: Dict[str, Any], origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
+        if entry["origin"] == (origin_lat, origin_lng) and entry["destination"] == (dest_lat, dest_lng):
+            route = {"distance_km": entry["distance_km"], "duration_minutes": entry["duration_minutes"], "polyline": entry["polyline"]}
+        else:
+            straight_km = haversine_km(origin_lat, origin_lng, dest_lat, dest_lng)
+            distance_km = max(0.0, entry["distance_km"] + straight_km - entry["straight_km"])
+            if entry["distance_km"] > 0:
+                duration_minutes = entry["duration_minutes"] * distance_km / entry["distance_km"]
+            else:
+                duration_minutes = distance_km * 3
+            same_cells = self.key(*entry["origin"], *entry["destination"]) == self.key(origin_lat, origin_lng, dest_lat, dest_lng)
+            route = {"distance_km": distance_km, "duration_minutes": duration_minutes, "polyline": entry["polyline"] if same_cells else ""}
+        # Where the route came from (Google or an offline fallback), when recorded
+        if "source" in entry:
+            route["source"] = entry["source"]
+        return route
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["neighbor_hits"] + self.stats["shared_hits"] + self.stats["misses"]
+        hits = self.stats["hits"] + self.stats["neighbor_hits"] + self.stats["shared_hits"]
+        hit_rate = hits / lookups if lookups else 0.0
+        return {
+            **self.stats,
+            "hit_rate": round(hit_rate, 4),
+            "size": len(self.routes),
+            "capacity": getattr(self.routes, "maxsize", None),
+            "cell_meters": self.cell_meters,
+        }
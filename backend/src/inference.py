@@ -0,0 +1,290 @@
+import itertools
+import json
+import logging
+import time
+from typing import Any, Mapping, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Lookup table for one categorical input column: category -> encoded row written into a slice of the output
+class CategoricalEncoding:
+    def __init__(self, name: str, categories: Sequence[Any], table: np.ndarray, start: int, unknown_code: int | None):
+        self.name = name
+        self.categories = list(categories)
+        self.index = {category: code for code, category in enumerate(self.categories)}
+        self.table = table
+        self.start = start
+        self.stop = start + table.shape[1]
+        self.unknown_code = unknown_code
+
+    def codes(self, values: Sequence[Any]) -> list[int]:
+        codes = []
+        for value in values:
+            code = self.index.get(value, self.unknown_code)
+            if code is None:
+                raise ValueError(f"Found unknown category {value!r} in column {self.name!r}")
+            codes.append(code)
+        return codes
+
+
+# Function to describe a fitted sklearn ColumnTransformer as a declarative, JSON-serializable spec:
+# one entry per input column in output order, with its encoding and fitted parameters
+def preprocessor_spec(preprocessor: Any) -> dict[str, Any]:
+    feature_names_in = [str(name) for name in preprocessor.feature_names_in_]
+    columns: list[dict[str, Any]] = []
+
+    for name, transformer, selected in preprocessor.transformers_:
+        selected = [feature_names_in[c] if isinstance(c, (int, np.integer)) else c for c in selected]
+        if transformer == "drop" or not selected:
+            continue
+        kind = type(transformer).__name__ if transformer != "passthrough" else "passthrough"
+
+        if kind == "OneHotEncoder":
+            if getattr(transformer, "_infrequent_enabled", False):
+                raise ValueError(f"Transformer {name!r}: infrequent categories are not supported")
+            drop_idx = transformer.drop_idx_
+            for i, column in enumerate(selected):
+                dropped = None if drop_idx is None or drop_idx[i] is None else int(drop_idx[i])
+                columns.append({
+                    "name": column,
+                    "encoding": "onehot",
+                    "categories": transformer.categories_[i].tolist(),
+                    "drop": dropped,
+                    "handle_unknown": "error" if transformer.handle_unknown == "error" else "ignore",
+                })
+        elif kind == "OrdinalEncoder":
+            if transformer.handle_unknown != "error":
+                raise ValueError(f"Transformer {name!r}: only handle_unknown='error' is supported")
+            for i, column in enumerate(selected):
+                columns.append({"name": column, "encoding": "ordinal", "categories": transformer.categories_[i].tolist()})
+        elif kind == "StandardScaler":
+            mean = transformer.mean_ if transformer.with_mean else np.zeros(len(selected))
+            scale = transformer.scale_ if transformer.with_std else np.ones(len(selected))
+            for i, column in enumerate(selected):
+                columns.append({"name": column, "encoding": "standard", "mean": float(mean[i]), "scale": float(scale[i])})
+        elif kind == "passthrough":
+            for column in selected:
+                columns.append({"name": column, "encoding": "passthrough"})
+        else:
+            raise ValueError(f"Transformer {name!r} of type {kind} cannot be compiled")
+
+    return {"format": 1, "feature_names_in": feature_names_in, "columns": columns}
+
+
+# Preprocessor spec compiled into fixed NumPy index tables and scaler arrays
+class CompiledPreprocessor:
+    def __init__(self, spec: Mapping[str, Any]):
+        self.spec = spec
+        self.feature_names_in = list(spec["feature_names_in"])
+        self.categorical: list[CategoricalEncoding] = []
+        numeric_names, numeric_index, means, scales = [], [], [], []
+        offset = 0
+
+        for column in spec["columns"]:
+            name, encoding = column["name"], column["encoding"]
+            if encoding == "onehot":
+                categories = column["categories"]
+                kept = [c for c in range(len(categories)) if c != column.get("drop")]
+                table = np.zeros((len(categories) + 1, len(kept)), dtype=np.float64)
+                for position, code in enumerate(kept):
+                    table[code, position] = 1.0
+                unknown_code = len(categories) if column.get("handle_unknown", "error") != "error" else None
+                self.categorical.append(CategoricalEncoding(name, categories, table, offset, unknown_code))
+                offset += len(kept)
+            elif encoding == "ordinal":
+                categories = column["categories"]
+                table = np.arange(len(categories), dtype=np.float64).reshape(-1, 1)
+                self.categorical.append(CategoricalEncoding(name, categories, table, offset, None))
+                offset += 1
+            elif encoding in ("standard", "passthrough"):
+                numeric_names.append(name)
+                numeric_index.append(offset)
+                means.append(column.get("mean", 0.0))
+                scales.append(column.get("scale", 1.0))
+                offset += 1
+            else:
+                raise ValueError(f"Column {name!r}: unknown encoding {encoding!r}")
+
+        self.n_features = offset
+        self.numeric_names = numeric_names
+        self.numeric_index = np.asarray(numeric_index, dtype=np.intp)
+        self.mean = np.asarray(means, dtype=np.float64)
+        self.scale = np.asarray(scales, dtype=np.float64)
+
+    # Build the float32 feature matrix for column-oriented input (one list per input feature)
+    def transform(self, columns: Mapping[str, Sequence[Any]]) -> np.ndarray:
+        n = len(columns[self.feature_names_in[0]])
+        out = np.empty((n, self.n_features), dtype=np.float32)
+        if n == 1:
+            # Single-row fast path: scalar lookups and slice assignment, no fancy indexing
+            row = out[0]
+            for encoding in self.categorical:
+                row[encoding.start:encoding.stop] = encoding.table[encoding.codes(columns[encoding.name])[0]]
+            numeric = np.array([columns[name][0] for name in self.numeric_names], dtype=np.float64)
+            row[self.numeric_index] = (numeric - self.mean) / self.scale
+            return out
+        for encoding in self.categorical:
+            out[:, encoding.start:encoding.stop] = encoding.table[encoding.codes(columns[encoding.name])]
+        numeric = np.array([columns[name] for name in self.numeric_names], dtype=np.float64).T
+        out[:, self.numeric_index] = (numeric - self.mean) / self.scale
+        return out
+
+
+# XGBoost tree ensemble flattened into node arrays and walked level by level in NumPy.
+# For a handful of rows this avoids the fixed per-call cost of the booster's C API.
+class CompiledForest:
+    IDENTITY_OBJECTIVES = ("reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror")
+
+    def __init__(self, booster: Any):
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in self.IDENTITY_OBJECTIVES:
+            raise ValueError(f"Objective {objective!r} cannot be compiled")
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError(f"Booster {learner['gradient_booster']['name']!r} cannot be compiled")
+        trees = learner["gradient_booster"]["model"]["trees"]
+        if any(any(tree["split_type"]) for tree in trees):
+            raise ValueError("Categorical splits cannot be compiled")
+
+        self.base_score = float(learner["learner_model_param"]["base_score"])
+        sizes = [len(tree["left_children"]) for tree in trees]
+        self.roots = np.cumsum([0] + sizes[:-1]).astype(np.intp)
+        total = sum(sizes)
+        self.feature = np.zeros(total, dtype=np.intp)
+        self.threshold = np.zeros(total, dtype=np.float32)
+        self.left = np.zeros(total, dtype=np.intp)
+        self.right = np.zeros(total, dtype=np.intp)
+        self.default_left = np.zeros(total, dtype=bool)
+        self.leaf_value = np.zeros(total, dtype=np.float32)
+        self.depth = 0
+
+        for root, tree in zip(self.roots, trees):
+            left = np.asarray(tree["left_children"], dtype=np.intp)
+            right = np.asarray(tree["right_children"], dtype=np.intp)
+            is_leaf = left == -1
+            nodes = root + np.arange(len(left))
+            # Leaves point at themselves so extra levels of the walk are no-ops
+            self.left[nodes] = np.where(is_leaf, nodes, root + left)
+            self.right[nodes] = np.where(is_leaf, nodes, root + right)
+            self.feature[nodes] = np.where(is_leaf, 0, tree["split_indices"])
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            self.threshold[nodes] = np.where(is_leaf, np.inf, conditions)
+            self.leaf_value[nodes] = np.where(is_leaf, conditions, 0)
+            self.default_left[nodes] = np.asarray(tree["default_left"], dtype=bool)
+            self.depth = max(self.depth, self._tree_depth(left, right))
+        # Row 0 holds the right child, row 1 the left child, indexed by the split outcome
+        self.children = np.stack([self.right, self.left])
+
+    @staticmethod
+    def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+        depth, level = 0, [0]
+        while True:
+            level = [child for node in level if left[node] != -1 for child in (left[node], right[node])]
+            if not level:
+                return depth
+            depth += 1
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        n_rows, n_features = features.shape
+        flat = features.ravel()
+        node = self.roots if n_rows == 1 else np.tile(self.roots, n_rows)
+        if n_rows > 1:
+            offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, len(self.roots))
+        has_missing = bool(np.isnan(flat).any())
+        for _ in range(self.depth):
+            feature = self.feature[node]
+            values = flat[feature + offsets if n_rows > 1 else feature]
+            go_left = values < self.threshold[node]
+            if has_missing:
+                go_left = np.where(np.isnan(values), self.default_left[node], go_left)
+            node = self.children[go_left.view(np.uint8), node]
+        leaves = self.leaf_value[node].reshape(n_rows, len(self.roots))
+        return leaves.sum(axis=1, dtype=np.float32) + np.float32(self.base_score)
+
+
+# Compiled preprocessor feeding either the flattened forest (small inputs) or the booster's
+# in-place predict (larger batches), bypassing pandas and the sklearn wrapper
+class CompiledModel:
+    # Inputs up to this many rows are scored by the NumPy forest walk; larger batches go to the booster
+    FOREST_MAX_ROWS = 2
+
+    def __init__(self, booster: Any, preprocessor: CompiledPreprocessor):
+        self.preprocessor = preprocessor
+        self.booster = booster
+        if self.booster.num_features() != self.preprocessor.n_features:
+            raise ValueError(
+                f"Booster expects {self.booster.num_features()} features, "
+                f"preprocessor produces {self.preprocessor.n_features}"
+            )
+        self.forest = CompiledForest(self.booster)
+
+    def predict_features(self, features: np.ndarray) -> np.ndarray:
+        if features.shape[0] <= self.FOREST_MAX_ROWS:
+            return self.forest.predict(features)
+        return self.booster.inplace_predict(features)
+
+    def predict(self, columns: Mapping[str, Sequence[Any]]) -> np.ndarray:
+        return self.predict_features(self.preprocessor.transform(columns))
+
+
+# Function to build a parity grid covering every combination of the preprocessor's categories
+def parity_grid(compiled: CompiledModel, seed: int = 0) -> dict[str, list[Any]]:
+    encodings = compiled.preprocessor.categorical
+    combinations = list(itertools.product(*(encoding.categories for encoding in encodings)))
+    rng = np.random.default_rng(seed)
+    columns: dict[str, list[Any]] = {
+        encoding.name: [combination[i] for combination in combinations] for i, encoding in enumerate(encodings)
+    }
+    for name, mean, scale in zip(compiled.preprocessor.numeric_names, compiled.preprocessor.mean, compiled.preprocessor.scale):
+        columns[name] = list(mean + scale * rng.uniform(-2, 2, len(combinations)))
+    return columns
+
+
+# Function to check the NumPy forest walk against the booster itself on the parity grid.
+# Needs no sklearn objects, so it also vets native artifacts before they are served.
+def verify_forest(compiled: CompiledModel, atol: float = 1e-3, max_rows: int = 256) -> float:
+    columns = parity_grid(compiled)
+    step = max(1, len(next(iter(columns.values()))) // max_rows)
+    features = compiled.preprocessor.transform({name: values[::step] for name, values in columns.items()})
+    max_error = float(np.max(np.abs(compiled.forest.predict(features) - compiled.booster.inplace_predict(features))))
+    if max_error > atol:
+        raise ValueError(f"Compiled forest differs from the booster by {max_error:.6f}")
+    return max_error
+
+
+# Function to check the compiled path against the sklearn/XGBoost reference on the parity grid
+def verify_parity(compiled: CompiledModel, model: Any, preprocessor: Any, atol: float = 1e-3) -> float:
+    import pandas as pd
+
+    columns = parity_grid(compiled)
+    frame = pd.DataFrame(columns)[compiled.preprocessor.feature_names_in]
+    expected_features = preprocessor.transform(frame)
+    if hasattr(expected_features, "toarray"):
+        expected_features = expected_features.toarray()
+    actual_features = compiled.preprocessor.transform(columns)
+    if not np.allclose(actual_features, expected_features, atol=atol):
+        raise ValueError("Compiled feature matrix does not match the sklearn preprocessor")
+
+    expected = model.predict(expected_features)
+    max_error = max(
+        float(np.max(np.abs(compiled.booster.inplace_predict(actual_features) - expected))),
+        float(np.max(np.abs(compiled.forest.predict(actual_features) - expected)))
+    )
+    if max_error > atol:
+        raise ValueError(f"Compiled predictions differ from the reference model by {max_error:.6f}")
+    return max_error
+
+
+# Function to compile the fitted model and preprocessor, verifying parity before it is used
+def compile_model(model: Any, preprocessor: Any) -> CompiledModel:
+    start = time.perf_counter()
+    compiled = CompiledModel(model.get_booster(), CompiledPreprocessor(preprocessor_spec(preprocessor)))
+    max_error = verify_parity(compiled, model, preprocessor)
+    logger.info(
+        f"Compiled inference path ready: {compiled.preprocessor.n_features} features, "
+        f"max parity error {max_error:.2e}, compiled in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return compiled
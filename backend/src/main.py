@@ -1,38 +1,65 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from math import radians, sin, cos, sqrt, asin
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
-import googlemaps # pyright: ignore[reportMissingImports]
-from geopy.geocoders import Nominatim
-from cachetools import TTLCache
-import requests
+from typing import Optional, Dict, Any, Union
+import asyncio
+import json
+from contextlib import asynccontextmanager
 import os
+import signal
+import sys
+import time
+import uuid
 import numpy as np
-import pandas as pd
-import joblib
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean
+from sqlalchemy import create_engine, select, Column, Integer, Float, String, DateTime, Boolean, Index, UniqueConstraint
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.sql import func
 
 load_dotenv()
 
+# Sibling modules are importable whether the app runs as `uvicorn src.main:app` or `python src/main.py`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from upstream import create_http_client, GoogleMapsClient, NominatimClient, OpenWeatherClient, UpstreamError  # noqa: E402
+from model_store import DEFAULT_MODEL_DIR, VEHICLE_CONDITION_LABELS, LoadedModel, ModelRegistry, load_model, manifest_mtime, read_manifest  # noqa: E402
+from shadow import ShadowScorer  # noqa: E402
+from batcher import InferenceBatcher  # noqa: E402
+from readiness import Readiness, READY, DISABLED  # noqa: E402
+from metrics import REGISTRY, Collected, Counter, InstrumentedTTLCache, RequestTimingMiddleware, process_memory, stage_timer, timed_stage  # noqa: E402
+from persistence import WriteBehindQueue, upgrade_schema  # noqa: E402
+from analytics import INTERVALS, ROLLUP_DIMENSIONS, ROLLUP_SOURCE_COLUMNS, HourlyRollup, cell_key, cell_summary, time_window  # noqa: E402
+from cache_store import PersistentCache  # noqa: E402
+from address import normalize_address  # noqa: E402
+from spatial import haversine_km, haversine_matrix, grid_cell, cell_center, cells_in_bbox  # noqa: E402
+from directions_cache import SpatialRouteCache  # noqa: E402
+from result_cache import ETAResultCache  # noqa: E402
+from tracking import LiveTracker, TrackedDelivery  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+from quota import BACKGROUND, PRIORITY_NAMES, BudgetExhausted, UpstreamScheduler, in_background, upstream_priority  # noqa: E402
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Hedge, within_deadline  # noqa: E402
+from routing import RoutingEngine  # noqa: E402
+
 # Database Configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable is not set")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The engine is created and the schema checked in the background on startup (see lifespan), so importing
+# this module never touches the database and a missing DATABASE_URL only keeps the service from being ready
+engine: Optional[Engine] = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
 def get_db():
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Database is not ready")
     db = SessionLocal()
     try:
         yield db
@@ -60,12 +87,83 @@ class DeliveryETA(Base):
     traffic_density = Column(String)
     is_festival = Column(Boolean)
     confidence = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # Returned to the client so the actual delivery time can be reported back for retraining
+    prediction_id = Column(String(32), unique=True, index=True, nullable=True)
+    # Analytics grid cell of the delivery address (see ANALYTICS_CELL_METERS)
+    delivery_cell = Column(String(32), nullable=True)
+
+    __table_args__ = (Index("ix_delivery_eta_cell_created_at", "delivery_cell", "created_at"),)
+
+# Hourly delivery_eta aggregates by vehicle type, traffic density and weather, kept up to date by the
+# write-behind queue; analytics read these instead of scanning delivery_eta
+class DeliveryETAHourly(Base):
+    __tablename__ = "delivery_eta_hourly"
+
+    id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    vehicle_type = Column(String(16), nullable=False)
+    traffic_density = Column(String(16), nullable=False)
+    weather_condition = Column(String(16), nullable=False)
+    orders = Column(Integer, nullable=False)
+    sum_predicted_eta = Column(Float, nullable=False)
+    sum_google_eta = Column(Float, nullable=False)
+    sum_abs_difference = Column(Float, nullable=False)
+    sum_distance_km = Column(Float, nullable=False)
+    sum_confidence = Column(Float, nullable=False)
+
+    __table_args__ = (UniqueConstraint("bucket_start", *ROLLUP_DIMENSIONS, name="uq_delivery_eta_hourly_group"),)
+
+# Actual delivery times reported after the fact, joined to delivery_eta on prediction_id.
+# No foreign key: the prediction row may still be in the write-behind queue when the outcome arrives.
+class DeliveryOutcome(Base):
+    __tablename__ = "delivery_outcome"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prediction_id = Column(String(32), unique=True, index=True, nullable=False)
+    actual_minutes = Column(Float, nullable=False)
+    delivered_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Predictions from the shadow model, joined to delivery_eta (and delivery_outcome) on prediction_id
+class DeliveryETAShadow(Base):
+    __tablename__ = "delivery_eta_shadow"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prediction_id = Column(String(32), index=True, nullable=False)
+    model_version = Column(String(64), index=True, nullable=False)
+    predicted_eta = Column(Float)
+    latency_ms = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Grid cell size for delivery_eta.delivery_cell
+ANALYTICS_CELL_METERS = float(os.getenv("ANALYTICS_CELL_METERS", "1000"))
+eta_rollup = HourlyRollup(DeliveryETAHourly.__table__)
+
+# Prediction records are bulk-written in the background instead of on the request path;
+# the queues buffer until the database is bound during warm-up
+write_behind = WriteBehindQueue(None, DeliveryETA.__table__, on_write=eta_rollup.apply)
+shadow_write_behind = WriteBehindQueue(None, DeliveryETAShadow.__table__)
     
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="DeliveryETA", version="1.0.0")
+# Per-component startup state served by /ready
+readiness = Readiness()
+
+# Startup does no network or database I/O before serving: see start_services / stop_services below
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_services()
+    try:
+        yield
+    finally:
+        await stop_services()
+
+app = FastAPI(title="DeliveryETA", version="1.0.0", lifespan=lifespan)
+
+# Per-endpoint latency histograms, plus per-stage timings in a Server-Timing header when enabled
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+app.add_middleware(RequestTimingMiddleware, server_timing=SERVER_TIMING)
 
 app.add_middleware(
     CORSMiddleware,
@@ -78,36 +176,112 @@ app.add_middleware(
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
-if not GOOGLE_MAPS_API_KEY:
-    logger.warning("GOOGLE_MAPS_API_KEY not set")
-    gmaps = None
+# Async upstream clients sharing one pooled HTTP client; created on startup
+http_client = None
+gmaps: Optional[GoogleMapsClient] = None
+geolocator: Optional[NominatimClient] = None
+weather_client: Optional[OpenWeatherClient] = None
+# Per-provider call budgets (see quota.py); pre-forked workers each get an equal share
+upstream_budgets = UpstreamScheduler()
+# Per-provider circuit breakers: a provider that keeps failing is skipped until a trial call succeeds
+circuit_breakers = {name: CircuitBreaker(name) for name in ("google", "nominatim", "openweather")}
+# Upstream calls that were not sent or not answered in time; callers take their fallback without logging an error
+UPSTREAM_UNAVAILABLE = (BudgetExhausted, CircuitOpen, DeadlineExceeded)
 
-else:
-    try:
-        gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-        gmaps.geocode("Delhi, India")
-        logger.info("Google maps api initialized successfully")
-    except Exception as e:
-        logger.warning(f"Google maps api initialization failed:{e}")
-        gmaps = None
+# Cache for geocoding, directions, and weather data
+geocode_cache = InstrumentedTTLCache(maxsize=1000, ttl=3600)  # In-process L1 cache for 1 hour
+# Directions are cached per (origin cell, destination cell) pair; capacity is counted in routes
+DIRECTIONS_CACHE_ROUTES = int(os.getenv("DIRECTIONS_CACHE_ROUTES", "10000"))
+DIRECTIONS_CELL_METERS = float(os.getenv("DIRECTIONS_CELL_METERS", "150"))
+directions_cache = InstrumentedTTLCache(maxsize=DIRECTIONS_CACHE_ROUTES, ttl=3600)
+# Expired routes stay servable this long while a background refresh runs
+DIRECTIONS_STALE_SECONDS = float(os.getenv("DIRECTIONS_STALE_SECONDS", str(24 * 3600)))
+stale_directions_cache = InstrumentedTTLCache(maxsize=DIRECTIONS_CACHE_ROUTES, ttl=DIRECTIONS_STALE_SECONDS)
+route_cache = SpatialRouteCache(directions_cache, DIRECTIONS_CELL_METERS, stale=stale_directions_cache)
+# Weather is keyed by coarse spatial tile plus time bucket and fetched at the tile centre
+WEATHER_TILE_METERS = float(os.getenv("WEATHER_TILE_METERS", "5000"))
+WEATHER_BUCKET_SECONDS = int(os.getenv("WEATHER_BUCKET_SECONDS", "900"))
+weather_cache = InstrumentedTTLCache(maxsize=1000, ttl=2 * WEATHER_BUCKET_SECONDS)
+# Whole responses for repeat trips, keyed on a quantized trip signature (see result_cache.py); 0 disables it.
+# The signature includes the weather time bucket, so an entry never outlives WEATHER_BUCKET_SECONDS in practice.
+result_cache = ETAResultCache(
+    maxsize=int(os.getenv("ETA_RESULT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ETA_RESULT_CACHE_TTL_SECONDS", str(WEATHER_BUCKET_SECONDS))),
+    cell_meters=float(os.getenv("ETA_RESULT_CACHE_CELL_METERS", str(DIRECTIONS_CELL_METERS))),
+    age_step=int(os.getenv("ETA_RESULT_CACHE_AGE_STEP", "1")),
+    rating_step=float(os.getenv("ETA_RESULT_CACHE_RATING_STEP", "0.1")),
+)
 
-geolocator = Nominatim(user_agent="delivery_eta")
+# Optional service area "min_lat,min_lng,max_lat,max_lng" whose weather tiles are kept warm in the background
+SERVICE_AREA = os.getenv("SERVICE_AREA")
+WEATHER_REFRESH_SECONDS = float(os.getenv("WEATHER_REFRESH_SECONDS", "300"))
+WEATHER_MAX_TILES = int(os.getenv("WEATHER_MAX_TILES", "400"))
+weather_refresher: Optional[asyncio.Task] = None
 
-# Cache for geocoding, directions, and weather data
-geocode_cache = TTLCache(maxsize=1000, ttl=3600)  # Cache for 1 hour
-directions_cache = TTLCache(maxsize=1000, ttl=3600)
-weather_cache = TTLCache(maxsize=1000, ttl=3600)
+# Live ETA streaming for in-flight deliveries (see tracking.py). Tracked deliveries keep their endpoints and
+# inputs in memory, are re-checked every LIVE_REFRESH_SECONDS and rescored only when route, traffic or weather
+# changed (or on a rider position update); new ETAs are pushed to subscribed server-sent event streams.
+LIVE_REFRESH_SECONDS = float(os.getenv("LIVE_REFRESH_SECONDS", "30"))
+LIVE_MAX_DELIVERIES = int(os.getenv("LIVE_MAX_DELIVERIES", "10000"))
+# Deliveries without a position update or new ETA for this long stop being tracked
+LIVE_IDLE_SECONDS = float(os.getenv("LIVE_IDLE_SECONDS", str(3 * 3600)))
+# Streams are closed after this long and the client reconnects (EventSource does so automatically), which
+# also bounds how long a graceful shutdown waits for open streams
+LIVE_STREAM_MAX_SECONDS = float(os.getenv("LIVE_STREAM_MAX_SECONDS", "300"))
+# A comment line is sent on idle streams so proxies keep them open
+LIVE_KEEPALIVE_SECONDS = 15
+live_tracker = LiveTracker(LIVE_MAX_DELIVERIES, LIVE_IDLE_SECONDS)
+live_refresher: Optional[asyncio.Task] = None
+
+# Offline road-network router from an OSM extract, used when Google Directions is unavailable.
+# The contraction hierarchy is built (or loaded from its cache file) in the background on startup.
+ROUTING_GRAPH_PATH = os.getenv("ROUTING_GRAPH_PATH")
+routing_engine: Optional[RoutingEngine] = None
 
+# Concurrent misses on the same key share one upstream call; stale entries are served while refreshing
+geocode_flight = SingleFlight("geocode")
+directions_flight = SingleFlight("directions")
+weather_flight = SingleFlight("weather")
+# Nominatim is asked too when Google has not geocoded an address within this many milliseconds
+GEOCODE_HEDGE_MS = float(os.getenv("GEOCODE_HEDGE_MS", "400"))
+geocode_hedge = Hedge("geocode", GEOCODE_HEDGE_MS / 1000)
 
-# Load the ML model and preprocessor
-try:
-    model = joblib.load("models/xgb_model.pkl")
-    preprocessor = joblib.load("models/preprocessor.pkl")
-    logger.info("Model and preprocessor loaded successfully")
-except Exception as e:
-    logger.warning(f"ML model/Preprocessor not found:{e}")
-    model = None
-    preprocessor = None
+# Durable L2 geocode store shared by all workers on the host and kept across restarts.
+# Restaurants almost never move, so their entries live far longer than delivery addresses.
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "cache/geocode.sqlite3")
+GEOCODE_TTL_SECONDS = float(os.getenv("GEOCODE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESTAURANT_GEOCODE_TTL_SECONDS = float(os.getenv("RESTAURANT_GEOCODE_TTL_SECONDS", str(180 * 24 * 3600)))
+# Opened during warm-up; until then lookups use the in-process cache only
+geocode_store: Optional[PersistentCache] = None
+# Optional SQLite file (ideally on tmpfs, e.g. /dev/shm/eta-cache.sqlite3) behind the directions and weather
+# caches, so every worker on the host reads the routes and weather any of them fetched. The in-process caches
+# stay in front of it; prefork.py enables it by default.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH")
+directions_store: Optional[PersistentCache] = None
+weather_store: Optional[PersistentCache] = None
+# Set in workers forked by prefork.py, which rolls model reloads across all of them
+PREFORK_SUPERVISOR_PID = os.getenv("PREFORK_SUPERVISOR_PID")
+
+
+# Native model artifacts (booster + preprocessor spec + manifest); see model_store.py
+MODEL_DIR = os.getenv("MODEL_DIR", DEFAULT_MODEL_DIR)
+# How often the manifest is checked for a new version; 0 disables the watcher
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "10"))
+# Candidate model scored in the shadow of live traffic, when a manifest is present here
+SHADOW_MODEL_DIR = os.getenv("SHADOW_MODEL_DIR", os.path.join(MODEL_DIR, "shadow"))
+# Token required by /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# The active model version, loaded during warm-up. Requests read registry.active once per prediction, so a
+# reload swaps it with a single assignment and in-flight requests finish on the version they started with.
+registry = ModelRegistry()
+shadow_scorer = ShadowScorer(shadow_write_behind)
+# Concurrent single-order predictions are scored together in micro-batches
+inference_batcher = InferenceBatcher()
+model_reload_lock = asyncio.Lock()
+model_watcher: Optional[asyncio.Task] = None
+# Predicted orders by path: the model, the heuristic when no model is loaded, or the fallback after a model error
+PREDICTIONS = REGISTRY.register(Counter("eta_predictions_total", "Predicted orders by prediction path", ("path",)))
 
 
 # Pydantic models for request and response
@@ -130,12 +304,76 @@ class ETAResponse(BaseModel):
     is_festival: bool
     recommendations: Optional[list[str]] = None
     confidence: float
+    # Inputs filled in from a fallback rather than the live provider: directions and traffic (offline routing),
+    # weather (defaults); confidence is lowered for each
+    degraded_inputs: list[str] = []
     route_polyline: str
     restaurant_lat: float
     restaurant_lng: float
     delivery_lat: float
     delivery_lng: float
+    prediction_id: Optional[str] = None
+
+class ETABatchRequest(BaseModel):
+    items: list[ETARequest]
+
+class ETABatchItem(BaseModel):
+    index: int
+    status_code: int = 200
+    result: Optional[ETAResponse] = None
+    error: Optional[str] = None
 
+class ETABatchResponse(BaseModel):
+    results: list[ETABatchItem]
+    succeeded: int
+    failed: int
+
+class DeliveryOutcomeRequest(BaseModel):
+    prediction_id: str
+    actual_minutes: float
+    delivered_at: Optional[str] = None
+
+class RiderPositionRequest(BaseModel):
+    lat: float
+    lng: float
+
+# A candidate pickup (restaurant or rider position) with the rider who would make the delivery
+class ETAMatrixOrigin(BaseModel):
+    address: str
+    delivery_person_age: int
+    delivery_person_rating: float
+    vehicle_type: str
+    vehicle_condition: int
+    multiple_deliveries: int
+    order_time: Optional[str] = None
+
+class ETAMatrixRequest(BaseModel):
+    origins: list[ETAMatrixOrigin]
+    destinations: list[str]
+
+# Row i, column j holds origin i -> destination j; null cells failed geocoding or exceed the hyperlocal limit
+class ETAMatrixResponse(BaseModel):
+    origin_coordinates: list[Optional[list[float]]]
+    destination_coordinates: list[Optional[list[float]]]
+    predicted_eta: list[list[Optional[float]]]
+    google_eta: list[list[Optional[float]]]
+    distance_km: list[list[Optional[float]]]
+    confidence: list[list[Optional[float]]]
+    is_festival: bool
+    # Inputs that came from a fallback for at least one cell; those cells' confidence is lowered
+    degraded_inputs: list[str] = []
+    origin_errors: Dict[int, str] = {}
+    destination_errors: Dict[int, str] = {}
+
+
+# Maximum number of orders accepted by /predict-eta/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+# Maximum number of origin x destination cells accepted by /predict-eta/matrix
+MAX_MATRIX_CELLS = int(os.getenv("MAX_MATRIX_CELLS", "2500"))
+# Origins and destinations per Distance Matrix request (10 x 10 stays within Google's 100-element cap)
+DISTANCE_MATRIX_BLOCK = 10
+# Longest route served, in road kilometres
+HYPERLOCAL_LIMIT_KM = 20
 
 # Festival dates
 FESTIVAL_DATES = {
@@ -159,69 +397,149 @@ FESTIVAL_DATES = {
   "2025-12-25": "Christmas"
 }
 
+# Function to read a geocode from the L1 cache, then the shared persistent store.
+# Returns (location, fresh); an expired store entry comes back with fresh=False.
+def get_cached_geocode(cache_key: str) -> Optional[tuple[tuple[float, float], bool]]:
+    location = geocode_cache.lookup(cache_key)
+    if location is not None:
+        return location, True
+    if geocode_store is not None:
+        try:
+            entry = geocode_store.get_entry(cache_key)
+        except Exception as e:
+            logger.warning(f"Persistent geocode cache read failed: {e}")
+            entry = None
+        if entry:
+            (lat, lng), expires_at = entry
+            if expires_at > time.time():
+                geocode_cache[cache_key] = (lat, lng)
+                return (lat, lng), True
+            return (lat, lng), False
+    return None
+
+# Function to store a geocode in both cache tiers
+def cache_geocode(cache_key: str, location: tuple[float, float], ttl: float) -> None:
+    geocode_cache[cache_key] = location
+    if geocode_store is not None:
+        try:
+            geocode_store.set(cache_key, list(location), ttl)
+        except Exception as e:
+            logger.warning(f"Persistent geocode cache write failed: {e}")
+
 # geocode_address function to get latitude and longitude from addres
-def geocode_address(address: str) -> tuple[float, float]:
+@timed_stage("geocode")
+async def geocode_address(address: str, ttl: float = GEOCODE_TTL_SECONDS) -> tuple[float, float]:
     if not address or len(address.strip()) < 5:
         logger.error(f"Invalid address: {address}")
         raise HTTPException(status_code=400, detail=f"Invalid address: {address}")
     
-    cache_key = address.lower()
-    if cache_key in geocode_cache:
-        return geocode_cache[cache_key]
-    
-    if gmaps:
-        try:
-            result = gmaps.geocode(address)
-            if not result:
-                raise ValueError("No geocoding results")
-            location = result[0]["geometry"]["location"]
-            lat, lng = location["lat"], location["lng"]
-            if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (abs(lat) < 0.01 and abs(lng) < 0.01):
-                raise ValueError(f"Invalid coordinates: ({lat}, {lng})")
-            geocode_cache[cache_key] = (lat, lng)
-            logger.info(f"Geocoded {address} to ({lat}, {lng})")
-            return lat, lng
-        except Exception as e:
-            logger.warning(f"Google Maps geocoding failed for {address}: {e}")
-    
+    cache_key = normalize_address(address)
+    cached = get_cached_geocode(cache_key)
+    if cached is not None:
+        location, fresh = cached
+        if not fresh:
+            geocode_flight.refresh(cache_key, in_background(lambda: geocode_upstream(address, cache_key, ttl)))
+        return location
     try:
-        location = geolocator.geocode(address, timeout=5) # type: ignore
-        if not location:
-            raise ValueError(f"Geopy returned no results for {address}")
-        lat, lng = location.latitude, location.longitude # type: ignore
-        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (abs(lat) < 0.01 and abs(lng) < 0.01):
-            raise ValueError(f"Invalid coordinates: ({lat}, {lng})")
-        geocode_cache[cache_key] = (lat, lng)
-        logger.info(f"Geopy geocoded {address} to ({lat}, {lng})")
-        return lat, lng
+        return await geocode_flight.do(cache_key, lambda: geocode_upstream(address, cache_key, ttl))
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail=f"Geocoding timed out: {address}")
+
+# Function to geocode with Google Maps, hedged with Nominatim when Google is slow or failing, and cache the result
+async def geocode_upstream(address: str, cache_key: str, ttl: float) -> tuple[float, float]:
+    try:
+        if gmaps:
+            lat, lng = await geocode_hedge.run(lambda: geocode_google(address), lambda: geocode_nominatim(address))
+        else:
+            lat, lng = await geocode_nominatim(address)
+    except (BudgetExhausted, CircuitOpen):
+        # Nothing cached and no provider to ask right now: ask the client to retry rather than fail the address
+        raise HTTPException(
+            status_code=503, detail=f"Geocoding is unavailable, retry shortly: {address}", headers={"Retry-After": "1"}
+        )
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail=f"Geocoding timed out: {address}")
     except Exception as e:
         logger.error(f"Geopy geocoding failed for {address}: {e}")
         raise HTTPException(status_code=400, detail=f"Failed to geocode address: {address}")
+    cache_geocode(cache_key, (lat, lng), ttl)
+    return lat, lng
+
+# Function to geocode one address with Google Maps
+async def geocode_google(address: str) -> tuple[float, float]:
+    try:
+        result = await gmaps.geocode(address)  # type: ignore
+        if not result:
+            raise ValueError("No geocoding results")
+        location = result[0]["geometry"]["location"]
+        lat, lng = location["lat"], location["lng"]
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (abs(lat) < 0.01 and abs(lng) < 0.01):
+            raise ValueError(f"Invalid coordinates: ({lat}, {lng})")
+    except UPSTREAM_UNAVAILABLE:
+        raise
+    except Exception as e:
+        logger.warning(f"Google Maps geocoding failed for {address}: {e}")
+        raise
+    logger.info(f"Geocoded {address} to ({lat}, {lng})")
+    return lat, lng
+
+# Function to geocode one address with Nominatim
+async def geocode_nominatim(address: str) -> tuple[float, float]:
+    location = await geolocator.geocode(address, timeout=5) # type: ignore
+    if not location:
+        raise ValueError(f"Geopy returned no results for {address}")
+    lat, lng = location
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (abs(lat) < 0.01 and abs(lng) < 0.01):
+        raise ValueError(f"Invalid coordinates: ({lat}, {lng})")
+    logger.info(f"Geopy geocoded {address} to ({lat}, {lng})")
+    return lat, lng
 
 # Function to calculate distance using Haversine formula
 def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-    dlng = lng2 - lng1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Earth's radius in km
-    return c * r
+    return haversine_km(lat1, lng1, lat2, lng2)
 
 # Function to get Google Directions with caching
-def get_google_directions(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
-    cache_key = f"{origin_lat},{origin_lng}:{dest_lat},{dest_lng}"
-    if cache_key in directions_cache:
-        return directions_cache[cache_key]
-    
+@timed_stage("directions")
+async def get_google_directions(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
+    cached = route_cache.get(origin_lat, origin_lng, dest_lat, dest_lng)
+    if cached is not None:
+        return cached
+
+    key = route_cache.key(origin_lat, origin_lng, dest_lat, dest_lng)
+    load = lambda: fetch_directions(origin_lat, origin_lng, dest_lat, dest_lng)  # noqa: E731
+    stale = route_cache.get_stale(origin_lat, origin_lng, dest_lat, dest_lng)
+    if stale is not None:
+        directions_flight.refresh(key, in_background(load))
+        return stale
+    # Callers joining another request's fetch get its route corrected to their own endpoints, or route offline
+    # if it does not finish before their deadline
+    try:
+        entry = await directions_flight.do(key, load)
+    except DeadlineExceeded:
+        return offline_directions(origin_lat, origin_lng, dest_lat, dest_lng)
+    return route_cache.corrected(entry, origin_lat, origin_lng, dest_lat, dest_lng)
+
+# Function to route without Google: the offline road network if loaded, else haversine. The source says
+# which; neither knows about live traffic.
+def offline_directions(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
+    if routing_engine is not None:
+        try:
+            result = routing_engine.route(origin_lat, origin_lng, dest_lat, dest_lng)
+            if result is not None:
+                return {**result, "source": "road_network"}
+        except Exception as e:
+            logger.warning(f"Offline routing failed: {e}")
+    distance = calculate_distance(origin_lat, origin_lng, dest_lat, dest_lng)
+    return {"distance_km": distance, "duration_minutes": distance * 3, "polyline": "", "source": "haversine"}
+
+# Function to fetch directions from Google, falling back to offline routing, and cache the route
+async def fetch_directions(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Dict[str, Any]:
     if not gmaps:
-        distance = calculate_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        result = {"distance_km": distance, "duration_minutes": distance * 3, "polyline": ""}
-        directions_cache[cache_key] = result
-        return result
+        result = offline_directions(origin_lat, origin_lng, dest_lat, dest_lng)
+        return route_cache.put(origin_lat, origin_lng, dest_lat, dest_lng, result)
     
     try:
-        directions = gmaps.directions(
+        directions = await gmaps.directions(
             origin=(origin_lat, origin_lng),
             destination=(dest_lat, dest_lng),
             mode="driving",
@@ -234,37 +552,153 @@ def get_google_directions(origin_lat: float, origin_lng: float, dest_lat: float,
         result = {
             "distance_km": route["distance"]["value"] / 1000,
             "duration_minutes": route["duration_in_traffic"]["value"] / 60,
-            "polyline": directions[0]["overview_polyline"]["points"]
+            "polyline": directions[0]["overview_polyline"]["points"],
+            "source": "google"
         }
-        directions_cache[cache_key] = result
         logger.info(f"Directions retrieved: {result['distance_km']} km, {result['duration_minutes']} min")
-        return result
+        return route_cache.put(origin_lat, origin_lng, dest_lat, dest_lng, result)
+    except UPSTREAM_UNAVAILABLE:
+        # Route offline for this request only; the next miss asks Google again
+        result = offline_directions(origin_lat, origin_lng, dest_lat, dest_lng)
+        return route_cache.entry(origin_lat, origin_lng, dest_lat, dest_lng, result)
     except Exception as e:
         logger.warning(f"Google Directions API failed: {e}")
-        distance = calculate_distance(origin_lat, origin_lng, dest_lat, dest_lng)
-        result = {"distance_km": distance, "duration_minutes": distance * 3, "polyline": ""}
-        directions_cache[cache_key] = result
-        return result
+        result = offline_directions(origin_lat, origin_lng, dest_lat, dest_lng)
+        return route_cache.put(origin_lat, origin_lng, dest_lat, dest_lng, result)
+
+# Function to route many origin/destination pairs: cached routes first, then batched Distance Matrix
+# requests, then offline routing for whatever Google could not answer
+@timed_stage("route_matrix")
+async def get_route_matrix(
+    origins: list[tuple[float, float]], destinations: list[tuple[float, float]], pairs: list[tuple[int, int]]
+) -> Dict[tuple[int, int], Dict[str, Any]]:
+    routes: Dict[tuple[int, int], Dict[str, Any]] = {}
+    blocks: Dict[tuple[int, int], list[tuple[int, int]]] = {}
+    for i, j in pairs:
+        cached = route_cache.get(*origins[i], *destinations[j])
+        if cached is not None:
+            routes[(i, j)] = cached
+        else:
+            blocks.setdefault((i // DISTANCE_MATRIX_BLOCK, j // DISTANCE_MATRIX_BLOCK), []).append((i, j))
+
+    if gmaps and blocks:
+        block_results = await asyncio.gather(
+            *(fetch_distance_matrix(origins, destinations, block) for block in blocks.values())
+        )
+        for result in block_results:
+            routes.update(result)
+    for block in blocks.values():
+        for i, j in block:
+            if (i, j) not in routes:
+                routes[(i, j)] = offline_directions(*origins[i], *destinations[j])
+    return routes
+
+# Function to fetch one block of pairs with a single Distance Matrix call; failed elements are left out.
+# Matrix routes carry no polyline, so they are not written to the route cache used by /predict-eta.
+async def fetch_distance_matrix(
+    origins: list[tuple[float, float]], destinations: list[tuple[float, float]], pairs: list[tuple[int, int]]
+) -> Dict[tuple[int, int], Dict[str, Any]]:
+    origin_index = sorted({i for i, _ in pairs})
+    dest_index = sorted({j for _, j in pairs})
+    try:
+        rows = await gmaps.distance_matrix(
+            [origins[i] for i in origin_index],
+            [destinations[j] for j in dest_index],
+            mode="driving",
+            departure_time="now",
+            traffic_model="best_guess"
+        )
+    except UPSTREAM_UNAVAILABLE:
+        return {}
+    except Exception as e:
+        logger.warning(f"Google Distance Matrix API failed: {e}")
+        return {}
+
+    row_of = {i: r for r, i in enumerate(origin_index)}
+    column_of = {j: c for c, j in enumerate(dest_index)}
+    results = {}
+    for i, j in pairs:
+        try:
+            element = rows[row_of[i]]["elements"][column_of[j]]
+            if element.get("status") != "OK":
+                continue
+            duration = element.get("duration_in_traffic", element["duration"])
+            results[(i, j)] = {
+                "distance_km": element["distance"]["value"] / 1000,
+                "duration_minutes": duration["value"] / 60,
+                "polyline": "",
+                "source": "google"
+            }
+        except (IndexError, KeyError) as e:
+            logger.warning(f"Malformed Distance Matrix element: {e}")
+    logger.info(f"Distance Matrix retrieved {len(results)}/{len(pairs)} route(s)")
+    return results
+
+# Function to build the weather cache key: spatial tile plus time bucket
+def weather_key(lat: float, lng: float, at: Optional[float] = None) -> tuple[int, int, int]:
+    tile = grid_cell(lat, lng, WEATHER_TILE_METERS)
+    bucket = int((time.time() if at is None else at) // WEATHER_BUCKET_SECONDS)
+    return tile[0], tile[1], bucket
 
 # Function to get weather data with caching
-def get_weather_data(lat: float, lng: float) -> Dict[str, Any]:
-    cache_key = f"{lat},{lng}"
-    if cache_key in weather_cache:
-        return weather_cache[cache_key]
-    
-    if not OPENWEATHER_API_KEY:
+@timed_stage("weather")
+async def get_weather_data(lat: float, lng: float) -> Dict[str, Any]:
+    cache_key = weather_key(lat, lng)
+    weather = weather_cache.lookup(cache_key)
+    if weather is None:
+        weather = get_shared_weather(cache_key)
+    if weather is not None:
+        return weather
+
+    # The same tile's previous bucket is served stale while the current bucket is fetched
+    previous = weather_cache.get((cache_key[0], cache_key[1], cache_key[2] - 1))
+    if previous is not None:
+        weather_flight.refresh(cache_key, in_background(lambda: load_weather_tile(cache_key)))
+        return previous
+    try:
+        return await weather_flight.do(cache_key, lambda: load_weather_tile(cache_key))
+    except DeadlineExceeded:
+        return dict(DEFAULT_WEATHER)
+
+# Function to read a tile's weather from the store shared by all workers, keeping it in the in-process cache
+def get_shared_weather(cache_key: tuple[int, int, int]) -> Optional[Dict[str, Any]]:
+    if weather_store is None:
+        return None
+    try:
+        weather = weather_store.get(":".join(map(str, cache_key)))
+    except Exception as e:
+        logger.warning(f"Shared weather cache read failed: {e}")
+        return None
+    if weather is not None:
+        weather_cache[cache_key] = weather
+    return weather
+
+# Function to fetch and cache the weather for one tile and time bucket. When OpenWeather could not be asked
+# in time, the defaults are served uncached, so the tile is fetched again on the next request.
+async def load_weather_tile(cache_key: tuple[int, int, int]) -> Dict[str, Any]:
+    try:
+        result = await fetch_weather(*cell_center(cache_key[:2], WEATHER_TILE_METERS))
+    except UPSTREAM_UNAVAILABLE:
+        return dict(DEFAULT_WEATHER)
+    weather_cache[cache_key] = result
+    if weather_store is not None:
+        try:
+            weather_store.set(":".join(map(str, cache_key)), result, weather_cache.ttl)
+        except Exception as e:
+            logger.warning(f"Shared weather cache write failed: {e}")
+    return result
+
+# Weather assumed when OpenWeather is not configured or does not answer
+DEFAULT_WEATHER = {"condition": "sunny", "temperature": 25, "humidity": 60, "wind_speed": 5, "source": "default"}
+
+# Function to fetch current weather from OpenWeatherMap, with defaults on failure
+async def fetch_weather(lat: float, lng: float) -> Dict[str, Any]:
+    if not weather_client:
         logger.warning("OPENWEATHER_API_KEY not set")
-        result = {"condition": "sunny", "temperature": 25, "humidity": 60, "wind_speed": 5}
-        weather_cache[cache_key] = result
-        return result
-    
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {"lat": lat, "lon": lng, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+        return dict(DEFAULT_WEATHER)
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = await weather_client.current(lat, lng, timeout=10)
         condition = data["weather"][0]["main"].lower()
         condition_map = {
             "clear": "sunny",
@@ -281,16 +715,53 @@ def get_weather_data(lat: float, lng: float) -> Dict[str, Any]:
             "condition": condition_map.get(condition, "sunny"),
             "temperature": data["main"]["temp"],
             "humidity": data["main"]["humidity"],
-            "wind_speed": data["wind"].get("speed", 0)
+            "wind_speed": data["wind"].get("speed", 0),
+            "source": "openweather"
         }
-        weather_cache[cache_key] = result
         logger.info(f"Weather retrieved: {result['condition']}, {result['temperature']}°C")
         return result
+    except UPSTREAM_UNAVAILABLE:
+        raise
     except Exception as e:
         logger.warning(f"OpenWeatherMap API error: {e}")
-        result = {"condition": "sunny", "temperature": 25, "humidity": 60, "wind_speed": 5}
-        weather_cache[cache_key] = result
-        return result
+        return dict(DEFAULT_WEATHER)
+
+# Function to list the weather tiles covering the configured service area
+def service_area_tiles() -> list[tuple[int, int]]:
+    if not SERVICE_AREA:
+        return []
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in SERVICE_AREA.split(","))
+    except ValueError:
+        logger.warning(f"Invalid SERVICE_AREA: {SERVICE_AREA}")
+        return []
+    tiles = cells_in_bbox(min_lat, min_lng, max_lat, max_lng, WEATHER_TILE_METERS)
+    if len(tiles) > WEATHER_MAX_TILES:
+        logger.warning(f"Service area spans {len(tiles)} weather tiles; refreshing the first {WEATHER_MAX_TILES}")
+        tiles = tiles[:WEATHER_MAX_TILES]
+    return tiles
+
+# Background task keeping service-area tiles warm for the current and the upcoming time bucket,
+# so requests inside the service area never wait on OpenWeather
+async def refresh_weather_tiles(tiles: list[tuple[int, int]]) -> None:
+    upstream_priority.set(BACKGROUND)
+    while True:
+        try:
+            now = time.time()
+            buckets = {int(now // WEATHER_BUCKET_SECONDS), int((now + WEATHER_REFRESH_SECONDS) // WEATHER_BUCKET_SECONDS)}
+            # Tiles another worker already refreshed are taken from the shared store
+            missing = [
+                (*tile, bucket) for bucket in sorted(buckets) for tile in tiles
+                if (*tile, bucket) not in weather_cache and get_shared_weather((*tile, bucket)) is None
+            ]
+            await asyncio.gather(
+                *(weather_flight.do(key, lambda key=key: load_weather_tile(key)) for key in missing), return_exceptions=True
+            )
+            if missing:
+                logger.info(f"Weather refresher warmed {len(missing)} tile bucket(s)")
+        except Exception as e:
+            logger.error(f"Weather refresher error: {e}")
+        await asyncio.sleep(WEATHER_REFRESH_SECONDS)
 
 # Function to calculate traffic density based on Google duration and expected speed
 def calculate_traffic_density(distance_km: float, google_duration: float) -> str:
@@ -315,65 +786,507 @@ def is_festival_day() -> bool:
     return today in FESTIVAL_DATES
 
 
+# Function to parse the optional ISO-8601 order time sent by clients
+def parse_order_time(order_time: Optional[str]) -> Optional[datetime]:
+    if not order_time:
+        return None
+    try:
+        return datetime.fromisoformat(order_time.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning(f"Invalid order_time format: {order_time}")
+        return None
+
+
+# Function to estimate ETA heuristically when the ML model is unavailable
+def fallback_eta(
+    request: ETARequest, weather: Dict[str, Any], traffic_density: str, distance_km: float, is_festival: bool
+) -> float:
+    base_time = distance_km * 3
+    weather_factor = 1.3 if weather["condition"] in ["stormy", "fog"] else 1.0
+    traffic_factor = {"low": 1.0, "medium": 1.2, "high": 1.4, "jam": 1.6}[traffic_density]
+    festival_factor = 1.3 if is_festival else 1.0
+    vehicle_factor = {"bicycle": 1.3, "scooter": 1.1, "bike": 1.0}[request.vehicle_type.lower()]
+    condition_factor = 1.0 + (3 - request.vehicle_condition) * 0.1
+    age_factor = 1.0 + max(0, (request.delivery_person_age - 30)) * 0.01
+    rating_factor = 1.0 - (request.delivery_person_rating - 3) * 0.05
+    return base_time * weather_factor * traffic_factor * festival_factor * vehicle_factor * condition_factor * age_factor * rating_factor
+
+
+# Function to build the model input columns for a batch of orders
+def build_feature_columns(
+    requests_: list[ETARequest], weathers: list[Dict[str, Any]], traffic_densities: list[str],
+    distances: list[float], is_festival: bool
+) -> Dict[str, list]:
+    # Extract temporal features, defaulting to noon on a Wednesday
+    hours_of_day, days_of_week = [], []
+    for request in requests_:
+        dt = parse_order_time(request.order_time)
+        hours_of_day.append(dt.hour if dt else 12)
+        days_of_week.append(dt.weekday() if dt else 2)
+
+    n = len(requests_)
+    return {
+        "Delivery_person_Age": [r.delivery_person_age for r in requests_],
+        "Delivery_person_Ratings": [r.delivery_person_rating for r in requests_],
+        "Weather_conditions": [w["condition"] for w in weathers],
+        "Road_traffic_density": traffic_densities,
+        "Vehicle_condition": [VEHICLE_CONDITION_LABELS[r.vehicle_condition] for r in requests_],
+        "Type_of_vehicle": [r.vehicle_type.lower() for r in requests_],
+        "multiple_deliveries": [r.multiple_deliveries for r in requests_],
+        "Festival": ["yes" if is_festival else "no"] * n,
+        "City_area": ["metropolitan"] * n,
+        "distance_km": distances,
+        "hour_of_day": hours_of_day,
+        "day_of_week": days_of_week
+    }
+
+
+# Function to predict ETAs for many orders with a single model call, shared with concurrent requests
+@timed_stage("inference")
+async def predict_eta_ml_batch(
+    requests_: list[ETARequest], weathers: list[Dict[str, Any]], traffic_densities: list[str], distances: list[float],
+    prediction_ids: Optional[list[str]] = None
+) -> list[tuple[float, float]]:
+    if not requests_:
+        return []
+    is_festival = is_festival_day()
+    current_model = registry.active
+    columns, active_ms = None, None
+
+    if current_model is None:
+        results = []
+        for request, weather, traffic_density, distance_km in zip(requests_, weathers, traffic_densities, distances):
+            predicted_eta = fallback_eta(request, weather, traffic_density, distance_km, is_festival)
+            results.append((max(1, min(predicted_eta, 60)), 0.6))
+        PREDICTIONS.inc(len(results), path="fallback")
+        logger.info(f"Fallback ETA computed for {len(results)} order(s)")
+    else:
+        try:
+            columns = build_feature_columns(requests_, weathers, traffic_densities, distances, is_festival)
+            predictions, active_ms = await inference_batcher.predict(current_model, columns)
+        except Exception as e:
+            logger.error(f"ML prediction error: {e}")
+            logger.info(f"Fallback ETA (after ML error) computed for {len(requests_)} order(s)")
+            results = [(max(1, min(distance_km * 3, 60)), 0.6) for distance_km in distances]
+            PREDICTIONS.inc(len(results), path="ml_error_fallback")
+        else:
+            results = []
+            for prediction, distance_km in zip(predictions, distances):
+                prediction = float(prediction)
+                confidence = 0.9 if abs(prediction - distance_km * 3) < 5 else 0.7
+                results.append((max(1, min(prediction, 60)), confidence))  # Min 1 min, max 60 min
+            PREDICTIONS.inc(len(results), path="ml")
+            logger.info(f"ML Predicted ETA for {len(results)} order(s)")
+
+    # Hand the same inputs to the shadow model; this only enqueues, scoring happens in the background
+    shadow_model = registry.shadow
+    if shadow_model is not None and prediction_ids is not None:
+        if columns is None:
+            columns = build_feature_columns(requests_, weathers, traffic_densities, distances, is_festival)
+        shadow_scorer.submit(shadow_model, columns, prediction_ids, [eta for eta, _ in results], active_ms)
+    return results
+
+
 # Function to predict ETA using ML model
-def predict_eta_ml(
+async def predict_eta_ml(
     request: ETARequest, weather: Dict[str, Any], traffic_density: str, distance_km: float,
-    restaurant_lat: float, restaurant_lng: float, delivery_lat: float, delivery_lng: float
+    restaurant_lat: float, restaurant_lng: float, delivery_lat: float, delivery_lng: float,
+    prediction_id: Optional[str] = None
 ) -> tuple[float, float]:
-    if model is None or preprocessor is None:
-        base_time = distance_km * 3
-        weather_factor = 1.3 if weather["condition"] in ["stormy", "fog"] else 1.0
-        traffic_factor = {"low": 1.0, "medium": 1.2, "high": 1.4, "jam": 1.6}[traffic_density]
-        festival_factor = 1.3 if is_festival_day() else 1.0
-        vehicle_factor = {"bicycle": 1.3, "scooter": 1.1, "bike": 1.0}[request.vehicle_type.lower()]
-        condition_factor = 1.0 + (3 - request.vehicle_condition) * 0.1
-        age_factor = 1.0 + max(0, (request.delivery_person_age - 30)) * 0.01
-        rating_factor = 1.0 - (request.delivery_person_rating - 3) * 0.05
-        predicted_eta = base_time * weather_factor * traffic_factor * festival_factor * vehicle_factor * condition_factor * age_factor * rating_factor
-        logger.info(f"Fallback ETA: {predicted_eta:.1f} minutes")
-        return max(1, min(predicted_eta, 60)), 0.6  
-    
-    # Extract temporal features
-    hour_of_day = 12  
-    day_of_week = 2  
-    if request.order_time:
+    prediction_ids = [prediction_id] if prediction_id is not None else None
+    return (await predict_eta_ml_batch([request], [weather], [traffic_density], [distance_km], prediction_ids))[0]
+
+
+# Function to validate request fields and geocoded coordinates
+def validate_eta_inputs(
+    request: ETARequest, restaurant_lat: float, restaurant_lng: float, delivery_lat: float, delivery_lng: float
+) -> None:
+    if not (-90 <= restaurant_lat <= 90 and -180 <= restaurant_lng <= 180):
+        raise HTTPException(status_code=400, detail="Invalid pickup coordinates")
+    if not (-90 <= delivery_lat <= 90 and -180 <= delivery_lng <= 180):
+        raise HTTPException(status_code=400, detail="Invalid delivery coordinates")
+    validate_rider_inputs(request)
+
+
+# Function to validate the rider and vehicle fields shared by single, batch and matrix requests
+def validate_rider_inputs(request: Union[ETARequest, ETAMatrixOrigin]) -> None:
+    if request.vehicle_condition not in [0, 1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Vehicle condition must be 0-3")
+    if request.vehicle_type.lower() not in ["bicycle", "scooter", "bike"]:
+        raise HTTPException(status_code=400, detail="Invalid vehicle type")
+    if request.multiple_deliveries < 0:
+        raise HTTPException(status_code=400, detail="Multiple deliveries must be non-negative")
+
+
+# Sources that mean an input came from a fallback, and how much confidence each degraded input costs
+FALLBACK_SOURCES = {"road_network", "haversine", "default"}
+DEGRADED_CONFIDENCE_PENALTY = {"directions": 0.1, "traffic": 0.1, "weather": 0.05}
+DEGRADED_INPUTS = REGISTRY.register(Counter(
+    "eta_degraded_inputs_total", "ETA responses built with an input from a fallback, by input", ("input",)
+))
+
+# Function to list the inputs of a prediction that came from a fallback. Offline routes carry no live traffic,
+# so the traffic density derived from them is degraded too. Entries cached before sources were recorded count
+# as live.
+def degraded_inputs(directions: Dict[str, Any], weather: Dict[str, Any]) -> list[str]:
+    degraded = []
+    if directions.get("source") in FALLBACK_SOURCES:
+        degraded += ["directions", "traffic"]
+    if weather.get("source") in FALLBACK_SOURCES:
+        degraded.append("weather")
+    return degraded
+
+# Function to adjust model confidence against the Google duration, then lower it for each degraded input
+def adjust_confidence(confidence: float, predicted_eta: float, directions: Dict[str, Any], weather: Dict[str, Any]) -> float:
+    eta_diff = abs(predicted_eta - directions["duration_minutes"])
+    if directions["duration_minutes"] > 0:
+        confidence = max(0.6, min(0.95, confidence - (eta_diff / (directions["distance_km"] * 6))))
+    else:
+        confidence = 0.6  # fallback when distance is zero
+    penalty = sum(DEGRADED_CONFIDENCE_PENALTY[name] for name in degraded_inputs(directions, weather))
+    return max(0.1, confidence - penalty)
+
+
+# Function to prepare recommendations based on weather and traffic
+def build_recommendations(weather: Dict[str, Any], traffic_density: str) -> list[str]:
+    recommendations = []
+    if weather["condition"] in ["stormy", "fog"]:
+        recommendations.append("Consider delaying delivery due to adverse weather conditions.")
+    if traffic_density in ["high", "jam"]:
+        recommendations.append("Expect delays due to heavy traffic; consider alternative routes.")
+    return recommendations
+
+
+# Function to build the delivery_eta row for a prediction
+def build_db_record(
+    request: ETARequest, predicted_eta: float, confidence: float, directions: Dict[str, Any],
+    weather: Dict[str, Any], traffic_density: str, is_festival: bool, prediction_id: str,
+    delivery_lat: float, delivery_lng: float
+) -> Dict[str, Any]:
+    return dict(
+        restaurant_address=request.restaurant_address,
+        delivery_address=request.delivery_address,
+        delivery_person_age=request.delivery_person_age,
+        delivery_person_rating=request.delivery_person_rating,
+        vehicle_type=request.vehicle_type.lower(),
+        vehicle_condition=request.vehicle_condition,
+        multiple_deliveries=request.multiple_deliveries,
+        order_time=parse_order_time(request.order_time),
+        predicted_eta=predicted_eta,
+        google_eta=directions["duration_minutes"],
+        distance_km=directions["distance_km"],
+        weather_condition=weather["condition"],
+        weather_temperature=weather["temperature"],
+        traffic_density=traffic_density,
+        is_festival=is_festival,
+        confidence=confidence,
+        # Stamped at request time; the row itself is written later by the write-behind queue
+        created_at=datetime.now(timezone.utc),
+        prediction_id=prediction_id,
+        delivery_cell=cell_key(delivery_lat, delivery_lng, ANALYTICS_CELL_METERS)
+    )
+
+
+# Function to build the API response for a prediction
+def build_eta_response(
+    predicted_eta: float, confidence: float, directions: Dict[str, Any], weather: Dict[str, Any],
+    traffic_density: str, is_festival: bool, restaurant_lat: float, restaurant_lng: float,
+    delivery_lat: float, delivery_lng: float, prediction_id: Optional[str] = None
+) -> ETAResponse:
+    recommendations = build_recommendations(weather, traffic_density)
+    degraded = degraded_inputs(directions, weather)
+    for name in degraded:
+        DEGRADED_INPUTS.inc(input=name)
+    return ETAResponse(
+        predicted_eta=predicted_eta,
+        google_eta=directions["duration_minutes"],
+        distance_km=round(directions["distance_km"], 2),
+        weather={"condition": weather["condition"], "temperature": weather["temperature"]},
+        traffic_density=traffic_density,
+        is_festival=is_festival,
+        confidence=round(confidence, 2),
+        degraded_inputs=degraded,
+        route_polyline=directions["polyline"],
+        restaurant_lat=restaurant_lat,
+        restaurant_lng=restaurant_lng,
+        delivery_lat=delivery_lat,
+        delivery_lng=delivery_lng,
+        recommendations=recommendations if recommendations else None,
+        prediction_id=prediction_id
+    )
+
+# Function to build a trip's result-cache signature from the request, its geocoded endpoints and the live
+# context: the weather tile and time bucket at the midpoint, and whether today is a festival
+def trip_signature(
+    request: ETARequest, restaurant_lat: float, restaurant_lng: float, delivery_lat: float, delivery_lng: float
+) -> tuple:
+    dt = parse_order_time(request.order_time)
+    context = weather_key((restaurant_lat + delivery_lat) / 2, (restaurant_lng + delivery_lng) / 2), is_festival_day()
+    return result_cache.signature(
+        (restaurant_lat, restaurant_lng), (delivery_lat, delivery_lng), request.vehicle_type, request.vehicle_condition,
+        request.multiple_deliveries, request.delivery_person_age, request.delivery_person_rating,
+        dt.hour if dt else 12, dt.weekday() if dt else 2, context
+    )
+
+# Function to fingerprint the inputs a live ETA depends on; a tracked delivery is rescored only when it changes
+def live_inputs(
+    origin: tuple[float, float], weather_condition: str, traffic_density: str, distance_km: float, duration_minutes: float
+) -> tuple:
+    return origin, weather_condition, traffic_density, round(distance_km, 2), round(duration_minutes, 1)
+
+# Function to look up a tracked delivery's current route and weather; both come from the caches unless expired
+async def fetch_live_context(delivery: TrackedDelivery) -> tuple[Dict[str, Any], Dict[str, Any]]:
+    (origin_lat, origin_lng), (dest_lat, dest_lng) = delivery.origin, delivery.destination
+    return await asyncio.gather(
+        get_google_directions(origin_lat, origin_lng, dest_lat, dest_lng),
+        get_weather_data((origin_lat + dest_lat) / 2, (origin_lng + dest_lng) / 2)
+    )
+
+# Function to re-check tracked deliveries and rescore, in one model call, only those whose inputs changed;
+# each new ETA is pushed to the delivery's subscribers
+async def refresh_live_deliveries(deliveries: list[TrackedDelivery]) -> None:
+    if not deliveries:
+        return
+    live_tracker.stats["refreshes"] += 1
+    contexts = await asyncio.gather(*(fetch_live_context(d) for d in deliveries), return_exceptions=True)
+
+    changed = []
+    for delivery, context in zip(deliveries, contexts):
+        if isinstance(context, BaseException):
+            live_tracker.stats["failed"] += 1
+            logger.warning(f"Live refresh failed for delivery {delivery.delivery_id}: {context}")
+            continue
+        directions, weather = context
+        traffic_density = calculate_traffic_density(directions["distance_km"], directions["duration_minutes"])
+        inputs = live_inputs(
+            delivery.origin, weather["condition"], traffic_density, directions["distance_km"], directions["duration_minutes"]
+        )
+        if inputs == delivery.inputs:
+            live_tracker.stats["unchanged"] += 1
+            continue
+        changed.append((delivery, directions, weather, traffic_density, inputs))
+    if not changed:
+        return
+
+    predictions = await predict_eta_ml_batch(
+        [delivery.request for delivery, *_ in changed],
+        [weather for _, _, weather, _, _ in changed],
+        [traffic_density for *_, traffic_density, _ in changed],
+        [directions["distance_km"] for _, directions, *_ in changed]
+    )
+    is_festival = is_festival_day()
+    for (delivery, directions, weather, traffic_density, inputs), (predicted_eta, confidence) in zip(changed, predictions):
+        # The delivery may have ended while its route was being looked up
+        if live_tracker.get(delivery.delivery_id) is not delivery:
+            continue
+        confidence = adjust_confidence(confidence, predicted_eta, directions, weather)
+        response = build_eta_response(
+            predicted_eta, confidence, directions, weather, traffic_density, is_festival,
+            *delivery.restaurant, *delivery.destination, delivery.delivery_id
+        )
+        live_tracker.update(delivery, live_payload(delivery, response), inputs)
+
+# Function to build the event pushed for a tracked delivery: the ETA response plus where the route starts now
+def live_payload(delivery: TrackedDelivery, response: ETAResponse) -> Dict[str, Any]:
+    return {
+        "delivery_id": delivery.delivery_id,
+        **response.model_dump(mode="json"),
+        "origin_lat": delivery.origin[0],
+        "origin_lng": delivery.origin[1],
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+# Periodically drop idle deliveries and pick up traffic and weather changes for the rest
+async def refresh_live_loop() -> None:
+    upstream_priority.set(BACKGROUND)
+    while True:
+        await asyncio.sleep(LIVE_REFRESH_SECONDS)
         try:
-            dt = datetime.fromisoformat(request.order_time.replace("Z", "+00:00"))
-            hour_of_day = dt.hour
-            day_of_week = dt.weekday()
-        except ValueError:
-            logger.warning(f"Invalid order_time format: {request.order_time}")
-    
+            live_tracker.expire()
+            await refresh_live_deliveries(list(live_tracker.deliveries.values()))
+        except Exception as e:
+            logger.error(f"Live refresh error: {e}")
+
+# Function to create the engine and tables in a worker thread, then bind sessions and the record writers
+async def init_database() -> None:
+    global engine
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL environment variable is not set")
+
+    def connect() -> Engine:
+        db_engine = create_engine(DATABASE_URL)
+        # Workers starting together race to create the schema; the losers see "already exists" and retry,
+        # by which time the tables and indexes are there and are skipped
+        for attempt in range(3):
+            try:
+                Base.metadata.create_all(bind=db_engine)
+                upgrade_schema(db_engine, [DeliveryETA.__table__])
+                break
+            except (OperationalError, ProgrammingError):
+                if attempt == 2:
+                    raise
+                time.sleep(0.5)
+        return db_engine
+
+    engine = await asyncio.to_thread(connect)
+    SessionLocal.configure(bind=engine)
+    write_behind.bind(engine)
+    shadow_write_behind.bind(engine)
+
+# Function to open the durable geocode store; lookups fall back to the in-process cache if it is unavailable
+async def open_geocode_store() -> None:
+    global geocode_store
+    geocode_store = await asyncio.to_thread(PersistentCache, GEOCODE_CACHE_PATH, "geocode")
+
+# Function to open the directions and weather stores shared by the workers on this host
+async def open_shared_caches() -> Optional[str]:
+    global directions_store, weather_store
+    if not SHARED_CACHE_PATH:
+        return DISABLED
+    directions_store = await asyncio.to_thread(PersistentCache, SHARED_CACHE_PATH, "directions")
+    weather_store = await asyncio.to_thread(PersistentCache, SHARED_CACHE_PATH, "weather")
+    route_cache.shared = directions_store
+
+# Function to check the Google Maps key off the startup path. A rejected key disables the client so requests
+# go straight to the fallbacks; a slow or unreachable API keeps it, since each call already falls back.
+async def probe_google_maps() -> Optional[str]:
+    global gmaps
+    if gmaps is None:
+        logger.warning("GOOGLE_MAPS_API_KEY not set")
+        return DISABLED
     try:
-        input_data = pd.DataFrame({
-            "Delivery_person_Age": [request.delivery_person_age],
-            "Delivery_person_Ratings": [request.delivery_person_rating],
-            "Weather_conditions": [weather["condition"]],
-            "Road_traffic_density": [traffic_density],
-            "Vehicle_condition": [request.vehicle_condition],
-            "Type_of_vehicle": [request.vehicle_type.lower()],
-            "multiple_deliveries": [request.multiple_deliveries],
-            "Festival": ["yes" if is_festival_day() else "no"],
-            "City_area": ["metropolitan"],
-            "distance_km": [distance_km],
-            "hour_of_day": [hour_of_day],
-            "day_of_week": [day_of_week]
-        })
-        input_prepared = preprocessor.transform(input_data)
-        prediction = model.predict(input_prepared)[0]
-        confidence = 0.9 if abs(prediction - distance_km * 3) < 5 else 0.7
-        logger.info(f"ML Predicted ETA: {prediction:.1f} minutes")
-        return max(1, min(prediction, 60)), confidence  # Min 1 min, max 60 min
-    except Exception as e:
-        logger.error(f"ML prediction error: {e}")
-        base_time = distance_km * 3
-        logger.info(f"Fallback ETA (after ML error): {base_time:.1f} minutes")
-        return max(1, min(base_time, 60)), 0.6
+        await gmaps.geocode("Delhi, India")
+    except UpstreamError:
+        gmaps = None
+        raise
+    logger.info("Google maps api initialized successfully")
+
+# Load the offline routing graph in a worker thread so startup is not blocked
+async def load_routing_engine() -> Optional[str]:
+    global routing_engine
+    if not ROUTING_GRAPH_PATH:
+        return DISABLED
+    if routing_engine is not None:
+        return None
+    routing_engine = await asyncio.to_thread(RoutingEngine.from_osm, ROUTING_GRAPH_PATH)
+    logger.info(f"Offline routing ready: {routing_engine.n_nodes} nodes, {routing_engine.n_edges} edges")
 
-# Initialize database tables on startup
-@app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
+# Function to load the candidate model when a shadow manifest is present
+async def load_shadow_model() -> Optional[str]:
+    manifest = read_manifest(SHADOW_MODEL_DIR)
+    if manifest is None:
+        return DISABLED
+    if registry.shadow is not None and registry.shadow.version == manifest["version"]:
+        return None
+    registry.shadow = await asyncio.to_thread(load_model, SHADOW_MODEL_DIR)
+
+# Function to load the manifest's model version in a worker thread and swap it in; the old version keeps
+# serving if loading fails. Returns the active model and whether it changed.
+async def reload_model(force: bool = False) -> tuple[Optional[LoadedModel], bool]:
+    async with model_reload_lock:
+        manifest = read_manifest(MODEL_DIR)
+        if manifest is None:
+            raise FileNotFoundError(f"No model manifest in {MODEL_DIR} (export one with `python src/model_store.py export`)")
+        current = registry.active
+        if not force and current is not None and manifest["version"] == current.version:
+            return current, False
+        loaded = await asyncio.to_thread(load_model, MODEL_DIR)
+        registry.active = loaded
+        # Cached responses were predicted by the previous version (or the heuristic)
+        result_cache.invalidate()
+        live_tracker.invalidate()
+        logger.info(f"Model swapped: {current.version if current is not None else None} -> {loaded.version}")
+        readiness.mark("model", READY)
+        return loaded, True
+
+async def load_active_model() -> None:
+    await reload_model()
+
+# Function to load the model versions and the offline routing graph synchronously, before the app serves.
+# The pre-fork supervisor (prefork.py) calls it before forking so all workers share one copy of each; their
+# warm-ups then find them loaded. The database, stores and HTTP client are still opened per worker.
+def preload_shared_state() -> None:
+    global routing_engine
+    if read_manifest(MODEL_DIR) is not None:
+        registry.active = load_model(MODEL_DIR)
+    if read_manifest(SHADOW_MODEL_DIR) is not None:
+        registry.shadow = load_model(SHADOW_MODEL_DIR)
+    if ROUTING_GRAPH_PATH:
+        routing_engine = RoutingEngine.from_osm(ROUTING_GRAPH_PATH)
+
+# Watch the manifest and hot-reload when a new version is exported
+async def watch_model_manifest() -> None:
+    last_seen = manifest_mtime(MODEL_DIR)
+    while True:
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+        mtime = manifest_mtime(MODEL_DIR)
+        if mtime is None or mtime == last_seen:
+            continue
+        last_seen = mtime
+        try:
+            await reload_model()
+        except Exception as e:
+            logger.error(f"Model reload failed, keeping current version: {e}")
+
+# Components warmed up in the background on startup, and whether the service waits for them to be ready.
+# Until the model is loaded, predictions use the heuristic fallback; until the database is bound, records queue.
+WARM_UPS = {
+    "database": (init_database, True),
+    "model": (load_active_model, True),
+    "shadow_model": (load_shadow_model, False),
+    "geocode_store": (open_geocode_store, False),
+    "shared_caches": (open_shared_caches, False),
+    "google_maps": (probe_google_maps, False),
+    "offline_routing": (load_routing_engine, False),
+}
+
+# Startup: create clients and start background workers without any I/O, then warm up everything else in tasks
+# so the server accepts connections immediately and /ready reports when it can take traffic
+async def start_services() -> None:
+    global http_client, gmaps, geolocator, weather_client, weather_refresher, model_watcher, live_refresher
+    http_client = create_http_client()
+    geolocator = NominatimClient(http_client, budget=upstream_budgets["nominatim"], breaker=circuit_breakers["nominatim"])
+    weather_client = (
+        OpenWeatherClient(
+            http_client, OPENWEATHER_API_KEY, budget=upstream_budgets["openweather"], breaker=circuit_breakers["openweather"]
+        )
+        if OPENWEATHER_API_KEY else None
+    )
+    gmaps = (
+        GoogleMapsClient(http_client, GOOGLE_MAPS_API_KEY, budget=upstream_budgets["google"], breaker=circuit_breakers["google"])
+        if GOOGLE_MAPS_API_KEY else None
+    )
+
+    write_behind.start()
+    shadow_write_behind.start()
+    shadow_scorer.start()
+
+    for name, (_, required) in WARM_UPS.items():
+        readiness.register(name, required)
+    app.state.warm_ups = [asyncio.create_task(readiness.warm(name, warm_up)) for name, (warm_up, _) in WARM_UPS.items()]
+
+    if MODEL_WATCH_SECONDS > 0:
+        model_watcher = asyncio.create_task(watch_model_manifest())
+    # Keep service-area weather tiles warm in the background
+    tiles = service_area_tiles()
+    if tiles:
+        weather_refresher = asyncio.create_task(refresh_weather_tiles(tiles))
+        logger.info(f"Weather refresher started for {len(tiles)} tile(s)")
+    if LIVE_REFRESH_SECONDS > 0:
+        live_refresher = asyncio.create_task(refresh_live_loop())
+
+# Shutdown: stop background tasks, flush queued records, then close upstream connections
+async def stop_services() -> None:
+    for task in [*app.state.warm_ups, model_watcher, weather_refresher, live_refresher]:
+        if task is not None:
+            task.cancel()
+    await write_behind.stop()
+    await shadow_scorer.stop()
+    await shadow_write_behind.stop()
+    if http_client is not None:
+        await http_client.aclose()
+    if engine is not None:
+        engine.dispose()
 
 # FastAPI routes
 @app.get("/")
@@ -386,113 +1299,738 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
-        "preprocessor_loaded": preprocessor is not None,
+        "model_loaded": registry.active is not None,
+        "preprocessor_loaded": registry.active is not None,
+        "model_version": registry.active.version if registry.active is not None else None,
+        "models": registry.info(),
+        "shadow_scoring": shadow_scorer.metrics() if registry.shadow is not None else None,
+        "inference_batching": inference_batcher.metrics(),
+        "persistence": write_behind.metrics(),
+        "analytics_rollup": eta_rollup.stats,
+        "directions_cache": route_cache.metrics(),
+        "live_tracking": live_tracker.metrics(),
+        "result_cache": result_cache.metrics(),
+        "shared_caches": {
+            name: store.metrics() for name, store in
+            (("geocode", geocode_store), ("directions", directions_store), ("weather", weather_store)) if store is not None
+        },
+        "offline_routing": routing_engine is not None,
+        "upstream_budgets": upstream_budgets.metrics(),
+        "circuit_breakers": {name: breaker.metrics() for name, breaker in circuit_breakers.items()},
+        "hedging": {"geocode": geocode_hedge.metrics()},
+        "single_flight": {
+            "geocode": geocode_flight.metrics(),
+            "directions": directions_flight.metrics(),
+            "weather": weather_flight.metrics(),
+        },
+        "process": {"pid": os.getpid(), "supervisor_pid": PREFORK_SUPERVISOR_PID, "memory": process_memory()},
+        "ready": readiness.ready,
         "timestamp": datetime.now().isoformat()
     }
 
+# Readiness endpoint for the load balancer: 503 until the database and model are ready, with every
+# component's warm-up state. /health stays a liveness check that answers as soon as the server is up.
+@app.get("/ready")
+async def ready_check():
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.report())
+
+# Cache and queue state is already tracked by the caches and writers; it is read when /metrics is scraped
+INSTRUMENTED_CACHES = {
+    "geocode": geocode_cache,
+    "directions": directions_cache,
+    "directions_stale": stale_directions_cache,
+    "weather": weather_cache,
+}
+if result_cache.enabled:
+    INSTRUMENTED_CACHES["eta_result"] = result_cache.entries
+
+def collect_cache_lookups() -> Dict[tuple, float]:
+    samples = {}
+    for name in ("geocode", "weather", "eta_result"):
+        if name not in INSTRUMENTED_CACHES:
+            continue
+        stats = INSTRUMENTED_CACHES[name].stats
+        samples[(name, "hit")], samples[(name, "miss")] = stats["hits"], stats["misses"]
+    # Directions lookups go through the spatial cache, which also counts neighbouring-cell and stale hits
+    for result, key in (
+        ("hit", "hits"), ("neighbor_hit", "neighbor_hits"), ("shared_hit", "shared_hits"), ("stale_hit", "stale_hits"),
+        ("miss", "misses")
+    ):
+        samples[("directions", result)] = route_cache.stats[key]
+    # Lookups that reached the stores shared by all workers on the host
+    for name, store in (("geocode_shared", geocode_store), ("directions_shared", directions_store), ("weather_shared", weather_store)):
+        if store is not None:
+            samples[(name, "hit")], samples[(name, "miss")] = store.stats["hits"], store.stats["misses"]
+    return samples
+
+def collect_cache_removals() -> Dict[tuple, float]:
+    samples = {}
+    for name, cache in INSTRUMENTED_CACHES.items():
+        samples[(name, "eviction")], samples[(name, "expiration")] = cache.stats["evictions"], cache.stats["expirations"]
+    if result_cache.enabled:
+        samples[("eta_result", "invalidation")] = result_cache.stats["invalidated_entries"]
+    return samples
+
+def collect_write_behind_rows() -> Dict[tuple, float]:
+    samples = {}
+    for writer in (write_behind, shadow_write_behind):
+        for result in ("written", "failed", "dropped"):
+            samples[(writer.table.name, result)] = writer.stats[result]
+    return samples
+
+REGISTRY.register(Collected(
+    "eta_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"), collect_cache_lookups, "counter"
+))
+REGISTRY.register(Collected(
+    "eta_cache_removals_total", "Entries removed for capacity (eviction), age (expiration) or a model change (invalidation)", ("cache", "reason"),
+    collect_cache_removals, "counter"
+))
+REGISTRY.register(Collected(
+    "eta_cache_entries", "Entries currently cached", ("cache",),
+    lambda: {(name,): len(cache) for name, cache in INSTRUMENTED_CACHES.items()}
+))
+REGISTRY.register(Collected(
+    "eta_cache_capacity", "Maximum entries per cache", ("cache",),
+    lambda: {(name,): cache.maxsize for name, cache in INSTRUMENTED_CACHES.items()}
+))
+REGISTRY.register(Collected(
+    "eta_write_behind_rows_total", "Rows handled by the write-behind queues", ("table", "result"),
+    collect_write_behind_rows, "counter"
+))
+REGISTRY.register(Collected(
+    "eta_write_behind_depth", "Rows waiting in the write-behind queues", ("table",),
+    lambda: {(w.table.name,): w.metrics()["depth"] for w in (write_behind, shadow_write_behind)}
+))
+REGISTRY.register(Collected(
+    "eta_live_deliveries", "Deliveries tracked for live ETA streaming", (), lambda: {(): len(live_tracker.deliveries)}
+))
+REGISTRY.register(Collected(
+    "eta_live_refresh_results_total", "Tracked deliveries re-checked, by result", ("result",),
+    lambda: {(result,): live_tracker.stats[result] for result in ("recomputed", "unchanged", "failed")}, "counter"
+))
+REGISTRY.register(Collected(
+    "eta_live_events_pushed_total", "ETA events pushed to live streams", (), lambda: {(): live_tracker.stats["pushed"]},
+    "counter"
+))
+REGISTRY.register(Collected(
+    "eta_model_loaded", "Whether a model version is loaded, by slot", ("slot",),
+    lambda: {("active",): int(registry.active is not None), ("shadow",): int(registry.shadow is not None)}
+))
+
+def collect_budget_decisions() -> Dict[tuple, float]:
+    samples = {}
+    for name, budget in upstream_budgets.budgets.items():
+        for priority in PRIORITY_NAMES.values():
+            for decision in ("granted", "queued", "degraded"):
+                samples[(name, priority, decision)] = budget.stats[f"{decision}_{priority}"]
+    return samples
+
+REGISTRY.register(Collected(
+    "eta_upstream_budget_decisions_total",
+    "Upstream calls by provider and priority: sent at once (granted), after waiting (queued), or not sent (degraded)",
+    ("provider", "priority", "decision"), collect_budget_decisions, "counter"
+))
+REGISTRY.register(Collected(
+    "eta_upstream_budget_tokens", "Calls each provider's budget can send right now", ("provider",),
+    lambda: {(name,): budget.metrics()["tokens"] for name, budget in upstream_budgets.budgets.items()}
+))
+REGISTRY.register(Collected(
+    "eta_upstream_budget_rate", "Calls per second each provider's budget allows, after backing off from throttling",
+    ("provider",), lambda: {(name,): budget.rate for name, budget in upstream_budgets.budgets.items()}
+))
+REGISTRY.register(Collected(
+    "eta_upstream_budget_waiting", "Calls waiting for budget, by provider and priority", ("provider", "priority"),
+    lambda: {
+        (name, priority): count
+        for name, budget in upstream_budgets.budgets.items() for priority, count in budget.metrics()["waiting"].items()
+    }
+))
+
+REGISTRY.register(Collected(
+    "eta_upstream_circuit_state", "Circuit breaker state per provider: 0 closed, 1 half-open, 2 open", ("provider",),
+    lambda: {(name,): CircuitBreaker.STATE_VALUES[breaker.state] for name, breaker in circuit_breakers.items()}
+))
+REGISTRY.register(Collected(
+    "eta_hedged_calls_total",
+    "Hedged lookups by result: backup started after the hedge delay (hedged), backup answered first (backup_won), "
+    "primary failed before the delay (fallback), both failed (failed)",
+    ("call", "result"),
+    lambda: {
+        ("geocode", result): geocode_hedge.stats[key]
+        for result, key in (("hedged", "hedged"), ("backup_won", "backup_won"), ("fallback", "fallbacks"), ("failed", "failed"))
+    },
+    "counter"
+))
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # ETA endpoint 
 @app.post("/predict-eta", response_model=ETAResponse)
-async def predict_eta(request: ETARequest,db:Session = Depends(get_db)):
+@within_deadline()
+async def predict_eta(request: ETARequest):
     try:
-        # Geocode addresses
-        restaurant_lat, restaurant_lng = geocode_address(request.restaurant_address)
-        delivery_lat, delivery_lng = geocode_address(request.delivery_address)
+        # Geocode both addresses concurrently; report the restaurant error first
+        restaurant, delivery = await asyncio.gather(
+            geocode_address(request.restaurant_address, ttl=RESTAURANT_GEOCODE_TTL_SECONDS),
+            geocode_address(request.delivery_address),
+            return_exceptions=True
+        )
+        for result in (restaurant, delivery):
+            if isinstance(result, BaseException):
+                raise result
+        restaurant_lat, restaurant_lng = restaurant
+        delivery_lat, delivery_lng = delivery
         
         # Validate inputs
-
-        if not (-90 <= restaurant_lat <= 90 and -180 <= restaurant_lng <= 180):
-            raise HTTPException(status_code=400, detail="Invalid pickup coordinates")
-        if not (-90 <= delivery_lat <= 90 and -180 <= delivery_lng <= 180):
-            raise HTTPException(status_code=400, detail="Invalid delivery coordinates")
-        if request.vehicle_condition not in [0, 1, 2, 3]:
-            raise HTTPException(status_code=400, detail="Vehicle condition must be 0-3")
-        if request.vehicle_type.lower() not in ["bicycle", "scooter", "bike"]:
-            raise HTTPException(status_code=400, detail="Invalid vehicle type")
-        if request.multiple_deliveries < 0:
-            raise HTTPException(status_code=400, detail="Multiple deliveries must be non-negative")
-        
-        # Get directions
-        directions = get_google_directions(restaurant_lat, restaurant_lng, delivery_lat, delivery_lng)
-        if directions["distance_km"] > 20:
-            raise HTTPException(status_code=400, detail="Distance exceeds hyperlocal limit (20 km)")
+        validate_eta_inputs(request, restaurant_lat, restaurant_lng, delivery_lat, delivery_lng)
         
-        # Get weather
-        weather = get_weather_data((restaurant_lat + delivery_lat) / 2, (restaurant_lng + delivery_lng) / 2)
+        # A repeat trip is answered from the result cache without directions, weather or inference
+        prediction_id = uuid.uuid4().hex
+        signature = trip_signature(request, restaurant_lat, restaurant_lng, delivery_lat, delivery_lng)
+        cached = result_cache.get(signature)
+        if cached is not None:
+            directions, weather, traffic_density = cached["directions"], cached["weather"], cached["traffic_density"]
+            predicted_eta, confidence = cached["predicted_eta"], cached["confidence"]
+            PREDICTIONS.inc(path="cached")
+        else:
+            # Get directions and weather concurrently
+            directions, weather = await asyncio.gather(
+                get_google_directions(restaurant_lat, restaurant_lng, delivery_lat, delivery_lng),
+                get_weather_data((restaurant_lat + delivery_lat) / 2, (restaurant_lng + delivery_lng) / 2)
+            )
+            if directions["distance_km"] > HYPERLOCAL_LIMIT_KM:
+                raise HTTPException(status_code=400, detail=f"Distance exceeds hyperlocal limit ({HYPERLOCAL_LIMIT_KM} km)")
+
+            # Calculate traffic density
+            traffic_density = calculate_traffic_density(directions["distance_km"], directions["duration_minutes"])
+
+            # Predict ETA
+            predicted_eta, confidence = await predict_eta_ml(
+                request, weather, traffic_density, directions["distance_km"],
+                restaurant_lat, restaurant_lng, delivery_lat, delivery_lng, prediction_id
+            )
+
+            # Adjust confidence
+            confidence = adjust_confidence(confidence, predicted_eta, directions, weather)
+            # A response built from fallbacks is not reused; the next request for the trip tries the providers again
+            if not degraded_inputs(directions, weather):
+                result_cache.put(signature, {
+                    "directions": directions, "weather": weather, "traffic_density": traffic_density,
+                    "predicted_eta": predicted_eta, "confidence": confidence,
+                })
+        is_festival = is_festival_day()
         
-        # Calculate traffic density
-        traffic_density = calculate_traffic_density(directions["distance_km"], directions["duration_minutes"])
+        # Queue for the database; the write happens off the request path
+        with stage_timer("persistence"):
+            await write_behind.put(build_db_record(
+                request, predicted_eta, confidence, directions, weather, traffic_density, is_festival, prediction_id,
+                delivery_lat, delivery_lng
+            ))
         
-        # Predict ETA
-        predicted_eta, confidence = predict_eta_ml(
-            request, weather, traffic_density, directions["distance_km"],
-            restaurant_lat, restaurant_lng, delivery_lat, delivery_lng
+        return build_eta_response(
+            predicted_eta, confidence, directions, weather, traffic_density, is_festival,
+            restaurant_lat, restaurant_lng, delivery_lat, delivery_lng, prediction_id
         )
-        
-        # Adjust confidence
-        eta_diff = abs(predicted_eta - directions["duration_minutes"])
-        if directions["duration_minutes"] > 0:
-            confidence = max(0.6, min(0.95, confidence - (eta_diff / (directions["distance_km"] * 6))))
-        else:
-            confidence = 0.6 # fallback when distance is zero
-            
-        # Prepare recommendations based on weather and traffic
-        recommendations = []
-        if weather["condition"] in ["stormy", "fog"]:
-            recommendations.append("Consider delaying delivery due to adverse weather conditions.")
-        if traffic_density in ["high", "jam"]:
-            recommendations.append("Expect delays due to heavy traffic; consider alternative routes.")
-        
-        # Save to database
-        order_time = None
-        if request.order_time:
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error predicting ETA: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Batch ETA endpoint: upstream lookups run once per unique key and the model scores all orders in one call
+@app.post("/predict-eta/batch", response_model=ETABatchResponse)
+@within_deadline()
+async def predict_eta_batch(batch: ETABatchRequest):
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    if len(batch.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size exceeds limit ({MAX_BATCH_SIZE})")
+
+    try:
+        errors: Dict[int, HTTPException] = {}
+
+        # Geocode each unique normalized address once, concurrently
+        addresses: Dict[str, str] = {}
+        restaurant_keys = set()
+        for item in batch.items:
+            restaurant_key = normalize_address(item.restaurant_address)
+            restaurant_keys.add(restaurant_key)
+            addresses.setdefault(restaurant_key, item.restaurant_address)
+            addresses.setdefault(normalize_address(item.delivery_address), item.delivery_address)
+        geocode_results = await asyncio.gather(
+            *(
+                geocode_address(
+                    address, ttl=RESTAURANT_GEOCODE_TTL_SECONDS if key in restaurant_keys else GEOCODE_TTL_SECONDS
+                )
+                for key, address in addresses.items()
+            ),
+            return_exceptions=True
+        )
+        geocoded: Dict[str, Any] = {}
+        for key, result in zip(addresses, geocode_results):
+            if isinstance(result, BaseException) and not isinstance(result, HTTPException):
+                raise result
+            geocoded[key] = result
+
+        # Validate inputs per item
+        coordinates: Dict[int, tuple[float, float, float, float]] = {}
+        for i, item in enumerate(batch.items):
+            restaurant = geocoded[normalize_address(item.restaurant_address)]
+            delivery = geocoded[normalize_address(item.delivery_address)]
             try:
-                order_time = datetime.fromisoformat(request.order_time.replace("Z", "+00:00"))
-            except ValueError:
-                logger.warning(f"Invalid order_time format for database: {request.order_time}")
-        
-        db_entry = DeliveryETA(
-            restaurant_address=request.restaurant_address,
-            delivery_address=request.delivery_address,
-            delivery_person_age=request.delivery_person_age,
-            delivery_person_rating=request.delivery_person_rating,
-            vehicle_type=request.vehicle_type.lower(),
-            vehicle_condition=request.vehicle_condition,
-            multiple_deliveries=request.multiple_deliveries,
-            order_time=order_time,
-            predicted_eta=predicted_eta,
-            google_eta=directions["duration_minutes"],
-            distance_km=directions["distance_km"],
-            weather_condition=weather["condition"],
-            weather_temperature=weather["temperature"],
-            traffic_density=traffic_density,
-            is_festival=is_festival_day(),
-            confidence=confidence
+                if isinstance(restaurant, HTTPException):
+                    raise restaurant
+                if isinstance(delivery, HTTPException):
+                    raise delivery
+                validate_eta_inputs(item, *restaurant, *delivery)
+                coordinates[i] = (*restaurant, *delivery)
+            except HTTPException as e:
+                errors[i] = e
+
+        # Get directions and weather for each unique route and midpoint, concurrently
+        unique_routes = list(dict.fromkeys(coordinates.values()))
+        unique_points = list(dict.fromkeys(((r[0] + r[2]) / 2, (r[1] + r[3]) / 2) for r in unique_routes))
+        route_results = await asyncio.gather(
+            *(get_google_directions(*route) for route in unique_routes),
+            *(get_weather_data(*point) for point in unique_points)
+        )
+        directions_by_route = dict(zip(unique_routes, route_results[:len(unique_routes)]))
+        weather_by_point = dict(zip(unique_points, route_results[len(unique_routes):]))
+        for i, route in list(coordinates.items()):
+            if directions_by_route[route]["distance_km"] > HYPERLOCAL_LIMIT_KM:
+                errors[i] = HTTPException(
+                    status_code=400, detail=f"Distance exceeds hyperlocal limit ({HYPERLOCAL_LIMIT_KM} km)"
+                )
+                del coordinates[i]
+
+        # Build one feature matrix and predict all valid orders together
+        indices = list(coordinates.keys())
+        routes = [coordinates[i] for i in indices]
+        directions = [directions_by_route[route] for route in routes]
+        weathers = [weather_by_point[((r[0] + r[2]) / 2, (r[1] + r[3]) / 2)] for r in routes]
+        traffic_densities = [calculate_traffic_density(d["distance_km"], d["duration_minutes"]) for d in directions]
+        prediction_ids = [uuid.uuid4().hex for _ in indices]
+        predictions = await predict_eta_ml_batch(
+            [batch.items[i] for i in indices], weathers, traffic_densities, [d["distance_km"] for d in directions],
+            prediction_ids
+        )
+        is_festival = is_festival_day()
+
+        results: Dict[int, ETAResponse] = {}
+        db_records = []
+        for i, prediction_id, route, route_directions, weather, traffic_density, (predicted_eta, confidence) in zip(
+            indices, prediction_ids, routes, directions, weathers, traffic_densities, predictions
+        ):
+            confidence = adjust_confidence(confidence, predicted_eta, route_directions, weather)
+            db_records.append(build_db_record(
+                batch.items[i], predicted_eta, confidence, route_directions, weather, traffic_density, is_festival,
+                prediction_id, route[2], route[3]
+            ))
+            results[i] = build_eta_response(
+                predicted_eta, confidence, route_directions, weather, traffic_density, is_festival, *route,
+                prediction_id
+            )
+
+        # Queue all predictions for the database
+        with stage_timer("persistence"):
+            await write_behind.put_many(db_records)
+
+        items = []
+        for i in range(len(batch.items)):
+            if i in results:
+                items.append(ETABatchItem(index=i, result=results[i]))
+            else:
+                items.append(ETABatchItem(index=i, status_code=errors[i].status_code, error=str(errors[i].detail)))
+        return ETABatchResponse(results=items, succeeded=len(results), failed=len(errors))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error predicting batch ETA: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Admin endpoints require the X-Admin-Token header and are disabled when ADMIN_TOKEN is unset
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+# Reload the model named by the manifest without restarting; the swap happens once the new version is loaded.
+# Under prefork.py the supervisor loads it instead and replaces the workers one by one, so they keep sharing it.
+@app.post("/admin/reload-model", dependencies=[Depends(require_admin)])
+async def admin_reload_model(force: bool = False):
+    if PREFORK_SUPERVISOR_PID:
+        os.kill(int(PREFORK_SUPERVISOR_PID), signal.SIGHUP)
+        return JSONResponse(status_code=202, content={"status": "rolling restart requested", "model": registry.info()["active"]})
+    previous = registry.active.version if registry.active is not None else None
+    try:
+        loaded, changed = await reload_model(force=force)
+    except Exception as e:
+        logger.error(f"Model reload failed, keeping current version: {e}")
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return {"previous_version": previous, "changed": changed, "model": loaded.info()}
+
+# Load (or replace) the shadow model from SHADOW_MODEL_DIR; it starts scoring live traffic immediately
+@app.post("/admin/shadow", dependencies=[Depends(require_admin)])
+async def admin_load_shadow():
+    try:
+        registry.shadow = await asyncio.to_thread(load_model, SHADOW_MODEL_DIR)
+    except Exception as e:
+        logger.error(f"Shadow model load failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Shadow model load failed: {str(e)}")
+    return registry.info()
+
+# Stop shadow scoring
+@app.delete("/admin/shadow", dependencies=[Depends(require_admin)])
+async def admin_clear_shadow():
+    registry.shadow = None
+    return registry.info()
+
+# Function to compare served and shadow predictions against reported delivery outcomes, per shadow version
+def shadow_outcome_report() -> list[Dict[str, Any]]:
+    eta, shadow, outcome = DeliveryETA.__table__, DeliveryETAShadow.__table__, DeliveryOutcome.__table__
+    served_error = eta.c.predicted_eta - outcome.c.actual_minutes
+    shadow_error = shadow.c.predicted_eta - outcome.c.actual_minutes
+    query = (
+        select(
+            shadow.c.model_version,
+            func.count(),
+            func.avg(func.abs(served_error)),
+            func.avg(func.abs(shadow_error)),
+            func.avg(served_error * served_error),
+            func.avg(shadow_error * shadow_error),
+            func.avg(shadow.c.latency_ms)
         )
-        db.add(db_entry)
+        .join_from(shadow, eta, eta.c.prediction_id == shadow.c.prediction_id)
+        .join(outcome, outcome.c.prediction_id == shadow.c.prediction_id)
+        .group_by(shadow.c.model_version)
+    )
+    if engine is None:
+        return []
+    with engine.connect() as connection:
+        rows = connection.execute(query).all()
+    return [
+        {
+            "shadow_version": version,
+            "labelled_predictions": count,
+            "served_mae": round(served_mae, 3),
+            "shadow_mae": round(shadow_mae, 3),
+            "served_rmse": round(served_mse ** 0.5, 3),
+            "shadow_rmse": round(shadow_mse ** 0.5, 3),
+            "shadow_mean_latency_ms": round(latency, 3) if latency is not None else None,
+        }
+        for version, count, served_mae, shadow_mae, served_mse, shadow_mse, latency in rows
+    ]
+
+# Shadow comparison: live scoring stats plus error against actual delivery times
+@app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+async def admin_shadow_report():
+    return {
+        "models": registry.info(),
+        "scoring": shadow_scorer.metrics(),
+        "persistence": shadow_write_behind.metrics(),
+        "outcomes": await asyncio.to_thread(shadow_outcome_report),
+    }
+
+# Record the actual delivery time for a prediction; these outcomes are the labels for incremental retraining
+@app.post("/deliveries/outcome", status_code=201)
+def record_delivery_outcome(outcome: DeliveryOutcomeRequest, db: Session = Depends(get_db)):
+    if outcome.actual_minutes <= 0:
+        raise HTTPException(status_code=400, detail="Actual delivery time must be positive")
+    # Predictions reach the table through the write-behind queue, so one made a moment ago may not be there yet
+    # (clients retry after DB_FLUSH_INTERVAL_SECONDS); archived predictions are gone too
+    prediction = db.execute(
+        select(DeliveryETA.id).where(DeliveryETA.prediction_id == outcome.prediction_id)
+    ).first()
+    if prediction is None:
+        raise HTTPException(status_code=404, detail="Unknown prediction_id")
+    delivered_at = parse_order_time(outcome.delivered_at) if outcome.delivered_at else None
+    record = DeliveryOutcome(prediction_id=outcome.prediction_id, actual_minutes=outcome.actual_minutes)
+    if delivered_at is not None:
+        record.delivered_at = delivered_at
+    db.add(record)
+    try:
         db.commit()
-        db.refresh(db_entry)
-        logger.info(f"Saved delivery ETA to database with ID: {db_entry.id}")
-        
-        return ETAResponse(
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Outcome already recorded for this prediction")
+    return {"prediction_id": outcome.prediction_id, "status": "recorded"}
+
+# Function to parse an optional ISO-8601 analytics bound, rejecting malformed values
+def parse_time_bound(name: str, value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: expected an ISO-8601 timestamp")
+
+# Mean predicted vs Google ETA from the hourly rollup, per hour, day or in total, optionally grouped by
+# vehicle type, traffic density and weather and filtered on them. Defaults to the last 7 days.
+@app.get("/analytics/eta")
+def eta_analytics(
+    since: Optional[str] = None, until: Optional[str] = None, interval: str = "hour", group_by: Optional[str] = None,
+    vehicle_type: Optional[str] = None, traffic_density: Optional[str] = None, weather_condition: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(INTERVALS)}")
+    dimensions = [d for d in (group_by or "").split(",") if d]
+    unknown = [d for d in dimensions if d not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}")
+    start, end = time_window(parse_time_bound("since", since), parse_time_bound("until", until))
+    filters = {
+        name: value for name, value in
+        (("vehicle_type", vehicle_type), ("traffic_density", traffic_density), ("weather_condition", weather_condition))
+        if value is not None
+    }
+    return {
+        "since": start.isoformat(),
+        "until": end.isoformat(),
+        "interval": interval,
+        "group_by": dimensions,
+        "buckets": eta_rollup.query(db, start, end, dimensions, filters, interval),
+    }
+
+# Predictions per delivery grid cell (busiest first), or for one cell, over a time window (default 7 days)
+@app.get("/analytics/eta/cells")
+def eta_cell_analytics(
+    since: Optional[str] = None, until: Optional[str] = None, cell: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_db)
+):
+    start, end = time_window(parse_time_bound("since", since), parse_time_bound("until", until))
+    return {
+        "since": start.isoformat(),
+        "until": end.isoformat(),
+        "cell_meters": ANALYTICS_CELL_METERS,
+        "cells": cell_summary(db, DeliveryETA.__table__, start, end, ANALYTICS_CELL_METERS, cell, limit),
+    }
+
+# Recompute the hourly rollup from delivery_eta and its archive (see archive.py), e.g. to backfill rows
+# written before the rollup existed
+@app.post("/admin/analytics/rebuild", dependencies=[Depends(require_admin)])
+async def admin_rebuild_analytics():
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Database is not ready")
+    # Imported here so pyarrow stays off the startup path
+    from archive import scan_archive
+
+    archived = (batch.to_pylist() for batch in scan_archive(columns=list(ROLLUP_SOURCE_COLUMNS)))
+    scanned, groups = await asyncio.to_thread(eta_rollup.rebuild, engine, DeliveryETA.__table__, archived)
+    return {"rows_scanned": scanned, "groups": groups}
+
+# Start live tracking for an order. The ETA is predicted as by /predict-eta; its prediction_id identifies the
+# delivery when streaming updates, reporting rider positions and recording the outcome.
+@app.post("/deliveries/live", response_model=ETAResponse, status_code=201)
+async def register_live_delivery(request: ETARequest):
+    if len(live_tracker.deliveries) >= LIVE_MAX_DELIVERIES:
+        raise HTTPException(status_code=503, detail="Live tracking is at capacity")
+    response = await predict_eta(request)
+    restaurant = (response.restaurant_lat, response.restaurant_lng)
+    delivery = TrackedDelivery(
+        response.prediction_id, request, restaurant, (response.delivery_lat, response.delivery_lng), {},
+        live_inputs(restaurant, response.weather["condition"], response.traffic_density, response.distance_km, response.google_eta)
+    )
+    delivery.payload = live_payload(delivery, response)
+    if not live_tracker.add(delivery):
+        raise HTTPException(status_code=503, detail="Live tracking is at capacity")
+    return response
+
+# Report the rider's position: the route is re-checked from there and the delivery rescored if it changed
+@app.post("/deliveries/{delivery_id}/position")
+async def update_rider_position(delivery_id: str, position: RiderPositionRequest):
+    delivery = live_tracker.get(delivery_id)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail="Delivery is not being tracked")
+    if not (-90 <= position.lat <= 90 and -180 <= position.lng <= 180):
+        raise HTTPException(status_code=400, detail="Invalid rider coordinates")
+    delivery.origin = (position.lat, position.lng)
+    delivery.touched_at = time.monotonic()
+    await refresh_live_deliveries([delivery])
+    return delivery.payload
+
+# Stop tracking a delivery; subscribers get a final "end" event
+@app.delete("/deliveries/{delivery_id}/live")
+async def end_live_delivery(delivery_id: str):
+    if live_tracker.end(delivery_id) is None:
+        raise HTTPException(status_code=404, detail="Delivery is not being tracked")
+    return {"delivery_id": delivery_id, "status": "ended"}
+
+# Function to format one server-sent event
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# Server-sent events for a comma-separated list of tracked deliveries: each one's current ETA on connect,
+# an "eta" event whenever one is rescored and an "end" event when its tracking stops
+@app.get("/deliveries/live/stream")
+async def stream_live_deliveries(ids: str):
+    delivery_ids = {delivery_id for delivery_id in ids.split(",") if delivery_id}
+    tracked = {delivery_id for delivery_id in delivery_ids if live_tracker.get(delivery_id) is not None}
+    if not tracked:
+        raise HTTPException(status_code=404, detail="None of the deliveries are being tracked")
+
+    subscription = live_tracker.subscribe(tracked)
+    for delivery_id in tracked:
+        subscription.push(delivery_id, live_tracker.get(delivery_id).payload)
+
+    async def events():
+        deadline = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+        remaining = set(tracked)
+        try:
+            yield "retry: 1000\n\n"
+            while remaining and time.monotonic() < deadline:
+                updates = await subscription.next(min(LIVE_KEEPALIVE_SECONDS, max(0.0, deadline - time.monotonic())))
+                if not updates:
+                    yield ": keepalive\n\n"
+                for payload in updates:
+                    if "status" in payload:
+                        remaining.discard(payload["delivery_id"])
+                        yield sse_event("end", payload)
+                    else:
+                        yield sse_event("eta", payload)
+        finally:
+            live_tracker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Many-to-many ETA endpoint for dispatch: every origin against every destination, scored in one model call
+@app.post("/predict-eta/matrix", response_model=ETAMatrixResponse)
+@within_deadline()
+async def predict_eta_matrix(request: ETAMatrixRequest):
+    n_origins, n_destinations = len(request.origins), len(request.destinations)
+    if not n_origins or not n_destinations:
+        raise HTTPException(status_code=400, detail="Matrix needs at least one origin and one destination")
+    if n_origins * n_destinations > MAX_MATRIX_CELLS:
+        raise HTTPException(status_code=400, detail=f"Matrix size exceeds limit ({MAX_MATRIX_CELLS} cells)")
+
+    try:
+        origin_errors: Dict[int, str] = {}
+        destination_errors: Dict[int, str] = {}
+
+        # Geocode each unique normalized address once, concurrently; origins are long-lived pickup points
+        origin_keys = [normalize_address(origin.address) for origin in request.origins]
+        destination_keys = [normalize_address(address) for address in request.destinations]
+        addresses: Dict[str, tuple[str, float]] = {}
+        for key, origin in zip(origin_keys, request.origins):
+            addresses.setdefault(key, (origin.address, RESTAURANT_GEOCODE_TTL_SECONDS))
+        for key, address in zip(destination_keys, request.destinations):
+            addresses.setdefault(key, (address, GEOCODE_TTL_SECONDS))
+        geocode_results = await asyncio.gather(
+            *(geocode_address(address, ttl=ttl) for address, ttl in addresses.values()),
+            return_exceptions=True
+        )
+        geocoded: Dict[str, Any] = {}
+        for key, result in zip(addresses, geocode_results):
+            if isinstance(result, BaseException) and not isinstance(result, HTTPException):
+                raise result
+            geocoded[key] = result
+
+        # Resolve coordinates and validate each origin's rider once
+        origin_coordinates: list[Optional[tuple[float, float]]] = []
+        for i, (key, origin) in enumerate(zip(origin_keys, request.origins)):
+            try:
+                if isinstance(geocoded[key], HTTPException):
+                    raise geocoded[key]
+                validate_rider_inputs(origin)
+                origin_coordinates.append(geocoded[key])
+            except HTTPException as e:
+                origin_errors[i] = str(e.detail)
+                origin_coordinates.append(None)
+        destination_coordinates: list[Optional[tuple[float, float]]] = []
+        for j, key in enumerate(destination_keys):
+            if isinstance(geocoded[key], HTTPException):
+                destination_errors[j] = str(geocoded[key].detail)
+                destination_coordinates.append(None)
+            else:
+                destination_coordinates.append(geocoded[key])
+
+        # Pairwise straight-line distances between unique points in one vectorized pass; a road route is
+        # never shorter, so point pairs already beyond the hyperlocal limit are not routed at all
+        origin_points = list(dict.fromkeys(c for c in origin_coordinates if c is not None))
+        destination_points = list(dict.fromkeys(c for c in destination_coordinates if c is not None))
+        point_pairs: list[tuple[int, int]] = []
+        if origin_points and destination_points:
+            origin_array = np.array(origin_points)
+            destination_array = np.array(destination_points)
+            straight_km = haversine_matrix(
+                origin_array[:, 0], origin_array[:, 1], destination_array[:, 0], destination_array[:, 1]
+            )
+            rows, columns = np.nonzero(straight_km <= HYPERLOCAL_LIMIT_KM)
+            point_pairs = list(zip(rows.tolist(), columns.tolist()))
+
+        # Route every point pair and fetch weather once per midpoint tile, concurrently
+        midpoints = {
+            (p, q): (
+                (origin_points[p][0] + destination_points[q][0]) / 2,
+                (origin_points[p][1] + destination_points[q][1]) / 2
+            )
+            for p, q in point_pairs
+        }
+        tile_points: Dict[tuple[int, int, int], tuple[float, float]] = {}
+        for point in midpoints.values():
+            tile_points.setdefault(weather_key(*point), point)
+        route_results, *weather_results = await asyncio.gather(
+            get_route_matrix(origin_points, destination_points, point_pairs),
+            *(get_weather_data(*point) for point in tile_points.values())
+        )
+        weather_by_tile = dict(zip(tile_points, weather_results))
+
+        # Expand point pairs back to matrix cells within the hyperlocal limit
+        origin_point_index = {point: p for p, point in enumerate(origin_points)}
+        destination_point_index = {point: q for q, point in enumerate(destination_points)}
+        pairs: list[tuple[int, int]] = []
+        point_pair_of: Dict[tuple[int, int], tuple[int, int]] = {}
+        for i, origin_point in enumerate(origin_coordinates):
+            for j, destination_point in enumerate(destination_coordinates):
+                if origin_point is None or destination_point is None:
+                    continue
+                point_pair = (origin_point_index[origin_point], destination_point_index[destination_point])
+                if point_pair in route_results and route_results[point_pair]["distance_km"] <= HYPERLOCAL_LIMIT_KM:
+                    pairs.append((i, j))
+                    point_pair_of[(i, j)] = point_pair
+
+        # Build one feature matrix for the whole grid and predict it in a single call
+        directions = [route_results[point_pair_of[pair]] for pair in pairs]
+        weathers = [weather_by_tile[weather_key(*midpoints[point_pair_of[pair]])] for pair in pairs]
+        traffic_densities = [calculate_traffic_density(d["distance_km"], d["duration_minutes"]) for d in directions]
+        predictions = await predict_eta_ml_batch(
+            [request.origins[i] for i, _ in pairs], weathers, traffic_densities, [d["distance_km"] for d in directions]
+        )
+
+        predicted_eta = [[None] * n_destinations for _ in range(n_origins)]
+        google_eta = [[None] * n_destinations for _ in range(n_origins)]
+        distance_km = [[None] * n_destinations for _ in range(n_origins)]
+        confidence = [[None] * n_destinations for _ in range(n_origins)]
+        degraded = set()
+        for (i, j), route_directions, weather, (eta, eta_confidence) in zip(pairs, directions, weathers, predictions):
+            predicted_eta[i][j] = round(eta, 2)
+            google_eta[i][j] = round(route_directions["duration_minutes"], 2)
+            distance_km[i][j] = round(route_directions["distance_km"], 2)
+            confidence[i][j] = round(adjust_confidence(eta_confidence, eta, route_directions, weather), 2)
+            degraded.update(degraded_inputs(route_directions, weather))
+
+        return ETAMatrixResponse(
+            origin_coordinates=[list(c) if c is not None else None for c in origin_coordinates],
+            destination_coordinates=[list(c) if c is not None else None for c in destination_coordinates],
             predicted_eta=predicted_eta,
-            google_eta=directions["duration_minutes"],
-            distance_km=round(directions["distance_km"], 2),
-            weather={"condition": weather["condition"], "temperature": weather["temperature"]},
-            traffic_density=traffic_density,
+            google_eta=google_eta,
+            distance_km=distance_km,
+            confidence=confidence,
             is_festival=is_festival_day(),
-            confidence=round(confidence, 2),
-            route_polyline=directions["polyline"],
-            restaurant_lat=restaurant_lat,
-            restaurant_lng=restaurant_lng,
-            delivery_lat=delivery_lat,
-            delivery_lng=delivery_lng,
-            recommendations=recommendations if recommendations else None
+            degraded_inputs=[name for name in DEGRADED_CONFIDENCE_PENALTY if name in degraded],
+            origin_errors=origin_errors,
+            destination_errors=destination_errors
         )
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Error predicting ETA: {str(e)}")
+        logger.error(f"Error predicting ETA matrix: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 if  __name__ == "__main__":
@@ -0,0 +1,270 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from cachetools import TTLCache
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request stage timings (stage -> [total seconds, calls]) for the Server-Timing header; None outside a request
+request_timings: ContextVar[Optional[Dict[str, list]]] = ContextVar("request_timings", default=None)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# A monotonically increasing count, optionally split by labels
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+# Observations counted into cumulative buckets, with their sum and count
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values: Dict[tuple, list] = {}  # labels -> [per-bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterator[tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            values = [(key, list(state)) for key, state in self.values.items()]
+        for key, state in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, state[-1]
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+# Values read at scrape time from a callback returning {label values: value}, for state that is already
+# tracked elsewhere (cache sizes, queue depths, stats dicts)
+class Collected:
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...], collect: Callable[[], Dict[tuple, float]],
+        type: str = "gauge"
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.collect = collect
+        self.type = type
+
+    def samples(self) -> Iterator[tuple[str, Dict[str, str], float]]:
+        for key, value in self.collect().items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    # Render every metric in the Prometheus text exposition format
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "eta_stage_duration_seconds", "Time spent in each stage of an ETA request", ("stage",)
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "eta_http_request_duration_seconds", "HTTP request latency by endpoint and status", ("handler", "status")
+))
+
+
+# Function to read a process's memory from /proc (Linux), in bytes: rss, pss (shared pages split between the
+# processes mapping them), shared and private. A pre-forked worker's private bytes are what it adds on top of
+# the pages it still shares with the supervisor. Elsewhere only the peak RSS of this process is known.
+def process_memory(pid: Any = "self") -> Dict[str, int]:
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        import resource
+
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024} if pid == "self" else {}
+    memory = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    for line in lines:
+        name, _, rest = line.partition(":")
+        if name in fields:
+            memory[fields[name]] += int(rest.split()[0]) * 1024
+    return memory
+
+
+PROCESS_MEMORY = REGISTRY.register(Collected(
+    "eta_process_memory_bytes", "Memory of this server process by kind (rss, pss, shared, private)", ("kind",),
+    lambda: {(kind,): value for kind, value in process_memory().items()}
+))
+
+
+# Function to record one stage's duration in the histogram and in the current request's timings
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+# Decorator timing every call of a function (sync or async) as a stage
+def timed_stage(stage: str) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Function to format request timings as a Server-Timing header value
+def server_timing_header(timings: Dict[str, list], total_seconds: float) -> str:
+    entries = [f'{stage};dur={seconds * 1000:.2f};desc="{calls} call(s)"' for stage, (seconds, calls) in timings.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(entries)
+
+
+# TTLCache that counts hits and misses (through lookup()) and entries removed for capacity or expiry
+class InstrumentedTTLCache(TTLCache):
+    def __init__(self, maxsize: float, ttl: float, **kwargs: Any):
+        super().__init__(maxsize, ttl, **kwargs)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def lookup(self, key: Any) -> Any:
+        value = self.get(key)
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def popitem(self) -> tuple:
+        item = super().popitem()
+        self.stats["evictions"] += 1
+        return item
+
+    def expire(self, time: Optional[float] = None) -> list:
+        expired = super().expire(time)
+        self.stats["expirations"] += len(expired)
+        return expired
+
+
+# ASGI middleware timing every HTTP request by endpoint and status. It opens the per-request stage timings
+# and, when enabled, reports them to the client in a Server-Timing header.
+class RequestTimingMiddleware:
+    def __init__(self, app: Any, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, list] = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - start).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, handler=handler, status=status)
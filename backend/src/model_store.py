@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+from inference import CompiledModel, CompiledPreprocessor, compile_model, verify_forest
+
+logger = logging.getLogger(__name__)
+
+# Model artifacts live next to src/, not relative to the working directory
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+MANIFEST_NAME = "manifest.json"
+# The API and delivery_eta take vehicle condition as 0 (worst) to 3 (best); the model is trained on these labels.
+# Training and serving both encode it through this table.
+VEHICLE_CONDITION_LABELS = {0: "worse", 1: "bad", 2: "average", 3: "good"}
+
+
+# Function to hash an artifact file so a manifest can only activate the exact files it was written with
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to write a JSON file atomically: readers see either the old or the new file, never a partial one
+def write_json_atomic(path: str, data: Mapping[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# Function to read the version manifest, or None when no native model has been exported
+def read_manifest(directory: str = DEFAULT_MODEL_DIR) -> Optional[Dict[str, Any]]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to return the manifest's modification time, used by the hot-reload watcher
+def manifest_mtime(directory: str = DEFAULT_MODEL_DIR) -> Optional[int]:
+    try:
+        return os.stat(os.path.join(directory, MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# Function to export a fitted model and preprocessor as native artifacts: the booster in XGBoost's UBJSON
+# format, the preprocessor as a JSON spec, and a manifest naming both. Parity with sklearn is verified first,
+# and the manifest is replaced last so a running server never sees a half-written version.
+def export_model(
+    model: Any, preprocessor: Any, directory: str = DEFAULT_MODEL_DIR, metrics: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    import xgboost as xgb
+
+    compiled = compile_model(model, preprocessor)
+    os.makedirs(directory, exist_ok=True)
+    raw_booster = compiled.booster.save_raw("ubj")
+    version = f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{hashlib.sha256(raw_booster).hexdigest()[:8]}"
+
+    booster_file = f"booster-{version}.ubj"
+    preprocessor_file = f"preprocessor-{version}.json"
+    with open(os.path.join(directory, booster_file), "wb") as f:
+        f.write(raw_booster)
+    write_json_atomic(os.path.join(directory, preprocessor_file), compiled.preprocessor.spec)
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "booster": booster_file,
+        "preprocessor": preprocessor_file,
+        "sha256": {
+            booster_file: file_sha256(os.path.join(directory, booster_file)),
+            preprocessor_file: file_sha256(os.path.join(directory, preprocessor_file)),
+        },
+        "n_features": compiled.preprocessor.n_features,
+        "num_trees": compiled.booster.num_boosted_rounds(),
+        "xgboost_version": xgb.__version__,
+        "metrics": metrics or {},
+    }
+    write_json_atomic(os.path.join(directory, MANIFEST_NAME), manifest)
+    logger.info(f"Exported model version {version} to {directory}")
+    return manifest
+
+
+# A loaded model version: the compiled inference path plus the manifest it came from
+class LoadedModel:
+    def __init__(self, compiled: CompiledModel, manifest: Dict[str, Any], load_ms: float):
+        self.compiled = compiled
+        self.manifest = manifest
+        self.version: str = manifest["version"]
+        self.load_ms = load_ms
+        self.loaded_at = datetime.now(timezone.utc)
+
+    def predict(self, columns: Mapping[str, Sequence[Any]]) -> np.ndarray:
+        return self.compiled.predict(columns)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "created_at": self.manifest.get("created_at"),
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_ms": round(self.load_ms, 1),
+        }
+
+
+# The model versions serving traffic: the active version answers requests, and an optional shadow version
+# is scored on the same inputs for comparison. Each slot is replaced with a single assignment.
+class ModelRegistry:
+    def __init__(self, active: Optional[LoadedModel] = None, shadow: Optional[LoadedModel] = None):
+        self.active = active
+        self.shadow = shadow
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "active": self.active.info() if self.active is not None else None,
+            "shadow": self.shadow.info() if self.shadow is not None else None,
+        }
+
+
+# Function to load the version named by the manifest. Checksums are verified and the forest walk is checked
+# against the booster before the model is returned, so a broken artifact is rejected instead of served.
+# xgboost is imported here rather than at module level: it takes over a second, and the server imports this
+# module at startup but loads the model in a background thread.
+def load_model(directory: str = DEFAULT_MODEL_DIR) -> LoadedModel:
+    import xgboost as xgb
+
+    start = time.perf_counter()
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No {MANIFEST_NAME} in {directory}")
+    for name, expected in manifest.get("sha256", {}).items():
+        if file_sha256(os.path.join(directory, name)) != expected:
+            raise ValueError(f"Checksum mismatch for {name}")
+
+    booster = xgb.Booster()
+    booster.load_model(os.path.join(directory, manifest["booster"]))
+    with open(os.path.join(directory, manifest["preprocessor"])) as f:
+        spec = json.load(f)
+    compiled = CompiledModel(booster, CompiledPreprocessor(spec))
+    verify_forest(compiled)
+
+    loaded = LoadedModel(compiled, manifest, (time.perf_counter() - start) * 1000)
+    logger.info(f"Model version {loaded.version} loaded in {loaded.load_ms:.1f} ms")
+    return loaded
+
+
+# Export pickled training output as native artifacts:
+#   python src/model_store.py export --model models/xgb_model.pkl --preprocessor models/preprocessor.pkl
+if __name__ == "__main__":
+    import joblib
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage native model artifacts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export_parser = subcommands.add_parser("export", help="export pickled model and preprocessor")
+    export_parser.add_argument("--model", default=os.path.join(DEFAULT_MODEL_DIR, "xgb_model.pkl"))
+    export_parser.add_argument("--preprocessor", default=os.path.join(DEFAULT_MODEL_DIR, "preprocessor.pkl"))
+    export_parser.add_argument("--out", default=DEFAULT_MODEL_DIR)
+    subcommands.add_parser("show", help="print the active manifest").add_argument("--dir", default=DEFAULT_MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_model(joblib.load(args.model), joblib.load(args.preprocessor), args.out), indent=2))
+    else:
+        print(json.dumps(read_manifest(args.dir), indent=2))
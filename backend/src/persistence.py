@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import inspect, insert, text
+from sqlalchemy.engine import Connection, Engine
+
+from metrics import REGISTRY, Histogram
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = int(os.getenv("DB_FLUSH_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("DB_FLUSH_INTERVAL_SECONDS", "1.0"))
+MAX_BACKLOG = int(os.getenv("DB_MAX_BACKLOG", "10000"))
+# How long a request may wait for room in a full backlog before its record is dropped
+ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("DB_ENQUEUE_TIMEOUT_SECONDS", "0.05"))
+
+FLUSH_SECONDS = REGISTRY.register(Histogram(
+    "eta_db_flush_duration_seconds", "Time to bulk-insert one write-behind batch", ("table", "outcome")
+))
+
+
+# Write-behind queue: requests enqueue rows and return immediately; a background task
+# bulk-inserts them in batches when the batch fills up or the flush interval elapses.
+# The engine may be bound after start(): rows queue up (within the backlog) until the database is ready.
+# An optional on_write hook runs in the same transaction as each batch insert, for derived tables (rollups).
+class WriteBehindQueue:
+    def __init__(
+        self, engine: Optional[Engine], table: Any, batch_size: int = FLUSH_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS, max_backlog: int = MAX_BACKLOG,
+        enqueue_timeout: float = ENQUEUE_TIMEOUT_SECONDS,
+        on_write: Optional[Callable[[Connection, list[Dict[str, Any]]], None]] = None
+    ):
+        self.engine = engine
+        self.table = table
+        self.on_write = on_write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.enqueue_timeout = enqueue_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.engine_ready: Optional[asyncio.Event] = None
+        self.stats: Dict[str, Any] = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "failed": 0,
+            "hook_failed": 0,
+            "dropped": 0,
+            "backpressure_waits": 0,
+            "max_depth": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_backlog)
+        self.engine_ready = asyncio.Event()
+        if self.engine is not None:
+            self.engine_ready.set()
+        self.worker = asyncio.create_task(self._run())
+
+    # Attach the database engine once it is reachable; rows queued before then go out in the first flush
+    def bind(self, engine: Engine) -> None:
+        self.engine = engine
+        if self.engine_ready is not None:
+            self.engine_ready.set()
+
+    async def stop(self) -> None:
+        if self.worker is None:
+            return
+        if not self.engine_ready.is_set():
+            # Never bound: nothing can be written, so don't wait on a drain that cannot happen
+            self.worker.cancel()
+            self.worker = None
+            if self.queue.qsize():
+                logger.error(f"Write-behind queue stopped before the database was ready: {self.queue.qsize()} rows not written")
+            return
+        # Sentinel: the worker drains everything queued before it, then exits
+        await self.queue.put(None)
+        await self.worker
+        self.worker = None
+        logger.info(f"Write-behind queue stopped: {self.stats['written']} rows written")
+
+    # Enqueue a row; when the backlog is full, wait briefly for the writer and drop the row if it cannot keep up
+    async def put(self, row: Dict[str, Any]) -> bool:
+        if self.queue is None:
+            raise RuntimeError("Write-behind queue is not started")
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self.queue.put(row), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                logger.error("Write-behind backlog full; dropping delivery ETA record")
+                return False
+        self.stats["enqueued"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.queue.qsize())
+        return True
+
+    async def put_many(self, rows: list[Dict[str, Any]]) -> int:
+        return sum([await self.put(row) for row in rows])
+
+    def metrics(self) -> Dict[str, Any]:
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return {
+            **self.stats, "depth": depth, "capacity": self.max_backlog, "running": self.worker is not None,
+            "bound": self.engine is not None
+        }
+
+    async def _run(self) -> None:
+        await self.engine_ready.wait()
+        stopping = False
+        while not stopping:
+            row = await self.queue.get()
+            if row is None:
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            # Keep collecting until the batch is full or the flush interval elapses
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await asyncio.to_thread(self._write, batch)
+
+    def _insert(self, rows: list[Dict[str, Any]], run_hook: bool) -> None:
+        # executemany on a single INSERT; SQLAlchemy batches this into multi-row VALUES on Postgres
+        with self.engine.begin() as connection:
+            connection.execute(insert(self.table), rows)
+            if run_hook:
+                self.on_write(connection, rows)
+
+    def _write(self, rows: list[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            try:
+                self._insert(rows, run_hook=self.on_write is not None)
+            except Exception as e:
+                if self.on_write is None:
+                    raise
+                # The rows matter more than what is derived from them (which can be rebuilt): retry without the hook
+                self.stats["hook_failed"] += len(rows)
+                logger.error(f"Write hook failed for {len(rows)} {self.table.name} rows, writing them without it: {e}")
+                self._insert(rows, run_hook=False)
+        except Exception as e:
+            FLUSH_SECONDS.observe(time.perf_counter() - start, table=self.table.name, outcome="error")
+            self.stats["failed"] += len(rows)
+            logger.error(f"Failed to write {len(rows)} delivery ETA records: {e}")
+            return
+        FLUSH_SECONDS.observe(time.perf_counter() - start, table=self.table.name, outcome="ok")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["written"] += len(rows)
+        self.stats["batches"] += 1
+        self.stats["last_flush_rows"] = len(rows)
+        self.stats["last_flush_ms"] = round(elapsed_ms, 2)
+        logger.info(f"Flushed {len(rows)} delivery ETA records in {elapsed_ms:.1f} ms")
+
+
+# Function to bring existing tables up to the models: create_all only creates missing tables, so columns and
+# indexes added to a model later are added here. New columns must be nullable; this is not a migration tool.
+def upgrade_schema(engine: Engine, tables: list[Any]) -> None:
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
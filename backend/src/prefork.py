@@ -0,0 +1,267 @@
+"""Pre-fork server: the model is loaded once and shared by every worker.
+
+    python src/prefork.py --workers 4 --port 8000
+
+`uvicorn --workers N` starts N interpreters, and each one imports the app, loads the booster and preprocessor
+and warms its own caches. Here the supervisor imports the app and loads the model versions (and the offline
+routing graph, if configured) once. It then freezes the garbage collector so those objects are never written
+again, binds the listening socket and forks the workers. Imported modules, the booster and the compiled forest
+arrays stay shared copy-on-write, so an extra worker costs only the memory it allocates itself. The directions
+and weather caches are backed by a SQLite store shared by all workers (SHARED_CACHE_PATH, default
+cache/shared.sqlite3; put it on /dev/shm to keep it in memory), like the geocode store. A route or tile
+fetched by one worker is then a hit for all of them. The upstream call budgets (see quota.py) are split
+evenly between the workers, so together they stay within each provider's quota.
+
+The supervisor restarts workers that die and watches the model manifest every MODEL_WATCH_SECONDS. On a new
+version, or on SIGHUP (which /admin/reload-model sends), it loads the model and replaces the workers one at
+a time. SIGTERM/SIGINT stop the workers gracefully. Every PREFORK_MEMORY_LOG_SECONDS it logs each worker's
+RSS, proportional (PSS) and private memory. Private memory is the cost of one more worker; each worker also
+reports its own in /health and as eta_process_memory_bytes.
+
+Live delivery tracking keeps its state in the worker that registered the delivery, so /deliveries/* needs a
+single worker or sticky routing.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Any, Dict, Iterable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "10"))
+# How often per-worker memory is logged; 0 logs it only once, shortly after startup
+PREFORK_MEMORY_LOG_SECONDS = float(os.getenv("PREFORK_MEMORY_LOG_SECONDS", "300"))
+# How long a stopping worker may finish in-flight requests and streams before it is killed
+PREFORK_GRACEFUL_SECONDS = float(os.getenv("PREFORK_GRACEFUL_SECONDS", "30"))
+# How long a replacement worker gets to start before the worker it replaces is stopped
+PREFORK_BOOT_SECONDS = float(os.getenv("PREFORK_BOOT_SECONDS", "2"))
+
+# Set before the app is imported, since it reads its configuration at import. Workers leave the manifest to
+# the supervisor and use the shared stores. With one process per core, inference runs single-threaded rather
+# than oversubscribing the cores with OpenMP threads (which are also not safe to carry across a fork).
+os.environ["MODEL_WATCH_SECONDS"] = "0"
+os.environ["PREFORK_SUPERVISOR_PID"] = str(os.getpid())
+os.environ.setdefault("SHARED_CACHE_PATH", "cache/shared.sqlite3")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+import uvicorn  # noqa: E402
+
+from main import MODEL_DIR, app, preload_shared_state, readiness, registry, upstream_budgets  # noqa: E402
+from metrics import process_memory  # noqa: E402
+from model_store import load_model, manifest_mtime, read_manifest  # noqa: E402
+
+logger = logging.getLogger("prefork")
+
+
+def _mb(value: float) -> float:
+    return round(value / (1 << 20), 1)
+
+
+# Signal handler in a worker: exit at once, without the supervisor's cleanup. uvicorn replaces it while
+# serving and re-raises the signal that stopped it once it has shut down gracefully.
+def _exit_worker(*_: Any) -> None:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
+
+
+# Forks the workers and keeps them running. Signal handlers only set flags; run() acts on them.
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, size: int):
+        self.config = config
+        self.socket = config.bind_socket()
+        self.size = size
+        self.workers: Dict[int, float] = {}  # pid -> time.monotonic() at fork
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            self.serve()
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+        return pid
+
+    # Worker body: serve on the inherited socket until uvicorn shuts down; never returns
+    def serve(self) -> None:
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, _exit_worker)
+        # Startup times in /ready count from the fork, not from the supervisor's start
+        readiness.started = time.perf_counter()
+        try:
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            os._exit(1)
+        _exit_worker()
+
+    # Collect workers that exited on their own; returns their pids
+    def reap(self) -> list[int]:
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) is not None:
+                logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+                exited.append(pid)
+        return exited
+
+    # Ask workers to shut down gracefully and wait for them; any still running after the grace period are killed
+    def stop_workers(self, pids: Iterable[int]) -> None:
+        remaining = set(pids)
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + PREFORK_GRACEFUL_SECONDS + 5
+        while remaining:
+            for pid in list(remaining):
+                try:
+                    done = os.waitpid(pid, os.WNOHANG)[0] != 0
+                except ChildProcessError:
+                    done = True
+                if done:
+                    remaining.discard(pid)
+                    self.workers.pop(pid, None)
+            if remaining and time.monotonic() > deadline:
+                for pid in remaining:
+                    logger.warning(f"Worker {pid} did not stop in time; killing it")
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    self.workers.pop(pid, None)
+                break
+            time.sleep(0.1)
+
+    # Load the manifest's model version here, then replace the workers one at a time so every new worker
+    # shares it. If loading fails, the workers keep serving the current version.
+    def reload(self, force: bool) -> None:
+        manifest = read_manifest(MODEL_DIR)
+        current = registry.active
+        if manifest is None or (not force and current is not None and manifest["version"] == current.version):
+            return
+        try:
+            registry.active = load_model(MODEL_DIR)
+        except Exception as e:
+            logger.error(f"Model reload failed, keeping current version: {e}")
+            return
+        gc.freeze()
+        logger.info(f"Rolling workers onto model version {registry.active.version}")
+        for pid in list(self.workers):
+            if self.stopping:
+                return
+            self.spawn()
+            time.sleep(PREFORK_BOOT_SECONDS)
+            self.stop_workers([pid])
+
+    # Per-process memory of the supervisor and workers, in bytes
+    def memory_report(self) -> Dict[str, Any]:
+        workers = {pid: process_memory(pid) for pid in self.workers}
+        workers = {pid: memory for pid, memory in workers.items() if memory}
+        supervisor = process_memory()
+        private = [memory["private"] for memory in workers.values()]
+        return {
+            "supervisor": supervisor,
+            "workers": workers,
+            "total_pss": supervisor.get("pss", 0) + sum(m.get("pss", 0) for m in workers.values()),
+            "mean_worker_private": sum(private) / len(private) if private else None,
+        }
+
+    def log_memory(self) -> None:
+        report = self.memory_report()
+        for pid, memory in report["workers"].items():
+            logger.info(
+                f"Worker {pid}: rss {_mb(memory['rss'])} MB, pss {_mb(memory['pss'])} MB, "
+                f"shared {_mb(memory['shared'])} MB, private {_mb(memory['private'])} MB"
+            )
+        if report["mean_worker_private"] is not None:
+            logger.info(
+                f"{len(report['workers'])} worker(s): {_mb(report['total_pss'])} MB in total (PSS, with the supervisor), "
+                f"{_mb(report['mean_worker_private'])} MB private per worker"
+            )
+
+    def request_stop(self, *_: Any) -> None:
+        self.stopping = True
+
+    def request_reload(self, *_: Any) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        for _ in range(self.size):
+            self.spawn()
+
+        last_mtime = manifest_mtime(MODEL_DIR)
+        next_watch = time.monotonic() + MODEL_WATCH_SECONDS
+        # Workers settle (warm-ups done, first requests served) before the first report
+        next_memory_log = time.monotonic() + 30
+        while not self.stopping:
+            time.sleep(0.2)
+            for _ in self.reap():
+                if self.stopping:
+                    break
+                # A worker crashing during startup is retried after a pause rather than in a tight loop
+                time.sleep(1)
+                self.spawn()
+            now = time.monotonic()
+            if MODEL_WATCH_SECONDS > 0 and now >= next_watch:
+                next_watch = now + MODEL_WATCH_SECONDS
+                mtime = manifest_mtime(MODEL_DIR)
+                if mtime is not None and mtime != last_mtime:
+                    last_mtime = mtime
+                    self.reload(force=False)
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload(force=True)
+            if next_memory_log is not None and now >= next_memory_log:
+                self.log_memory()
+                next_memory_log = now + PREFORK_MEMORY_LOG_SECONDS if PREFORK_MEMORY_LOG_SECONDS > 0 else None
+
+        logger.info(f"Stopping {len(self.workers)} worker(s)")
+        self.stop_workers(list(self.workers))
+        self.socket.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one model")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        preload_shared_state()
+    except Exception as e:
+        logger.warning(f"Preloading failed, workers will load the model themselves: {e}")
+    # Everything loaded so far lives as long as the supervisor; frozen objects are skipped by the collector,
+    # which would otherwise write to their pages in every worker and unshare them
+    gc.collect()
+    gc.freeze()
+    upstream_budgets.share(args.workers)
+    logger.info(f"Preloaded in {(time.perf_counter() - start) * 1000:.0f} ms; forking {args.workers} worker(s)")
+
+    config = uvicorn.Config(
+        app, host=args.host, port=args.port, log_level=args.log_level, timeout_graceful_shutdown=PREFORK_GRACEFUL_SECONDS
+    )
+    Supervisor(config, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from resilience import request_deadline
+
+T = TypeVar("T")
+
+# Calls per second and burst size per provider. Google Maps web services allow 50 queries per second per
+# project by default, Nominatim's usage policy at most 1 request per second, and OpenWeather's free plan
+# 60 calls per minute.
+PROVIDER_LIMITS = {
+    "google": (float(os.getenv("GOOGLE_MAPS_RATE_PER_SECOND", "50")), float(os.getenv("GOOGLE_MAPS_BURST", "50"))),
+    "nominatim": (float(os.getenv("NOMINATIM_RATE_PER_SECOND", "1")), float(os.getenv("NOMINATIM_BURST", "1"))),
+    "openweather": (float(os.getenv("OPENWEATHER_RATE_PER_SECOND", "1")), float(os.getenv("OPENWEATHER_BURST", "10"))),
+}
+# Longest an interactive call waits for budget; beyond that the caller degrades (cache, offline routing,
+# default weather) instead of queuing
+UPSTREAM_MAX_WAIT_MS = float(os.getenv("UPSTREAM_MAX_WAIT_MS", "250"))
+# Background calls (cache warming, stale-while-revalidate refreshes) may queue longer, but only spend
+# tokens above this fraction of the burst, which is kept for interactive calls
+UPSTREAM_BACKGROUND_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_BACKGROUND_MAX_WAIT_SECONDS", "30"))
+UPSTREAM_BACKGROUND_RESERVE = float(os.getenv("UPSTREAM_BACKGROUND_RESERVE", "0.5"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Priority of upstream calls made from the current task; background loops set it once at their start
+upstream_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+# Function to wrap a coroutine function so its upstream calls are made at background priority, free of the
+# deadline of the request that started them
+def in_background(fn: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+    async def run() -> T:
+        upstream_priority.set(BACKGROUND)
+        request_deadline.set(None)
+        return await fn()
+    return run
+
+
+# Token bucket pacing one provider's calls, with a priority queue for callers waiting on it. A call is sent
+# at once when a token is free and nobody of the same or higher priority is waiting; otherwise it queues if
+# its expected wait fits its limit, and is refused (the caller degrades) if not. Waiters are released
+# interactive first, then in arrival order. Throttling responses halve the rate, and successes restore it
+# step by step (AIMD). Everything runs on the event loop, so no locking is needed.
+class ProviderBudget:
+    # Floor the adaptive rate backs off to, as a fraction of the configured rate, and the step it recovers by
+    MIN_RATE_FRACTION = 0.1
+    RECOVERY_FRACTION = 0.05
+
+    def __init__(
+        self, name: str, rate: float, burst: float, max_wait: float = UPSTREAM_MAX_WAIT_MS / 1000,
+        background_max_wait: float = UPSTREAM_BACKGROUND_MAX_WAIT_SECONDS,
+        background_reserve: float = UPSTREAM_BACKGROUND_RESERVE
+    ):
+        self.name = name
+        self.configured_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.background_reserve = background_reserve
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []  # heap of (priority, arrival, future)
+        self.arrivals = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {
+            f"{decision}_{priority}": 0
+            for decision in ("granted", "queued", "degraded") for priority in PRIORITY_NAMES.values()
+        }
+        self.stats["throttled"] = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Tokens a call of this priority must leave in the bucket. The reserve is capped so that a background call
+    # fits in a full bucket; with a burst of 1 (Nominatim, or any provider split across enough workers) there
+    # is nothing to reserve.
+    def _floor(self, priority: int) -> float:
+        return min(self.burst * self.background_reserve, self.burst - 1) if priority == BACKGROUND else 0.0
+
+    # Longest a call of this priority may wait for a token
+    def wait_limit(self, priority: int) -> float:
+        return self.max_wait if priority == INTERACTIVE else self.background_max_wait
+
+    # Wait for a token. Returns False, without waiting, when the expected wait exceeds max_wait (by default
+    # the priority's limit); the caller should then take its degraded path.
+    async def acquire(self, priority: int = INTERACTIVE, max_wait: Optional[float] = None) -> bool:
+        self._refill()
+        label = PRIORITY_NAMES[priority]
+        if max_wait is None:
+            max_wait = self.wait_limit(priority)
+        ahead = sum(1 for p, _, future in self.waiters if p <= priority and not future.done())
+        floor = self._floor(priority)
+        if ahead == 0 and self.tokens - 1 >= floor:
+            self.tokens -= 1
+            self.stats[f"granted_{label}"] += 1
+            return True
+        # A call needing more tokens than the bucket holds would never be released
+        if 1 + floor > self.burst or (ahead + 1 + floor - self.tokens) / self.rate > max_wait:
+            self.stats[f"degraded_{label}"] += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), future))
+        self.stats[f"queued_{label}"] += 1
+        # The new waiter may be due before whatever the pending release was timed for
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self._schedule()
+        await future
+        return True
+
+    def _schedule(self) -> None:
+        if self.timer is not None or not self.waiters:
+            return
+        delay = max(0.0, (1 + self._floor(self.waiters[0][0]) - self.tokens) / self.rate)
+        self.timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    # Hand free tokens to waiters in priority order; callers that gave up waiting are skipped
+    def _release(self) -> None:
+        self.timer = None
+        self._refill()
+        while self.waiters:
+            priority, _, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            if self.tokens - 1 < self._floor(priority) - 1e-9:
+                break
+            heapq.heappop(self.waiters)
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    # Adapt to the provider's answer: a throttling response halves the rate and empties the bucket, and each
+    # other call restores part of the configured rate
+    def record(self, throttled: bool) -> None:
+        self._refill()
+        if throttled:
+            self.rate = max(self.configured_rate * self.MIN_RATE_FRACTION, self.rate / 2)
+            self.tokens = 0.0
+            self.stats["throttled"] += 1
+        elif self.rate < self.configured_rate:
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate * self.RECOVERY_FRACTION)
+
+    def metrics(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            **self.stats,
+            "tokens": round(self.tokens, 2),
+            "burst": self.burst,
+            "rate_per_second": round(self.rate, 3),
+            "configured_rate_per_second": self.configured_rate,
+            "waiting": {
+                label: sum(1 for p, _, future in self.waiters if p == priority and not future.done())
+                for priority, label in PRIORITY_NAMES.items()
+            },
+        }
+
+
+# The budgets of every upstream provider
+class UpstreamScheduler:
+    def __init__(self, limits: Dict[str, tuple[float, float]] = PROVIDER_LIMITS):
+        self.budgets = {name: ProviderBudget(name, rate, burst) for name, (rate, burst) in limits.items()}
+
+    def __getitem__(self, name: str) -> ProviderBudget:
+        return self.budgets[name]
+
+    # Split each budget evenly between processes serving from the same quota, e.g. pre-forked workers
+    def share(self, processes: int) -> None:
+        for budget in self.budgets.values():
+            budget.configured_rate = budget.rate = budget.configured_rate / processes
+            budget.burst = budget.tokens = max(1.0, budget.burst / processes)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {name: budget.metrics() for name, budget in self.budgets.items()}
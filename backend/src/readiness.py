@@ -0,0 +1,54 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+# Startup state of each component warmed up in the background. The service is ready once every required
+# component is ready; optional ones (caches, probes, offline routing) are reported but never block traffic.
+class Readiness:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_ms: Optional[float] = None
+        self.components: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, name: str, required: bool = True) -> None:
+        self.components[name] = {"state": PENDING, "required": required, "ms": None, "error": None}
+
+    def mark(self, name: str, state: str, error: Optional[str] = None) -> None:
+        component = self.components[name]
+        if component["state"] != state:
+            component["ms"] = round((time.perf_counter() - self.started) * 1000, 1)
+        component["state"] = state
+        component["error"] = error
+        if self.ready and self.ready_ms is None:
+            self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+            logger.info(f"Service ready {self.ready_ms:.0f} ms after startup")
+
+    # Run a component's warm-up and record the outcome; failures are logged and reported, never raised
+    async def warm(self, name: str, warm_up: Callable[[], Awaitable[Optional[str]]]) -> None:
+        try:
+            state = await warm_up()
+        except Exception as e:
+            logger.warning(f"{name} warm-up failed:{e}")
+            self.mark(name, FAILED, str(e))
+            return
+        self.mark(name, state or READY)
+
+    @property
+    def ready(self) -> bool:
+        return all(c["state"] == READY for c in self.components.values() if c["required"])
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "ready_ms": self.ready_ms,
+            "uptime_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "components": self.components,
+        }
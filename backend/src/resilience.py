@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Time a request may spend on upstream calls in total; whatever is still missing when it runs out is filled in
+# from the fallbacks (offline routing, default weather)
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", "3000"))
+# Consecutive failures (timeouts, connection errors, 5xx) that open a provider's circuit, and how long it stays
+# open before one trial call is let through
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Absolute time.monotonic() by which the current request's upstream calls must finish; None for no deadline
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+# Function to get the seconds left before the current request's deadline, or None without one
+def time_left() -> Optional[float]:
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# Set a deadline for the upstream calls made inside the block, including by tasks it starts
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    token = request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+# Decorator to run an endpoint under a request deadline
+def within_deadline(seconds: float = REQUEST_DEADLINE_MS / 1000):
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with deadline(seconds):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Per-provider circuit breaker. After CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and
+# calls are refused at once (CircuitOpen), so requests go straight to their fallback instead of waiting out
+# a timeout. After CIRCUIT_RESET_SECONDS one trial call is let through (half-open): success closes the circuit,
+# failure opens it for another period. Answers that show the provider is up, even errors such as a rejected
+# key or a 429, count as successes.
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    # Whether a call may be sent now; an allowed call must be followed by record() or abandon()
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.trial_inflight:
+            self.trial_inflight = True
+            return True
+        self.stats["short_circuited"] += 1
+        return False
+
+    def record(self, failed: bool) -> None:
+        trial, self.trial_inflight = self.trial_inflight, False
+        if not failed:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self.state = self.CLOSED
+            return
+        self.failures += 1
+        if trial or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            if self.state == self.CLOSED:
+                logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+
+    # An allowed call that was never answered (cancelled, or not sent after all) says nothing about the
+    # provider; a half-open circuit lets the next call through as its trial
+    def abandon(self) -> None:
+        self.trial_inflight = False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
+
+
+# Hedged calls: the primary runs first, and if it has not answered within `delay` the backup is started
+# alongside it. The first success wins and the other call is cancelled. A primary that fails before the
+# delay goes straight to the backup.
+class Hedge:
+    def __init__(self, name: str, delay: float):
+        self.name = name
+        self.delay = delay
+        self.stats = {"calls": 0, "hedged": 0, "backup_won": 0, "fallbacks": 0, "failed": 0}
+
+    async def run(self, primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]]) -> T:
+        self.stats["calls"] += 1
+        tasks = [asyncio.ensure_future(primary())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay)
+            if done and tasks[0].exception() is None:
+                return tasks[0].result()
+            if done:
+                self.stats["fallbacks"] += 1
+                try:
+                    return await backup()
+                except Exception:
+                    self.stats["failed"] += 1
+                    raise
+
+            self.stats["hedged"] += 1
+            tasks.append(asyncio.ensure_future(backup()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self.stats["backup_won"] += 1
+                        return task.result()
+            # Both failed: the backup's error is the one callers handle (it is the last resort)
+            self.stats["failed"] += 1
+            raise tasks[1].exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "delay_ms": self.delay * 1000}
@@ -0,0 +1,78 @@
+from typing import Any, Dict, Hashable, Optional
+
+from metrics import InstrumentedTTLCache
+from spatial import grid_cell
+
+
+# Whole-response memoization for repeat trips. A trip is reduced to a quantized signature: the pickup and
+# drop-off grid cells, the rider and vehicle fields (age and rating rounded to a step), the order hour and
+# weekday the model sees, and the live context (weather tile and time bucket, which also bounds how stale the
+# cached route's traffic can be). Trips with the same signature get the same prediction without re-running
+# directions, weather and inference. Entries are evicted least-recently-used at capacity or after ttl seconds,
+# and everything is dropped when the model changes. A capacity of 0 disables the cache.
+class ETAResultCache:
+    def __init__(self, maxsize: int, ttl: float, cell_meters: float, age_step: int = 1, rating_step: float = 0.1):
+        self.entries = InstrumentedTTLCache(maxsize=maxsize, ttl=ttl) if maxsize > 0 else None
+        self.ttl = ttl
+        self.cell_meters = cell_meters
+        self.age_step = age_step
+        self.rating_step = rating_step
+        self.stats = {"invalidations": 0, "invalidated_entries": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.entries is not None
+
+    def signature(
+        self, restaurant: tuple[float, float], delivery: tuple[float, float], vehicle_type: str, vehicle_condition: int,
+        multiple_deliveries: int, age: int, rating: float, hour_of_day: int, day_of_week: int, context: Hashable
+    ) -> tuple:
+        return (
+            grid_cell(*restaurant, self.cell_meters),
+            grid_cell(*delivery, self.cell_meters),
+            vehicle_type.lower(),
+            vehicle_condition,
+            multiple_deliveries,
+            age // self.age_step,
+            round(rating / self.rating_step),
+            hour_of_day,
+            day_of_week,
+            context,
+        )
+
+    def get(self, signature: tuple) -> Optional[Dict[str, Any]]:
+        if self.entries is None:
+            return None
+        return self.entries.lookup(signature)
+
+    def put(self, signature: tuple, entry: Dict[str, Any]) -> None:
+        if self.entries is not None:
+            self.entries[signature] = entry
+
+    # Drop every entry, e.g. when a new model version is swapped in
+    def invalidate(self) -> None:
+        if self.entries is None:
+            return
+        self.stats["invalidations"] += 1
+        self.stats["invalidated_entries"] += len(self.entries)
+        # clear() pops entries one by one; these are invalidations, not capacity evictions
+        evictions = self.entries.stats["evictions"]
+        self.entries.clear()
+        self.entries.stats["evictions"] = evictions
+
+    def metrics(self) -> Dict[str, Any]:
+        if self.entries is None:
+            return {"enabled": False}
+        lookups = self.entries.stats["hits"] + self.entries.stats["misses"]
+        return {
+            "enabled": True,
+            **self.entries.stats,
+            **self.stats,
+            "hit_rate": round(self.entries.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "size": len(self.entries),
+            "capacity": self.entries.maxsize,
+            "ttl_seconds": self.ttl,
+            "cell_meters": self.cell_meters,
+            "age_step": self.age_step,
+            "rating_step": self.rating_step,
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+from persistence import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "2"))
+SHADOW_MAX_BACKLOG = int(os.getenv("SHADOW_MAX_BACKLOG", "1000"))
+# Number of recent scoring calls kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+# Shadow scoring: requests hand their feature columns to a bounded queue and return immediately; a pool of
+# workers scores them with the candidate model in threads and queues the predictions for the database.
+# A full queue drops the job, so the hot path never waits on the shadow model.
+class ShadowScorer:
+    def __init__(self, writer: WriteBehindQueue, workers: int = SHADOW_WORKERS, max_backlog: int = SHADOW_MAX_BACKLOG):
+        self.writer = writer
+        self.n_workers = workers
+        self.max_backlog = max_backlog
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: list[asyncio.Task] = []
+        self.active_latency_ms: deque = deque(maxlen=LATENCY_WINDOW)
+        self.shadow_latency_ms: deque = deque(maxlen=LATENCY_WINDOW)
+        self.abs_diff_sum = 0.0
+        self.stats: Dict[str, Any] = {"submitted": 0, "scored_rows": 0, "dropped": 0, "errors": 0}
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_backlog)
+        self.workers = [asyncio.create_task(self._run()) for _ in range(self.n_workers)]
+
+    async def stop(self) -> None:
+        if not self.workers:
+            return
+        # One sentinel per worker; jobs queued before them are still scored
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers)
+        self.workers = []
+
+    # Enqueue a scoring job without waiting; returns False if the shadow is not keeping up and the job was dropped
+    def submit(
+        self, model: Any, columns: Mapping[str, Sequence[Any]], prediction_ids: Sequence[str],
+        served_etas: Sequence[float], active_ms: Optional[float]
+    ) -> bool:
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait((model, columns, prediction_ids, served_etas, active_ms))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            job = await self.queue.get()
+            if job is None:
+                break
+            model, columns, prediction_ids, served_etas, active_ms = job
+            try:
+                predictions, shadow_ms = await asyncio.to_thread(self._score, model, columns)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Shadow model {model.version} failed to score: {e}")
+                continue
+
+            if active_ms is not None:
+                self.active_latency_ms.append(active_ms)
+            self.shadow_latency_ms.append(shadow_ms)
+            created_at = datetime.now(timezone.utc)
+            rows = []
+            for prediction_id, prediction, served in zip(prediction_ids, predictions, served_etas):
+                predicted_eta = max(1.0, min(float(prediction), 60.0))  # Same clamp as the served prediction
+                self.abs_diff_sum += abs(predicted_eta - served)
+                rows.append(dict(
+                    prediction_id=prediction_id,
+                    model_version=model.version,
+                    predicted_eta=predicted_eta,
+                    latency_ms=shadow_ms,
+                    created_at=created_at
+                ))
+            self.stats["scored_rows"] += len(rows)
+            await self.writer.put_many(rows)
+
+    @staticmethod
+    def _score(model: Any, columns: Mapping[str, Sequence[Any]]) -> tuple[np.ndarray, float]:
+        start = time.perf_counter()
+        predictions = model.predict(columns)
+        return predictions, (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def _percentiles(samples: deque) -> Dict[str, Optional[float]]:
+        if not samples:
+            return {"p50": None, "p95": None}
+        p50, p95 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 95])
+        return {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+
+    def metrics(self) -> Dict[str, Any]:
+        scored = self.stats["scored_rows"]
+        return {
+            **self.stats,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "workers": len(self.workers),
+            "mean_abs_diff_vs_served": round(self.abs_diff_sum / scored, 3) if scored else None,
+            "active_latency_ms": self._percentiles(self.active_latency_ms),
+            "shadow_latency_ms": self._percentiles(self.shadow_latency_ms),
+        }
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from resilience import DeadlineExceeded, time_left
+
+logger = logging.getLogger(__name__)
+
+
+# Request coalescing: concurrent callers asking for the same key share one in-flight upstream call.
+# All cache access stays on the event loop thread, so no locking is needed around the TTLCaches.
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "deadline_exceeded": 0, "background_refreshes": 0, "refresh_errors": 0}
+
+    def _start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self.inflight.get(key)
+        if task is None:
+            self.stats["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return task
+
+    # Run fn for key, or join the call already in flight; a cancelled caller does not cancel the shared call.
+    # The shared call runs under the deadline and priority of the caller that started it, possibly a background
+    # refresh with neither, so a caller joining it waits at most until its own deadline (DeadlineExceeded).
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        joining = key in self.inflight
+        task = self._start(key, fn)
+        left = time_left()
+        if not joining or left is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, left))
+        except asyncio.TimeoutError:
+            self.stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"{self.name} call in flight did not finish before the request deadline")
+
+    # Start fn for key in the background unless it is already in flight (stale-while-revalidate)
+    def refresh(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> None:
+        if key in self.inflight:
+            return
+        self.stats["background_refreshes"] += 1
+        task = self._start(key, fn)
+        task.add_done_callback(self._log_refresh_error)
+
+    def _log_refresh_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["refresh_errors"] += 1
+            logger.warning(f"Background {self.name} refresh failed: {task.exception()}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "inflight": len(self.inflight)}
@@ -0,0 +1,53 @@
+from math import radians, sin, cos, sqrt, asin, floor
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+# Length of one degree of latitude; grid cells are square in latitude degrees
+METERS_PER_DEGREE = 111_320
+
+
+# Function to calculate great-circle distance using the Haversine formula
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    dlng = lng2 - lng1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
+    return 2 * asin(sqrt(a)) * EARTH_RADIUS_KM
+
+
+# Function to calculate all pairwise great-circle distances between N origins and M destinations as an N x M array
+def haversine_matrix(
+    origin_lats: np.ndarray, origin_lngs: np.ndarray, dest_lats: np.ndarray, dest_lngs: np.ndarray
+) -> np.ndarray:
+    lat1 = np.radians(np.asarray(origin_lats, dtype=np.float64))[:, None]
+    lng1 = np.radians(np.asarray(origin_lngs, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(dest_lats, dtype=np.float64))[None, :]
+    lng2 = np.radians(np.asarray(dest_lngs, dtype=np.float64))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))) * EARTH_RADIUS_KM
+
+
+# Function to quantize a coordinate onto a grid of roughly cell_meters-sized cells
+def grid_cell(lat: float, lng: float, cell_meters: float) -> tuple[int, int]:
+    step = cell_meters / METERS_PER_DEGREE
+    return floor(lat / step), floor(lng / step)
+
+
+# Function to return the centre coordinate of a grid cell
+def cell_center(cell: tuple[int, int], cell_meters: float) -> tuple[float, float]:
+    step = cell_meters / METERS_PER_DEGREE
+    return (cell[0] + 0.5) * step, (cell[1] + 0.5) * step
+
+
+# Function to list a cell and its eight neighbours, the cell itself first
+def neighbor_cells(cell: tuple[int, int]) -> list[tuple[int, int]]:
+    row, col = cell
+    return [cell] + [(row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+# Function to list every grid cell intersecting a bounding box
+def cells_in_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float, cell_meters: float) -> list[tuple[int, int]]:
+    low = grid_cell(min_lat, min_lng, cell_meters)
+    high = grid_cell(max_lat, max_lng, cell_meters)
+    return [(row, col) for row in range(low[0], high[0] + 1) for col in range(low[1], high[1] + 1)]
@@ -0,0 +1,70 @@
+import argparse
+import json
+import logging
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Local stand-in for the OpenWeatherMap current-weather endpoint.
+# Point the API at it with OPENWEATHER_BASE_URL=http://127.0.0.1:<port> and any OPENWEATHER_API_KEY.
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    condition = "Clear"
+    latency = 0.0
+    error_rate = 0.0
+    requests_served = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        type(self).requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if url.path.rstrip("/") != "/weather" or "lat" not in query or "lon" not in query:
+            return self._send(404, {"cod": "404", "message": "not found"})
+        if random.random() < self.error_rate:
+            return self._send(503, {"cod": "503", "message": "stub failure"})
+        self._send(200, {
+            "coord": {"lat": float(query["lat"][0]), "lon": float(query["lon"][0])},
+            "weather": [{"main": self.condition}],
+            "main": {"temp": 28.0, "humidity": 60},
+            "wind": {"speed": 3.5},
+        })
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+# Function to create a stub server; port 0 picks a free port, read it back from server.server_address
+def create_stub_server(host: str = "127.0.0.1", port: int = 0, condition: str = "Clear",
+                       latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubWeatherHandler", (StubWeatherHandler,), {
+        "condition": condition, "latency": latency, "error_rate": error_rate,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenWeatherMap server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--condition", default="Clear", help="OpenWeather 'main' condition to report, e.g. Rain")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = create_stub_server(args.host, args.port, args.condition, args.latency, args.error_rate)
+    logger.info(f"Stub OpenWeather listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+
+# One client's stream. Only the latest update per delivery is kept, so a slow client skips intermediate ETAs
+# instead of building up a backlog.
+class Subscription:
+    def __init__(self, delivery_ids: Iterable[str]):
+        self.delivery_ids = set(delivery_ids)
+        self.updates: Dict[str, Dict[str, Any]] = {}
+        self.event = asyncio.Event()
+
+    def push(self, delivery_id: str, payload: Dict[str, Any]) -> None:
+        self.updates[delivery_id] = payload
+        self.event.set()
+
+    # Wait up to timeout seconds for updates; returns them (possibly none) and resets the stream
+    async def next(self, timeout: float) -> list[Dict[str, Any]]:
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        updates, self.updates = list(self.updates.values()), {}
+        self.event.clear()
+        return updates
+
+
+# An in-flight delivery: the request it was registered with, its geocoded endpoints, where the route currently
+# starts (the restaurant, then the rider's last reported position) and the inputs its current ETA was scored on
+class TrackedDelivery:
+    def __init__(
+        self, delivery_id: str, request: Any, restaurant: tuple[float, float], destination: tuple[float, float],
+        payload: Dict[str, Any], inputs: Hashable
+    ):
+        self.delivery_id = delivery_id
+        self.request = request
+        self.restaurant = restaurant
+        self.destination = destination
+        self.origin = restaurant
+        self.payload = payload
+        self.inputs: Optional[Hashable] = inputs
+        self.touched_at = time.monotonic()
+
+
+# Registry of tracked deliveries and the streams subscribed to them. Everything runs on the event loop, so no
+# locking is needed; recomputation itself lives with the prediction pipeline in main.py.
+class LiveTracker:
+    def __init__(self, max_deliveries: int, idle_seconds: float):
+        self.max_deliveries = max_deliveries
+        self.idle_seconds = idle_seconds
+        self.deliveries: Dict[str, TrackedDelivery] = {}
+        self.subscribers: Dict[str, set[Subscription]] = {}
+        self.stats = {
+            "registered": 0, "ended": 0, "expired": 0, "refreshes": 0, "recomputed": 0, "unchanged": 0,
+            "failed": 0, "pushed": 0,
+        }
+
+    def get(self, delivery_id: str) -> Optional[TrackedDelivery]:
+        return self.deliveries.get(delivery_id)
+
+    def add(self, delivery: TrackedDelivery) -> bool:
+        if delivery.delivery_id not in self.deliveries and len(self.deliveries) >= self.max_deliveries:
+            return False
+        self.deliveries[delivery.delivery_id] = delivery
+        self.stats["registered"] += 1
+        return True
+
+    # Stop tracking a delivery and tell its subscribers with a final event
+    def end(self, delivery_id: str, reason: str = "ended") -> Optional[TrackedDelivery]:
+        delivery = self.deliveries.pop(delivery_id, None)
+        if delivery is None:
+            return None
+        self.stats["ended" if reason == "ended" else "expired"] += 1
+        self.publish(delivery_id, {"delivery_id": delivery_id, "status": reason})
+        return delivery
+
+    # Stop tracking deliveries with no position update or new ETA for idle_seconds
+    def expire(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        for delivery_id in [d.delivery_id for d in self.deliveries.values() if d.touched_at < cutoff]:
+            self.end(delivery_id, reason="expired")
+
+    # Force every delivery to be rescored on its next refresh, e.g. after a model change
+    def invalidate(self) -> None:
+        for delivery in self.deliveries.values():
+            delivery.inputs = None
+
+    # Store a recomputed ETA and the inputs it was scored on, and push it to subscribers
+    def update(self, delivery: TrackedDelivery, payload: Dict[str, Any], inputs: Hashable) -> None:
+        delivery.payload = payload
+        delivery.inputs = inputs
+        delivery.touched_at = time.monotonic()
+        self.stats["recomputed"] += 1
+        self.publish(delivery.delivery_id, payload)
+
+    def publish(self, delivery_id: str, payload: Dict[str, Any]) -> None:
+        for subscription in self.subscribers.get(delivery_id, ()):
+            subscription.push(delivery_id, payload)
+            self.stats["pushed"] += 1
+
+    def subscribe(self, delivery_ids: Iterable[str]) -> Subscription:
+        subscription = Subscription(delivery_ids)
+        for delivery_id in subscription.delivery_ids:
+            self.subscribers.setdefault(delivery_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for delivery_id in subscription.delivery_ids:
+            subscribers = self.subscribers.get(delivery_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[delivery_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "tracked": len(self.deliveries),
+            "streams": len({s for subscribers in self.subscribers.values() for s in subscribers}),
+            "max_deliveries": self.max_deliveries,
+            "idle_seconds": self.idle_seconds,
+        }
@@ -1,11 +1,25 @@
+import os
+import json
+import time
 import pickle
+import hashlib
 import logging
+import argparse
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, Optional
+import xgboost as xgb
 from xgboost import XGBRegressor
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, select, func, MetaData, Table
+from sqlalchemy.engine import Engine
+from archive import ARCHIVE_DIR, iter_frames
+from model_store import VEHICLE_CONDITION_LABELS, export_model
 from sklearn.metrics import r2_score
 from sklearn.compose import ColumnTransformer
-from math import radians, sin, cos, sqrt, atan2
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
 
@@ -13,141 +27,597 @@ from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load data
-try:
-    df = pd.read_csv('data/corrected_modified_train.csv')
-    logger.info("Dataset loaded successfully")
-except FileNotFoundError:
-    logger.error("Dataset file not found")
-    raise
+load_dotenv()
 
-# Data cleaning
-df = df.rename(columns={
+DATA_PATH = os.getenv("TRAIN_DATA_PATH", "data/corrected_modified_train.csv")
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "data/feature_cache")
+# Rows read from the CSV (and written to Parquet) at a time; bounds memory during cleaning
+CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", "100000"))
+# Bump whenever the cleaning below changes so cached feature tables are rebuilt
+CLEANING_VERSION = 1
+
+RENAMED_COLUMNS = {
     "City": "City_area",
     "Weatherconditions": "Weather_conditions",
     "Time_taken(min)": "Time_taken"
-})
-
-# Extract temporal features
-df['Order_Date'] = pd.to_datetime(df['Order_Date'], format='%d-%m-%Y', errors='coerce')
-df['day_of_week'] = df['Order_Date'].dt.dayofweek.fillna(2)
-df['Time_Orderd'] = pd.to_datetime(df['Time_Orderd'], format='%H:%M', errors='coerce')
-
-# Log invalid Time_Orderd entries
-invalid_times = df['Time_Orderd'].isna().sum()
-# logger.info(f"Number of invalid or missing Time_Orderd entries: {invalid_times}")
-
-# Handle hour_of_day
-if df['Time_Orderd'].notna().any():
-    mode_hour = df['Time_Orderd'].dropna().mode()
-    default_hour = mode_hour.dt.hour[0] if not mode_hour.empty else 12
-else:
-    default_hour = 12  # Default to noon if all Time_Orderd are NaT
-    # logger.warning("All Time_Orderd values are invalid; using default hour: 12")
-
-df['hour_of_day'] = df['Time_Orderd'].dt.hour.fillna(default_hour)
+}
+DROPPED_COLUMNS = ["ID", "Delivery_person_ID", "Order_Date", "Time_Orderd", "Time_Order_picked", "Type_of_order"]
+COORDINATE_COLUMNS = [
+    "Restaurant_latitude", "Restaurant_longitude", "Delivery_location_latitude", "Delivery_location_longitude"
+]
+STRING_COLUMNS = ["Weather_conditions", "Road_traffic_density", "Vehicle_condition", "Type_of_vehicle", "Festival", "City_area"]
+MODE_FILL_COLUMNS = ["City_area", "Weather_conditions", "Road_traffic_density", "Festival", "Type_of_vehicle"]
+# Model inputs in the order the preprocessor is fitted (and the API builds them), then the target
+FEATURE_COLUMNS = [
+    "Delivery_person_Age", "Delivery_person_Ratings", "Weather_conditions", "Road_traffic_density",
+    "Vehicle_condition", "Type_of_vehicle", "multiple_deliveries", "Festival", "City_area",
+    "day_of_week", "hour_of_day", "distance_km"
+]
+TARGET_COLUMN = "Time_taken"
+MODEL_PATH = "models/xgb_model.pkl"
+PREPROCESSOR_PATH = "models/preprocessor.pkl"
 
-df = df.drop(columns=["ID", "Delivery_person_ID", "Order_Date", "Time_Orderd", 
-                      "Time_Order_picked", "Type_of_order"], axis=1)
+# Incremental retraining from production rows (delivery_eta joined with delivery_outcome)
+RETRAIN_STATE_PATH = os.getenv("RETRAIN_STATE_PATH", "models/retrain_state.json")
+RETRAIN_CACHE_DIR = os.getenv("RETRAIN_CACHE_DIR", "data/retrain_cache")
+RETRAIN_CHUNK_ROWS = int(os.getenv("RETRAIN_CHUNK_ROWS", "50000"))
+RETRAIN_ROUNDS = int(os.getenv("RETRAIN_ROUNDS", "50"))
+# Fewer new labelled rows than this and the run is skipped rather than fitting trees to noise
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "1000"))
 
-df['Weather_conditions'] = df['Weather_conditions'].str.split(" ").str[-1]
-df['Time_taken'] = df['Time_taken'].str.split(" ").str[-1].astype("int")
+FEATURE_SCHEMA = pa.schema(
+    [(name, pa.string() if name in STRING_COLUMNS else pa.float64()) for name in FEATURE_COLUMNS]
+    + [(TARGET_COLUMN, pa.float64())]
+)
 
 
-# Handle missing values and clean strings
-for col in df.select_dtypes(include="object"):
-    df[col] = df[col].apply(lambda x: x.strip().lower() if isinstance(x, str) else x)
-    df[col] = df[col].replace("nan", np.nan, regex=True)
+# Function to fingerprint the source CSV (content plus cleaning version) for the feature cache key
+def source_fingerprint(path: str) -> str:
+    digest = hashlib.blake2b(f"cleaning-v{CLEANING_VERSION}".encode(), digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-df['City_area'] = df['City_area'].replace('metropolitian', 'metropolitan')
 
-cols = ["City_area", "Weather_conditions", "Road_traffic_density", "Festival", "Type_of_vehicle"]
-for col in cols:
-    df[col] = df[col].fillna(df[col].mode()[0])
+# Function to apply a per-value cleaner to the distinct values of a column only, then map them back.
+# Every raw column is low-cardinality text, so this replaces a Python call per row with one per category.
+def map_distinct(values: pd.Series, fn: Callable[[str], Any]) -> pd.Series:
+    codes, uniques = pd.factorize(values)
+    cleaned = np.array([fn(value) for value in uniques] + [np.nan], dtype=object)
+    return pd.Series(cleaned[codes], index=values.index)  # code -1 (missing) picks the trailing NaN
 
-df['multiple_deliveries'] = df['multiple_deliveries'].fillna(df['multiple_deliveries'].mode()[0])
 
-df['Delivery_person_Age'] = df['Delivery_person_Age'].astype("float")
-df['Delivery_person_Ratings'] = df['Delivery_person_Ratings'].astype("float")
+# Function to normalize one raw string; any value containing "nan" counts as missing
+def clean_string(value: str) -> Any:
+    value = value.strip().lower()
+    return np.nan if "nan" in value else value
 
-null_count = df['Delivery_person_Age'].isnull().sum()
-min_value = df['Delivery_person_Age'].min()
-max_value = df['Delivery_person_Age'].max()
-uniform_age_ary = np.random.randint(min_value, max_value, null_count)
-null_indices = df[df['Delivery_person_Age'].isnull()].index
-df.loc[null_indices, 'Delivery_person_Age'] = uniform_age_ary
 
-df['Delivery_person_Ratings'] = df['Delivery_person_Ratings'].fillna(df['Delivery_person_Ratings'].median())
-df = df[df['Delivery_person_Ratings'] <= 5]
+# Function to keep the last space-separated token ("conditions sunny" -> "sunny")
+def last_token(value: Any) -> Any:
+    return value.split(" ")[-1] if isinstance(value, str) else value
 
-# Remove invalid coordinates
-df = df[~((df['Restaurant_latitude'] == 0.0) | (df['Restaurant_longitude'] == 0.0) | 
-          (df['Delivery_location_latitude'] == 0.0) | (df['Delivery_location_longitude'] == 0.0) |
-          (df['Restaurant_latitude'] < 0) | (df['Restaurant_longitude'] < 0) |
-          (df['Delivery_location_latitude'] < 0) | (df['Delivery_location_longitude'] < 0))]
 
-# Feature engineering: Haversine distance
+# Feature engineering: Haversine distance, vectorized over whole columns
 def haversine_distance(lat1, lon1, lat2, lon2):
     R = 6371
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
-df['distance_km'] = df.apply(lambda row: haversine_distance(
-    row['Restaurant_latitude'], row['Restaurant_longitude'],
-    row['Delivery_location_latitude'], row['Delivery_location_longitude']), axis=1)
 
-# Filter hyperlocal distances (<20 km)
-df = df[df['distance_km'] <= 20]
+# Dataset-wide statistics used to fill missing values, accumulated one chunk at a time
+class FillStatistics:
+    def __init__(self):
+        self.value_counts: Dict[str, pd.Series] = {}
+        self.age_min: Optional[float] = None
+        self.age_max: Optional[float] = None
+
+    def _count(self, name: str, values: pd.Series) -> None:
+        counts = values.value_counts()
+        previous = self.value_counts.get(name)
+        self.value_counts[name] = counts if previous is None else previous.add(counts, fill_value=0)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        for col in MODE_FILL_COLUMNS + ["multiple_deliveries", "Delivery_person_Ratings", "order_minute"]:
+            self._count(col, chunk[col])
+        ages = chunk["Delivery_person_Age"].dropna()
+        if not ages.empty:
+            self.age_min = ages.min() if self.age_min is None else min(self.age_min, ages.min())
+            self.age_max = ages.max() if self.age_max is None else max(self.age_max, ages.max())
+
+    # Most frequent value; ties go to the smallest value, as with pandas' mode()[0]
+    def mode(self, name: str) -> Any:
+        counts = self.value_counts[name]
+        return counts[counts == counts.max()].sort_index().index[0]
+
+    # Exact median from the value counts
+    def median(self, name: str) -> float:
+        counts = self.value_counts[name].sort_index()
+        cumulative = counts.cumsum().to_numpy()
+        total = int(cumulative[-1])
+        values = counts.index.to_numpy(dtype=np.float64)
+        lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+        upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+        return (lower + upper) / 2
+
+    def default_hour(self) -> int:
+        counts = self.value_counts.get("order_minute")
+        if counts is None or counts.empty:
+            return 12  # Default to noon if all Time_Orderd are NaT
+        return int(self.mode("order_minute")) // 60
+
+
+# Data cleaning for one raw CSV chunk: everything that does not need dataset-wide statistics
+def clean_chunk(df: pd.DataFrame, stats: FillStatistics) -> pd.DataFrame:
+    df = df.rename(columns=RENAMED_COLUMNS)
+
+    # Extract temporal features
+    order_date = pd.to_datetime(df['Order_Date'], format='%d-%m-%Y', errors='coerce')
+    df['day_of_week'] = order_date.dt.dayofweek.fillna(2)
+    time_orderd = pd.to_datetime(df['Time_Orderd'], format='%H:%M', errors='coerce')
+    df['hour_of_day'] = time_orderd.dt.hour
+    df['order_minute'] = time_orderd.dt.hour * 60 + time_orderd.dt.minute
+    df = df.drop(columns=DROPPED_COLUMNS)
+
+    # Handle missing values and clean strings
+    for col in df.select_dtypes(include="object"):
+        df[col] = map_distinct(df[col], clean_string)
+
+    df['Weather_conditions'] = map_distinct(df['Weather_conditions'], last_token)
+    df['Time_taken'] = map_distinct(df['Time_taken'], last_token).astype("float")
+    df['City_area'] = df['City_area'].replace('metropolitian', 'metropolitan')
+    for col in ["Delivery_person_Age", "Delivery_person_Ratings", "multiple_deliveries"]:
+        df[col] = df[col].astype("float")
+
+    stats.update(df)
+
+    # Ratings above 5 are dropped here; missing ratings are filled from the median and rechecked in the second pass
+    df = df[~(df['Delivery_person_Ratings'] > 5)]
+
+    # Remove invalid coordinates
+    coordinates = df[COORDINATE_COLUMNS]
+    df = df[(coordinates > 0).all(axis=1)]
+
+    df['distance_km'] = haversine_distance(
+        df['Restaurant_latitude'].to_numpy(), df['Restaurant_longitude'].to_numpy(),
+        df['Delivery_location_latitude'].to_numpy(), df['Delivery_location_longitude'].to_numpy()
+    )
+
+    # Filter hyperlocal distances (<20 km)
+    df = df[df['distance_km'] <= 20]
+    return df[FEATURE_COLUMNS + [TARGET_COLUMN]]
+
+
+# Fill missing values in a cleaned chunk from the dataset-wide statistics
+def fill_chunk(df: pd.DataFrame, stats: FillStatistics, rng: np.random.Generator) -> pd.DataFrame:
+    for col in MODE_FILL_COLUMNS + ["multiple_deliveries"]:
+        df[col] = df[col].fillna(stats.mode(col))
+    df['hour_of_day'] = df['hour_of_day'].fillna(stats.default_hour())
+    df['Delivery_person_Ratings'] = df['Delivery_person_Ratings'].fillna(stats.median("Delivery_person_Ratings"))
+
+    missing_age = df['Delivery_person_Age'].isna().to_numpy()
+    if missing_age.any():
+        ages = rng.integers(int(stats.age_min), int(stats.age_max), missing_age.sum())
+        df.loc[missing_age, 'Delivery_person_Age'] = ages
+    return df
+
+
+# Function to build (or reuse) the cleaned feature table for a source CSV; returns the Parquet path.
+# Pass 1 streams the CSV, cleans each chunk and gathers fill statistics into a staging file;
+# pass 2 streams the staging file, fills missing values and writes the final table.
+def build_feature_table(
+    csv_path: str = DATA_PATH, cache_dir: str = FEATURE_CACHE_DIR, chunk_rows: int = CHUNK_ROWS
+) -> str:
+    fingerprint = source_fingerprint(csv_path)
+    feature_path = os.path.join(cache_dir, f"features-{fingerprint}.parquet")
+    if os.path.exists(feature_path):
+        logger.info(f"Using cached feature table {feature_path}")
+        return feature_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    staging_path = f"{feature_path}.staging"
+    partial_path = f"{feature_path}.partial"
+    start = time.perf_counter()
+    stats = FillStatistics()
+    rows_read = 0
+    try:
+        with pq.ParquetWriter(staging_path, FEATURE_SCHEMA) as writer:
+            # Coordinates are numeric; everything else is read as text so each chunk gets the same dtypes
+            dtypes = defaultdict(lambda: str, {col: "float64" for col in COORDINATE_COLUMNS})
+            for chunk in pd.read_csv(csv_path, dtype=dtypes, chunksize=chunk_rows):
+                rows_read += len(chunk)
+                cleaned = clean_chunk(chunk, stats)
+                writer.write_table(pa.Table.from_pandas(cleaned, schema=FEATURE_SCHEMA, preserve_index=False))
+        if rows_read == 0:
+            raise ValueError(f"Dataset {csv_path} is empty")
+
+        rng = np.random.default_rng(CLEANING_VERSION)
+        rows_written = 0
+        with pq.ParquetWriter(partial_path, FEATURE_SCHEMA) as writer:
+            for batch in pq.ParquetFile(staging_path).iter_batches(batch_size=chunk_rows):
+                filled = fill_chunk(batch.to_pandas(), stats, rng)
+                filled = filled[filled['Delivery_person_Ratings'] <= 5]
+                rows_written += len(filled)
+                writer.write_table(pa.Table.from_pandas(filled, schema=FEATURE_SCHEMA, preserve_index=False))
+        os.replace(partial_path, feature_path)
+    finally:
+        for path in (staging_path, partial_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    logger.info(
+        f"Feature table built from {rows_read} rows ({rows_written} kept) in "
+        f"{time.perf_counter() - start:.1f}s: {feature_path}"
+    )
+    return feature_path
+
+
+# Function to load the cached feature table with compact dtypes for training
+def load_feature_table(feature_path: str) -> pd.DataFrame:
+    df = pd.read_parquet(feature_path)
+    for col in STRING_COLUMNS:
+        df[col] = df[col].astype("category")
+    float_columns = [col for col in FEATURE_COLUMNS if col not in STRING_COLUMNS]
+    df[float_columns] = df[float_columns].astype("float32")
+    return df
 
-df = df.drop(['Restaurant_latitude', 'Restaurant_longitude', 
-              'Delivery_location_latitude', 'Delivery_location_longitude'], axis=1)
 
 # Preprocessing
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('ohe', OneHotEncoder(drop='first'), ['Type_of_vehicle', 'Festival', 'Vehicle_condition']),
-        ('oe1', OrdinalEncoder(categories=[['low', 'medium', 'high', 'jam']]), ['Road_traffic_density']),
-        ('oe2', OrdinalEncoder(categories=[['sunny', 'cloudy', 'windy', 'fog', 'sandstorms', 'stormy']]), ['Weather_conditions']),
-        ('oe3', OrdinalEncoder(categories=[['semi-urban', 'urban', 'metropolitan']]), ['City_area']),
-        ('scaler', StandardScaler(), ['Delivery_person_Age', 'Delivery_person_Ratings', 'multiple_deliveries', 
-                                      'distance_km', 'hour_of_day', 'day_of_week'])
-    ],
-    remainder='passthrough'
-)
+def build_preprocessor() -> ColumnTransformer:
+    return ColumnTransformer(
+        transformers=[
+            ('ohe', OneHotEncoder(drop='first'), ['Type_of_vehicle', 'Festival', 'Vehicle_condition']),
+            ('oe1', OrdinalEncoder(categories=[['low', 'medium', 'high', 'jam']]), ['Road_traffic_density']),
+            ('oe2', OrdinalEncoder(categories=[['sunny', 'cloudy', 'windy', 'fog', 'sandstorms', 'stormy']]), ['Weather_conditions']),
+            ('oe3', OrdinalEncoder(categories=[['semi-urban', 'urban', 'metropolitan']]), ['City_area']),
+            ('scaler', StandardScaler(), ['Delivery_person_Age', 'Delivery_person_Ratings', 'multiple_deliveries',
+                                          'distance_km', 'hour_of_day', 'day_of_week'])
+        ],
+        remainder='passthrough'
+    )
 
-X = df.drop('Time_taken', axis=1)
-Y = df['Time_taken']
-X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.25, random_state=7)
-
-# Compute sample weights for hyperlocal focus
-sample_weights = np.where(X_train['distance_km'] <= 2, 2.0, 1.0)
-
-X_train_prepared = preprocessor.fit_transform(X_train)
-X_test_prepared = preprocessor.transform(X_test)
-
-# Train XGBoost model with tuned hyperparameters
-xgb_model = XGBRegressor(
-    objective='reg:squarederror',
-    random_state=42,
-    learning_rate=0.05,
-    n_estimators=300,
-    max_depth=5,
-    subsample=0.8,
-    colsample_bytree=0.8
-)
-xgb_model.fit(X_train_prepared, Y_train, sample_weight=sample_weights)
-y_pred_xgb = xgb_model.predict(X_test_prepared)
-r2 = r2_score(Y_test, y_pred_xgb)
-print(f"XGBoost R² Score: {r2}")
-
-# Save model and preprocessor
-with open("models/xgb_model.pkl", "wb") as f:
-    pickle.dump(xgb_model, f)
-with open("models/preprocessor.pkl", "wb") as f:
-    pickle.dump(preprocessor, f)
-
-logger.info(f"Model trained and saved with R² Score: {r2}")
\ No newline at end of file
+
+# Function to fit the preprocessor and XGBoost model; returns (model, preprocessor, test R²)
+def train(df: pd.DataFrame) -> tuple[XGBRegressor, ColumnTransformer, float]:
+    X = df[FEATURE_COLUMNS]
+    Y = df[TARGET_COLUMN]
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.25, random_state=7)
+
+    # Compute sample weights for hyperlocal focus
+    sample_weights = np.where(X_train['distance_km'] <= 2, 2.0, 1.0)
+
+    preprocessor = build_preprocessor()
+    X_train_prepared = preprocessor.fit_transform(X_train)
+    X_test_prepared = preprocessor.transform(X_test)
+
+    # Train XGBoost model with tuned hyperparameters
+    xgb_model = XGBRegressor(
+        objective='reg:squarederror',
+        random_state=42,
+        learning_rate=0.05,
+        n_estimators=300,
+        max_depth=5,
+        subsample=0.8,
+        colsample_bytree=0.8
+    )
+    xgb_model.fit(X_train_prepared, Y_train, sample_weight=sample_weights)
+    y_pred_xgb = xgb_model.predict(X_test_prepared)
+    return xgb_model, preprocessor, r2_score(Y_test, y_pred_xgb)
+
+
+# Function to resolve the database URL the API writes predictions to
+def database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL environment variable is not set")
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+# Function to map a fitted preprocessor's categorical columns to the categories it accepts
+def known_categories(preprocessor: ColumnTransformer) -> Dict[str, set]:
+    known = {}
+    for _, transformer, columns in preprocessor.transformers_:
+        for column, categories in zip(columns, getattr(transformer, "categories_", [])):
+            known[column] = set(categories)
+    return known
+
+
+# Function to turn labelled delivery_eta rows (from the table or the archive) into model inputs, built the
+# same way the API builds them
+def outcome_features(raw: pd.DataFrame) -> pd.DataFrame:
+    order_time = pd.to_datetime(raw["order_time"], utc=True, errors="coerce")
+    return pd.DataFrame({
+        "Delivery_person_Age": raw["delivery_person_age"].astype("float"),
+        "Delivery_person_Ratings": raw["delivery_person_rating"].astype("float"),
+        "Weather_conditions": raw["weather_condition"],
+        "Road_traffic_density": raw["traffic_density"],
+        "Vehicle_condition": raw["vehicle_condition"].map(VEHICLE_CONDITION_LABELS),
+        "Type_of_vehicle": raw["vehicle_type"].str.lower(),
+        "multiple_deliveries": raw["multiple_deliveries"].astype("float"),
+        "Festival": np.where(raw["is_festival"].astype(bool), "yes", "no"),
+        "City_area": "metropolitan",
+        # Defaults match the API: noon on a Wednesday when no order time was sent
+        "day_of_week": order_time.dt.dayofweek.fillna(2),
+        "hour_of_day": order_time.dt.hour.fillna(12),
+        "distance_km": raw["distance_km"].astype("float"),
+        TARGET_COLUMN: raw["actual_minutes"].astype("float"),
+    })
+
+
+# Columns read for retraining, from delivery_eta or the archive
+OUTCOME_ROW_COLUMNS = [
+    "delivery_person_age", "delivery_person_rating", "weather_condition", "traffic_density", "vehicle_condition",
+    "vehicle_type", "multiple_deliveries", "is_festival", "order_time", "distance_km", "actual_minutes"
+]
+
+
+# Function to collect labelled rows that were archived (and deleted from delivery_eta) before retraining saw
+# them: archived rows whose outcome id is past the watermark. Rows still in the table (archived with --keep, or
+# by a run interrupted before deleting) are left to the table query. These are the rows labelled since the last
+# run that have also aged out, so they are few and held in memory. An outcome recorded after its prediction
+# was archived joins nothing and is not learned from.
+def archived_outcome_rows(
+    engine: Engine, after_outcome_id: int, max_outcome_id: int, archive_dir: str = ARCHIVE_DIR
+) -> pd.DataFrame:
+    eta = Table("delivery_eta", MetaData(), autoload_with=engine)
+    frames = []
+    for frame in iter_frames(archive_dir, columns=["id", "outcome_id", *OUTCOME_ROW_COLUMNS], labelled_only=True):
+        frame = frame[(frame["outcome_id"] > after_outcome_id) & (frame["outcome_id"] <= max_outcome_id)]
+        if frame.empty:
+            continue
+        live = set()
+        with engine.connect() as connection:
+            ids = frame["id"].astype(int).tolist()
+            for start in range(0, len(ids), 5000):
+                live.update(connection.execute(select(eta.c.id).where(eta.c.id.in_(ids[start:start + 5000]))).scalars())
+        frames.append(frame[~frame["id"].isin(live)])
+    if not frames:
+        return pd.DataFrame(columns=OUTCOME_ROW_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[OUTCOME_ROW_COLUMNS]
+
+
+# Streams labelled production rows from the database in bounded chunks into an external-memory DMatrix,
+# followed by the labelled rows already moved to the archive. Rows are selected by delivery_outcome id, the
+# order labels arrive in, so an outcome recorded for an old prediction after a run is still picked up by the
+# next one. Rows go through a server-side cursor (stream_results) and XGBoost pages each chunk to disk, so
+# memory stays flat however large the table is. XGBoost may iterate more than once; every pass re-runs the
+# query over the same fixed outcome id range.
+class OutcomeRowIter(xgb.DataIter):
+    def __init__(
+        self, engine: Engine, preprocessor: ColumnTransformer, after_outcome_id: int, max_outcome_id: int,
+        chunk_rows: int, cache_prefix: str, archived: Optional[pd.DataFrame] = None
+    ):
+        super().__init__(cache_prefix=cache_prefix)
+        self.engine = engine
+        self.preprocessor = preprocessor
+        self.known = known_categories(preprocessor)
+        self.after_outcome_id = after_outcome_id
+        self.max_outcome_id = max_outcome_id
+        self.archived = archived if archived is not None else pd.DataFrame(columns=OUTCOME_ROW_COLUMNS)
+        self.chunk_rows = chunk_rows
+        self.connection = None
+        self.partitions = None
+        self.archive_offset = 0
+        self.passes = 0
+        self.rows = 0
+        self.skipped = 0
+
+    def _query(self):
+        metadata = MetaData()
+        eta = Table("delivery_eta", metadata, autoload_with=self.engine)
+        outcome = Table("delivery_outcome", metadata, autoload_with=self.engine)
+        return (
+            select(*(eta.c[name] for name in OUTCOME_ROW_COLUMNS if name != "actual_minutes"), outcome.c.actual_minutes)
+            .join_from(eta, outcome, eta.c.prediction_id == outcome.c.prediction_id)
+            .where(outcome.c.id > self.after_outcome_id, outcome.c.id <= self.max_outcome_id)
+            .order_by(outcome.c.id)
+        )
+
+    # Raw row chunks: the table's, then the archived rows
+    def _chunks(self) -> Iterator[pd.DataFrame]:
+        for rows in self.partitions:
+            yield pd.DataFrame(rows, columns=OUTCOME_ROW_COLUMNS)
+        while self.archive_offset < len(self.archived):
+            chunk = self.archived.iloc[self.archive_offset:self.archive_offset + self.chunk_rows]
+            self.archive_offset += self.chunk_rows
+            yield chunk
+
+    def next(self, input_data: Callable) -> int:
+        if self.partitions is None:
+            self.passes += 1
+            self.connection = self.engine.connect().execution_options(yield_per=self.chunk_rows)
+            self.partitions = self.connection.execute(self._query()).partitions()
+            self.archive_offset = 0
+            self.chunks = self._chunks()
+        for raw in self.chunks:
+            df = outcome_features(raw)
+            # Rows with categories the fitted preprocessor has never seen cannot be encoded
+            valid = np.ones(len(df), dtype=bool)
+            for column, categories in self.known.items():
+                valid &= df[column].isin(categories).to_numpy()
+            if self.passes == 1:
+                self.rows += int(valid.sum())
+                self.skipped += int((~valid).sum())
+            df = df[valid]
+            if df.empty:
+                continue
+            X = self.preprocessor.transform(df[FEATURE_COLUMNS])
+            # Same hyperlocal weighting as the full training run
+            weights = np.where(df['distance_km'] <= 2, 2.0, 1.0)
+            input_data(data=X, label=df[TARGET_COLUMN].to_numpy(), weight=weights)
+            return 1
+        self._close()
+        return 0
+
+    def reset(self) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.partitions = None
+
+
+# Function to read the retraining watermark: the last delivery_outcome id already learned from
+def load_retrain_state(path: str = RETRAIN_STATE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"last_outcome_id": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Function to carry a state file written with the old watermark (the highest labelled delivery_eta id learned
+# from) over to outcome ids. Every row labelled by that run had an id at or below it, so any outcome for a
+# higher id came after the run: the watermark goes just below the first of those. Without one, it is the
+# newest outcome among the rows the run covered.
+def migrate_retrain_state(engine: Engine, state: Dict[str, Any]) -> Dict[str, Any]:
+    if "last_outcome_id" in state:
+        return state
+    metadata = MetaData()
+    eta = Table("delivery_eta", metadata, autoload_with=engine)
+    outcome = Table("delivery_outcome", metadata, autoload_with=engine)
+    last_id = state.get("last_id", 0)
+    labelled = select(func.min(outcome.c.id), func.max(outcome.c.id)).join_from(
+        eta, outcome, eta.c.prediction_id == outcome.c.prediction_id
+    )
+    with engine.connect() as connection:
+        first_after, _ = connection.execute(labelled.where(eta.c.id > last_id)).one()
+        _, last_before = connection.execute(labelled.where(eta.c.id <= last_id)).one()
+    last_outcome_id = first_after - 1 if first_after is not None else last_before or 0
+    return {**state, "last_outcome_id": int(last_outcome_id)}
+
+
+# Function to continue boosting the saved model on production rows recorded since the last run
+def retrain_incremental(
+    engine: Engine, rounds: int = RETRAIN_ROUNDS, chunk_rows: int = RETRAIN_CHUNK_ROWS,
+    min_rows: int = RETRAIN_MIN_ROWS, state_path: str = RETRAIN_STATE_PATH, archive_dir: str = ARCHIVE_DIR
+) -> Optional[Dict[str, Any]]:
+    start = time.perf_counter()
+    with open(MODEL_PATH, "rb") as f:
+        xgb_model = pickle.load(f)
+    with open(PREPROCESSOR_PATH, "rb") as f:
+        preprocessor = pickle.load(f)
+
+    state = migrate_retrain_state(engine, load_retrain_state(state_path))
+    after = state["last_outcome_id"]
+    metadata = MetaData()
+    eta = Table("delivery_eta", metadata, autoload_with=engine)
+    outcome = Table("delivery_outcome", metadata, autoload_with=engine)
+    with engine.connect() as connection:
+        # Outcomes recorded from here on belong to the next run
+        max_outcome_id = connection.execute(select(func.max(outcome.c.id))).scalar() or 0
+        new_rows = connection.execute(
+            select(func.count())
+            .join_from(eta, outcome, eta.c.prediction_id == outcome.c.prediction_id)
+            .where(outcome.c.id > after, outcome.c.id <= max_outcome_id)
+        ).scalar()
+    archived = archived_outcome_rows(engine, after, max_outcome_id, archive_dir)
+    new_rows += len(archived)
+    if new_rows < min_rows:
+        logger.info(f"Only {new_rows} new labelled rows since outcome id {after}; need {min_rows}, skipping")
+        return None
+
+    os.makedirs(RETRAIN_CACHE_DIR, exist_ok=True)
+    rows = OutcomeRowIter(
+        engine, preprocessor, after, max_outcome_id, chunk_rows, os.path.join(RETRAIN_CACHE_DIR, "outcomes"), archived
+    )
+    dtrain = xgb.DMatrix(rows)
+    if rows.rows == 0:
+        logger.info("No new rows could be encoded by the current preprocessor, skipping")
+        return None
+
+    booster = xgb_model.get_booster()
+    params = {key: value for key, value in xgb_model.get_xgb_params().items() if value is not None}
+    params["tree_method"] = "hist"  # Required for external-memory training
+    # eval() returns e.g. "[0]\tnew-rmse:4.21"; both are measured on the rows just learned from
+    rmse_before = float(booster.eval(dtrain, "new").rsplit(":", 1)[-1])
+    booster = xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=booster)
+    rmse_after = float(booster.eval(dtrain, "new").rsplit(":", 1)[-1])
+    xgb_model.load_model(bytearray(booster.save_raw("json")))
+
+    # Save and publish the model first: if that fails the watermark is untouched and the rows are retried next run.
+    # Publishing the native artifacts is what running servers pick up (manifest watch or /admin/reload-model).
+    with open(MODEL_PATH, "wb") as f:
+        pickle.dump(xgb_model, f)
+    export_model(xgb_model, preprocessor, os.path.dirname(MODEL_PATH), metrics={
+        "source": "incremental", "rows": rows.rows, "rmse_before": rmse_before, "rmse_after": rmse_after
+    })
+    elapsed = time.perf_counter() - start
+    report = {
+        "last_outcome_id": int(max_outcome_id),
+        "rows": rows.rows,
+        "archived_rows": len(archived),
+        "skipped_rows": rows.skipped,
+        "rounds": rounds,
+        "total_trees": booster.num_boosted_rounds(),
+        "wall_time_s": round(elapsed, 2),
+        "rows_per_s": round(rows.rows / elapsed, 1),
+        "rmse_before": rmse_before,
+        "rmse_after": rmse_after,
+        "trained_at": pd.Timestamp.now(tz="UTC").isoformat(),
+    }
+    with open(state_path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(
+        f"Incremental retrain: {rows.rows} rows ({rows.skipped} skipped, {len(archived)} from the archive) "
+        f"up to outcome id {max_outcome_id}, "
+        f"+{rounds} rounds in {elapsed:.1f}s ({report['rows_per_s']} rows/s); "
+        f"RMSE {rmse_before:.3f} -> {rmse_after:.3f}"
+    )
+    return report
+
+
+def train_from_csv() -> None:
+    # Load data
+    if not os.path.exists(DATA_PATH):
+        logger.error("Dataset file not found")
+        raise FileNotFoundError(DATA_PATH)
+
+    start = time.perf_counter()
+    feature_path = build_feature_table(DATA_PATH)
+    df = load_feature_table(feature_path)
+    logger.info(f"Feature table loaded: {len(df)} rows, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+
+    train_start = time.perf_counter()
+    xgb_model, preprocessor, r2 = train(df)
+    print(f"XGBoost R² Score: {r2}")
+
+    # Save model and preprocessor
+    with open(MODEL_PATH, "wb") as f:
+        pickle.dump(xgb_model, f)
+    with open(PREPROCESSOR_PATH, "wb") as f:
+        pickle.dump(preprocessor, f)
+    export_model(xgb_model, preprocessor, os.path.dirname(MODEL_PATH), metrics={"source": "csv", "r2": float(r2)})
+
+    logger.info(
+        f"Model trained and saved with R² Score: {r2} "
+        f"(features {train_start - start:.1f}s, training {time.perf_counter() - train_start:.1f}s)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the delivery ETA model")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="continue boosting the saved model on new labelled rows from the database instead of the CSV"
+    )
+    parser.add_argument("--rounds", type=int, default=RETRAIN_ROUNDS, help="boosting rounds to add (--incremental)")
+    parser.add_argument("--chunk-rows", type=int, default=RETRAIN_CHUNK_ROWS, help="rows fetched per database chunk")
+    args = parser.parse_args()
+
+    if args.incremental:
+        retrain_incremental(create_engine(database_url()), rounds=args.rounds, chunk_rows=args.chunk_rows)
+    else:
+        train_from_csv()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import logging
+import time
+from typing import Awaitable, Optional, Dict, Any, TypeVar
+
+import httpx
+
+from metrics import REGISTRY, Counter, Histogram
+from quota import BudgetExhausted, ProviderBudget, upstream_priority
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, time_left
+
+logger = logging.getLogger(__name__)
+# httpx logs full request URLs at INFO, which would leak API keys
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com/maps/api")
+NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# Connection pool shared by every upstream client; keep-alive connections are reused across requests
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+
+UPSTREAM_CALLS = REGISTRY.register(Counter(
+    "eta_upstream_calls_total", "Upstream API calls by provider, endpoint and outcome", ("provider", "endpoint", "outcome")
+))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    "eta_upstream_duration_seconds", "Upstream API call latency by provider", ("provider",)
+))
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    pass
+
+
+# The provider refused the call because a quota or rate limit was exceeded
+class UpstreamThrottled(UpstreamError):
+    pass
+
+
+# Function to classify a failed upstream call for the outcome label
+def upstream_outcome(error: Exception) -> str:
+    if isinstance(error, UpstreamThrottled) or (
+        isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429
+    ):
+        return "throttled"
+    if isinstance(error, UpstreamError):
+        return "rejected"  # Answered, but with an error status in the body
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    if isinstance(error, httpx.TransportError):
+        return "connection_error"
+    return "error"
+
+
+# Outcomes that suggest the provider is down or overloaded, as opposed to answering with an error
+CIRCUIT_FAILURES = {"timeout", "connection_error", "http_5xx", "deadline_exceeded"}
+
+
+# Function to decide whether a call may be sent: not past the request's deadline, the provider's circuit not
+# open, and a budget token due in time. Raises the reason otherwise; the call is then never sent.
+async def admit(provider: str, budget: Optional[ProviderBudget], breaker: Optional[CircuitBreaker]) -> None:
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"No time left for a {provider} call")
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpen(f"{provider} circuit is open")
+    if budget is None:
+        return
+    try:
+        max_wait = budget.wait_limit(upstream_priority.get())
+        granted = await budget.acquire(upstream_priority.get(), max_wait if left is None else min(max_wait, left))
+    except BaseException:
+        if breaker is not None:
+            breaker.abandon()
+        raise
+    if not granted:
+        if breaker is not None:
+            breaker.abandon()
+        raise BudgetExhausted(f"{provider} call budget exhausted")
+
+
+# Function to await an upstream call, recording its latency and outcome. The call is only sent once admitted
+# (see admit) and is cut off at the request's deadline with DeadlineExceeded. The provider's answer then
+# adapts the budget's rate and the circuit breaker.
+async def observed(
+    provider: str, endpoint: str, call: Awaitable[T], budget: Optional[ProviderBudget] = None,
+    breaker: Optional[CircuitBreaker] = None
+) -> T:
+    try:
+        await admit(provider, budget, breaker)
+    except BaseException as e:
+        call.close()
+        if isinstance(e, (DeadlineExceeded, CircuitOpen, BudgetExhausted)):
+            outcome = {DeadlineExceeded: "deadline_exceeded", CircuitOpen: "circuit_open", BudgetExhausted: "budget_exhausted"}
+            UPSTREAM_CALLS.inc(provider=provider, endpoint=endpoint, outcome=outcome[type(e)])
+        raise
+
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        left = time_left()
+        if left is None:
+            return await call
+        try:
+            return await asyncio.wait_for(call, max(left, 0))
+        except asyncio.TimeoutError as e:
+            outcome = "deadline_exceeded"
+            raise DeadlineExceeded(f"{provider} {endpoint} did not answer before the request deadline") from e
+    except Exception as e:
+        if outcome == "ok":
+            outcome = upstream_outcome(e)
+        raise
+    except BaseException:
+        outcome = "cancelled"
+        raise
+    finally:
+        UPSTREAM_CALLS.inc(provider=provider, endpoint=endpoint, outcome=outcome)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, provider=provider)
+        if budget is not None and outcome != "cancelled":
+            budget.record(throttled=outcome == "throttled")
+        if breaker is not None:
+            if outcome == "cancelled":
+                breaker.abandon()
+            else:
+                breaker.record(failed=outcome in CIRCUIT_FAILURES)
+
+
+# Function to create the pooled async HTTP client used by all upstream calls
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, pool=30.0),
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+        headers={"User-Agent": "delivery_eta"},
+    )
+
+
+# Async Google Maps client returning the same result shapes as googlemaps.Client
+class GoogleMapsClient:
+    def __init__(
+        self, http: httpx.AsyncClient, api_key: str, base_url: str = GOOGLE_MAPS_BASE_URL,
+        budget: Optional[ProviderBudget] = None, breaker: Optional[CircuitBreaker] = None
+    ):
+        self.http = http
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.budget = budget
+        self.breaker = breaker
+
+    async def _get(self, path: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        return await observed("google", path.split("/")[0], self._fetch(path, params, timeout), self.budget, self.breaker)
+
+    async def _fetch(self, path: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        params = {**params, "key": self.api_key}
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        response = await self.http.get(f"{self.base_url}/{path}", params=params, **kwargs)
+        response.raise_for_status()
+        data = response.json()
+        status = data.get("status")
+        if status == "OVER_QUERY_LIMIT":
+            raise UpstreamThrottled(f"Google Maps {path} returned {status}: {data.get('error_message', '')}")
+        if status not in ("OK", "ZERO_RESULTS"):
+            raise UpstreamError(f"Google Maps {path} returned {status}: {data.get('error_message', '')}")
+        return data
+
+    async def geocode(self, address: str, timeout: Optional[float] = None) -> list[Dict[str, Any]]:
+        data = await self._get("geocode/json", {"address": address}, timeout)
+        return data.get("results", [])
+
+    async def directions(
+        self, origin: tuple[float, float], destination: tuple[float, float], mode: str = "driving",
+        departure_time: str = "now", traffic_model: str = "best_guess", timeout: Optional[float] = None
+    ) -> list[Dict[str, Any]]:
+        params = {
+            "origin": f"{origin[0]},{origin[1]}",
+            "destination": f"{destination[0]},{destination[1]}",
+            "mode": mode,
+            "departure_time": departure_time,
+            "traffic_model": traffic_model,
+        }
+        data = await self._get("directions/json", params, timeout)
+        return data.get("routes", [])
+
+    # One row per origin, one element per destination; Google caps a request at 25 x 25 and 100 elements
+    async def distance_matrix(
+        self, origins: list[tuple[float, float]], destinations: list[tuple[float, float]], mode: str = "driving",
+        departure_time: str = "now", traffic_model: str = "best_guess", timeout: Optional[float] = None
+    ) -> list[Dict[str, Any]]:
+        params = {
+            "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+            "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            "mode": mode,
+            "departure_time": departure_time,
+            "traffic_model": traffic_model,
+        }
+        data = await self._get("distancematrix/json", params, timeout)
+        return data.get("rows", [])
+
+
+# Async Nominatim (OpenStreetMap) geocoder
+class NominatimClient:
+    def __init__(
+        self, http: httpx.AsyncClient, base_url: str = NOMINATIM_BASE_URL, budget: Optional[ProviderBudget] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+        self.budget = budget
+        self.breaker = breaker
+
+    async def geocode(self, address: str, timeout: float = 5) -> Optional[tuple[float, float]]:
+        return await observed("nominatim", "search", self._geocode(address, timeout), self.budget, self.breaker)
+
+    async def _geocode(self, address: str, timeout: float) -> Optional[tuple[float, float]]:
+        params = {"q": address, "format": "json", "limit": 1}
+        response = await self.http.get(f"{self.base_url}/search", params=params, timeout=timeout)
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+
+# Async OpenWeatherMap current-weather client
+class OpenWeatherClient:
+    def __init__(
+        self, http: httpx.AsyncClient, api_key: str, base_url: str = OPENWEATHER_BASE_URL,
+        budget: Optional[ProviderBudget] = None, breaker: Optional[CircuitBreaker] = None
+    ):
+        self.http = http
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.budget = budget
+        self.breaker = breaker
+
+    async def current(self, lat: float, lng: float, timeout: float = 10) -> Dict[str, Any]:
+        return await observed("openweather", "weather", self._current(lat, lng, timeout), self.budget, self.breaker)
+
+    async def _current(self, lat: float, lng: float, timeout: float) -> Dict[str, Any]:
+        params = {"lat": lat, "lon": lng, "appid": self.api_key, "units": "metric"}
+        response = await self.http.get(f"{self.base_url}/weather", params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+# main.py reads its configuration at import: no upstream keys (so every upstream call takes its fallback)
+# and no database until a test sets one up
+os.environ["GOOGLE_MAPS_API_KEY"] = ""
+os.environ["OPENWEATHER_API_KEY"] = ""
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("SHARED_CACHE_PATH", None)
+os.environ.pop("ROUTING_GRAPH_PATH", None)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    from sqlalchemy import create_engine
+    from main import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'eta.sqlite3'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
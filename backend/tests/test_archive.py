@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import delete, event, func, insert, select
+
+import archive
+from main import DeliveryETA, DeliveryOutcome
+
+CUTOFF = datetime.now(timezone.utc) - timedelta(days=30)
+
+
+@pytest.fixture
+def old_rows(engine):
+    start = CUTOFF - timedelta(days=3)
+    rows = [
+        {"prediction_id": f"p{i:04d}", "predicted_eta": 20.0 + i % 9, "created_at": start + timedelta(minutes=10 * i)}
+        for i in range(40)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(DeliveryETA), rows)
+        connection.execute(insert(DeliveryOutcome), [{"prediction_id": "p0003", "actual_minutes": 31.0}])
+    return len(rows)
+
+
+def archived_ids(archive_dir):
+    return sorted(i for frame in archive.iter_frames(str(archive_dir), columns=["id"]) for i in frame["id"])
+
+
+def table_rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(DeliveryETA)).scalar()
+
+
+def run(engine, archive_dir, **kwargs):
+    return archive.archive_rows(engine, str(archive_dir), CUTOFF, chunk_rows=10, fetch_rows=4, delete_batch=3, **kwargs)
+
+
+def test_rows_move_to_the_archive(engine, old_rows, tmp_path):
+    report = run(engine, tmp_path)
+    assert report["rows"] == report["deleted"] == old_rows and report["passes"] == 4
+    assert archived_ids(tmp_path) == list(range(1, old_rows + 1))
+    assert table_rows(engine) == 0
+    labelled = next(archive.iter_frames(str(tmp_path), columns=["id", "outcome_id", "actual_minutes"], labelled_only=True))
+    assert labelled[["id", "actual_minutes"]].values.tolist() == [[4, 31.0]]
+    assert not [name for name in os.listdir(tmp_path / "delivery_eta") if name.startswith("_pending-")]
+
+
+def test_delete_interrupted_mid_pass_does_not_duplicate_rows(engine, old_rows, tmp_path):
+    statements = []
+
+    def fail_second_pass(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("DELETE"):
+            statements.append(statement)
+            # Pass 1 takes four DELETE statements; fail pass 2 after its first one
+            if len(statements) == 6:
+                raise RuntimeError("connection lost")
+
+    event.listen(engine, "before_cursor_execute", fail_second_pass)
+    with pytest.raises(RuntimeError):
+        run(engine, tmp_path)
+    event.remove(engine, "before_cursor_execute", fail_second_pass)
+    # The whole second pass is still in the table: its delete rolled back
+    assert table_rows(engine) == old_rows - 10
+
+    report = run(engine, tmp_path)
+    assert report["recovered_rows"] == 10
+    assert archived_ids(tmp_path) == list(range(1, old_rows + 1))
+    assert table_rows(engine) == 0
+
+
+def test_leftover_partial_files_are_removed(engine, old_rows, tmp_path):
+    partition = tmp_path / "delivery_eta" / "date=2020-01-01"
+    partition.mkdir(parents=True)
+    (partition / ".part-12345.partial").write_bytes(b"PAR1")
+    run(engine, tmp_path)
+    assert not (partition / ".part-12345.partial").exists()
+    assert archived_ids(tmp_path) == list(range(1, old_rows + 1))
+
+
+def test_kept_rows_are_replaced_by_the_next_run(engine, old_rows, tmp_path):
+    run(engine, tmp_path, delete_archived=False)
+    assert table_rows(engine) == old_rows
+    # Rows deleted from the table since are only in the archive now and stay there
+    with engine.begin() as connection:
+        connection.execute(delete(DeliveryETA).where(DeliveryETA.id <= 5))
+
+    report = run(engine, tmp_path)
+    assert report["recovered_rows"] == old_rows - 5 and report["rows"] == old_rows - 5
+    assert archived_ids(tmp_path) == list(range(1, old_rows + 1))
+    files = [os.path.join(root, name) for root, _, names in os.walk(tmp_path) for name in names if name.endswith(".parquet")]
+    assert sum(pq.ParquetFile(path).metadata.num_rows for path in files) == old_rows
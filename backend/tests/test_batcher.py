@@ -0,0 +1,115 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from batcher import InferenceBatcher
+
+
+class Model:
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def predict(self, columns):
+        self.batches.append(len(columns["distance"]))
+        if self.error is not None:
+            raise self.error
+        return np.array(columns["distance"], dtype=float) * 2
+
+
+def rows(*distances):
+    return {"distance": list(distances)}
+
+
+def test_concurrent_requests_share_one_model_call_and_get_their_own_rows():
+    async def scenario():
+        batcher, model = InferenceBatcher(max_rows=64, max_wait_ms=0), Model()
+        results = await asyncio.gather(batcher.predict(model, rows(1)), batcher.predict(model, rows(2, 3)))
+        assert model.batches == [3]
+        assert results[0][0].tolist() == [2.0] and results[1][0].tolist() == [4.0, 6.0]
+        assert batcher.stats["batches"] == 1 and batcher.stats["rows"] == 3 and batcher.stats["requests"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_full_batch_is_scored_without_waiting():
+    async def scenario():
+        batcher, model = InferenceBatcher(max_rows=3, max_wait_ms=10_000), Model()
+        batcher.concurrent = True
+        waiting = asyncio.ensure_future(batcher.predict(model, rows(1)))
+        await asyncio.sleep(0)
+        assert batcher.stats["windows"] == 1 and not model.batches
+        # Filling the batch flushes it at once instead of after the 10 s window
+        full = await asyncio.wait_for(batcher.predict(model, rows(2, 3)), timeout=1)
+        assert full[0].tolist() == [4.0, 6.0] and (await waiting)[0].tolist() == [2.0]
+        assert model.batches == [3] and batcher.flush_handle is None
+        # The next request starts a new batch
+        await batcher.predict(model, rows(4, 5, 6))
+        assert model.batches == [3, 3] and batcher.stats["max_batch_rows"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_lone_request_is_not_delayed_but_concurrent_traffic_waits_for_the_window():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        batcher, model = InferenceBatcher(max_rows=64, max_wait_ms=50), Model()
+        start = loop.time()
+        await batcher.predict(model, rows(1))
+        assert loop.time() - start < 0.04 and batcher.stats["windows"] == 0
+
+        # A batch of several requests marks traffic as concurrent; the next batch waits for others to join
+        await asyncio.gather(batcher.predict(model, rows(1)), batcher.predict(model, rows(2)))
+        first = asyncio.ensure_future(batcher.predict(model, rows(3)))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.predict(model, rows(4)))
+        start = loop.time()
+        await asyncio.gather(first, second)
+        assert loop.time() - start >= 0.03
+        assert model.batches == [1, 2, 2] and batcher.stats["windows"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_requests_for_different_models_are_scored_separately():
+    async def scenario():
+        batcher, old, new = InferenceBatcher(max_rows=64, max_wait_ms=0), Model(), Model()
+        results = await asyncio.gather(
+            batcher.predict(old, rows(1)), batcher.predict(new, rows(2)), batcher.predict(old, rows(3))
+        )
+        assert old.batches == [2] and new.batches == [1]
+        assert [result[0].tolist() for result in results] == [[2.0], [4.0], [6.0]]
+
+    asyncio.run(scenario())
+
+
+def test_model_errors_reach_only_the_requests_of_that_model():
+    async def scenario():
+        batcher = InferenceBatcher(max_rows=64, max_wait_ms=0)
+        broken, working = Model(error=ValueError("feature mismatch")), Model()
+        results = await asyncio.gather(
+            batcher.predict(broken, rows(1)), batcher.predict(broken, rows(2)), batcher.predict(working, rows(3)),
+            return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results[:2])
+        assert results[2][0].tolist() == [6.0]
+        assert batcher.stats["errors"] == 1 and batcher.stats["batches"] == 1
+        # The batcher keeps serving after a failed batch
+        assert (await batcher.predict(working, rows(4)))[0].tolist() == [8.0]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_request_does_not_break_its_batch():
+    async def scenario():
+        batcher, model = InferenceBatcher(max_rows=64, max_wait_ms=0), Model()
+        cancelled = asyncio.ensure_future(batcher.predict(model, rows(1)))
+        kept = asyncio.ensure_future(batcher.predict(model, rows(2)))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        assert (await kept)[0].tolist() == [4.0]
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+import pytest
+from cachetools import TTLCache
+
+from directions_cache import SpatialRouteCache
+from spatial import cell_center, grid_cell
+
+CELL_METERS = 150
+ROUTE = {"distance_km": 4.0, "duration_minutes": 12.0, "polyline": "abc", "source": "google"}
+
+
+def points(origin_offset, dest_offset):
+    # Cell centres, moved by whole cells; origin and destination are 20 cells apart
+    origin = cell_center((85_000 + origin_offset, 514_000), CELL_METERS)
+    destination = cell_center((85_020 + dest_offset, 514_010), CELL_METERS)
+    return (*origin, *destination)
+
+
+def test_exact_and_same_cell_hits_keep_the_polyline():
+    cache = SpatialRouteCache(TTLCache(maxsize=10, ttl=60), CELL_METERS)
+    cache.put(*points(0, 0), ROUTE)
+    assert cache.get(*points(0, 0)) == ROUTE
+
+    lat, lng, dest_lat, dest_lng = points(0, 0)
+    moved = (lat + 1e-4, lng, dest_lat, dest_lng)
+    assert grid_cell(*moved[:2], CELL_METERS) == grid_cell(lat, lng, CELL_METERS)
+    route = cache.get(*moved)
+    assert route["polyline"] == "abc" and route["distance_km"] != ROUTE["distance_km"]
+    assert cache.stats["hits"] == 2
+
+
+def test_neighbour_cell_hits_drop_the_polyline():
+    cache = SpatialRouteCache(TTLCache(maxsize=10, ttl=60), CELL_METERS)
+    cache.put(*points(0, 0), ROUTE)
+    route = cache.get(*points(1, 0))
+    assert cache.stats["neighbor_hits"] == 1
+    assert route["polyline"] == "" and route["source"] == "google"
+    # The road distance is shifted by the change in straight-line distance, at the cached speed
+    assert route["distance_km"] < ROUTE["distance_km"]
+    assert route["duration_minutes"] / route["distance_km"] == pytest.approx(ROUTE["duration_minutes"] / ROUTE["distance_km"])
+    assert cache.get(*points(2, 0)) is None
@@ -0,0 +1,55 @@
+import itertools
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inference import compile_model, parity_grid, verify_forest, verify_parity
+from model_store import DEFAULT_MODEL_DIR, load_model
+
+
+@pytest.fixture(scope="module")
+def reference():
+    with open(os.path.join(DEFAULT_MODEL_DIR, "xgb_model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    with open(os.path.join(DEFAULT_MODEL_DIR, "preprocessor.pkl"), "rb") as f:
+        preprocessor = pickle.load(f)
+    return model, preprocessor
+
+
+@pytest.fixture(scope="module")
+def compiled(reference):
+    return compile_model(*reference)
+
+
+def test_parity_grid_covers_every_category_combination(compiled):
+    columns = parity_grid(compiled)
+    encodings = compiled.preprocessor.categorical
+    rows = set(zip(*(columns[encoding.name] for encoding in encodings)))
+    assert rows == set(itertools.product(*(encoding.categories for encoding in encodings)))
+    assert all(len(values) == len(rows) for values in columns.values())
+
+
+def test_compiled_model_matches_sklearn_on_the_parity_grid(compiled, reference):
+    model, preprocessor = reference
+    columns = parity_grid(compiled)
+    frame = pd.DataFrame(columns)[compiled.preprocessor.feature_names_in]
+
+    np.testing.assert_allclose(compiled.preprocessor.transform(columns), preprocessor.transform(frame), atol=1e-6)
+    np.testing.assert_allclose(compiled.predict(columns), model.predict(preprocessor.transform(frame)), atol=1e-3)
+    assert verify_parity(compiled, model, preprocessor) <= 1e-3
+    assert verify_forest(compiled) <= 1e-3
+
+
+def test_native_artifacts_match_the_pickled_model(compiled):
+    columns = parity_grid(compiled, seed=1)
+    np.testing.assert_allclose(load_model(DEFAULT_MODEL_DIR).predict(columns), compiled.predict(columns), atol=1e-3)
+
+
+def test_unknown_category_is_rejected(compiled):
+    columns = {name: values[:1] for name, values in parity_grid(compiled).items()}
+    columns["Weather_conditions"] = ["hail"]
+    with pytest.raises(ValueError, match="unknown category"):
+        compiled.predict(columns)
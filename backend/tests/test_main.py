@@ -0,0 +1,198 @@
+import asyncio
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import main
+from model_store import DEFAULT_MODEL_DIR, load_model
+
+
+@pytest.fixture
+def client(engine):
+    sessions = sessionmaker(bind=engine)
+
+    def get_db():
+        db = sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = get_db
+    # Without the context manager the lifespan (database, upstream clients, background loops) does not run
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def active_model(monkeypatch):
+    model = load_model(DEFAULT_MODEL_DIR)
+    monkeypatch.setattr(main.registry, "active", model)
+    return model
+
+
+def eta_request(**fields):
+    request = {
+        "restaurant_address": "MG Road, Bengaluru", "delivery_address": "Indiranagar, Bengaluru",
+        "delivery_person_age": 30, "delivery_person_rating": 4.6, "vehicle_type": "Bike", "vehicle_condition": 2,
+        "multiple_deliveries": 1, "order_time": "2026-10-14T19:30:00",
+    }
+    return main.ETARequest(**{**request, **fields})
+
+
+# Addresses the fake geocoder knows: two restaurants and customers within a few km, one customer 40 km away
+ADDRESSES = {
+    "MG Road, Bengaluru": (12.9756, 77.6050),
+    "Koramangala, Bengaluru": (12.9352, 77.6245),
+    "Indiranagar, Bengaluru": (12.9784, 77.6408),
+    "HSR Layout, Bengaluru": (12.9116, 77.6474),
+    "Hosur, Tamil Nadu": (12.7409, 77.8253),
+}
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    geocoded, queued = [], []
+
+    async def geocode_address(address, ttl=None):
+        geocoded.append(address)
+        if address not in ADDRESSES:
+            raise main.HTTPException(status_code=404, detail=f"Address not found: {address}")
+        return ADDRESSES[address]
+
+    async def put_many(rows):
+        queued.extend(rows)
+        return len(rows)
+
+    monkeypatch.setattr(main, "geocode_address", geocode_address)
+    monkeypatch.setattr(main.write_behind, "put_many", put_many)
+    return geocoded, queued
+
+
+def predictions_by_path():
+    return {labels["path"]: value for _, labels, value in main.PREDICTIONS.samples()}
+
+
+def test_outcome_requires_a_known_prediction(client, engine):
+    with engine.begin() as connection:
+        connection.execute(insert(main.DeliveryETA), [{"prediction_id": "abc123", "predicted_eta": 25.0}])
+
+    response = client.post("/deliveries/outcome", json={"prediction_id": "missing", "actual_minutes": 30})
+    assert response.status_code == 404
+    response = client.post("/deliveries/outcome", json={"prediction_id": "abc123", "actual_minutes": 30})
+    assert response.status_code == 201
+    response = client.post("/deliveries/outcome", json={"prediction_id": "abc123", "actual_minutes": 31})
+    assert response.status_code == 409
+
+
+def test_integer_vehicle_condition_reaches_the_model(active_model):
+    requests_ = [eta_request(vehicle_condition=condition) for condition in range(4)]
+    weathers = [{"condition": "sunny"}] * 4
+    traffic = ["high"] * 4
+    distances = [3.0] * 4
+    before = predictions_by_path()
+    results = asyncio.run(main.predict_eta_ml_batch(requests_, weathers, traffic, distances))
+    after = predictions_by_path()
+    assert after.get("ml", 0) - before.get("ml", 0) == 4
+    assert after.get("ml_error_fallback", 0) == before.get("ml_error_fallback", 0)
+
+    # The served predictions are the pickled sklearn pipeline's for the labelled conditions
+    with open(os.path.join(DEFAULT_MODEL_DIR, "preprocessor.pkl"), "rb") as f:
+        preprocessor = pickle.load(f)
+    with open(os.path.join(DEFAULT_MODEL_DIR, "xgb_model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    columns = main.build_feature_columns(requests_, weathers, traffic, distances, main.is_festival_day())
+    assert columns["Vehicle_condition"] == ["worse", "bad", "average", "good"]
+    expected = model.predict(preprocessor.transform(pd.DataFrame(columns)))
+    np.testing.assert_allclose([eta for eta, _ in results], np.clip(expected, 1, 60), rtol=1e-5)
+
+
+def test_batch_rejects_empty_and_oversized_batches(client, monkeypatch):
+    assert client.post("/predict-eta/batch", json={"items": []}).status_code == 400
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2)
+    items = [eta_request().model_dump()] * 3
+    response = client.post("/predict-eta/batch", json={"items": items})
+    assert response.status_code == 400 and "limit (2)" in response.json()["detail"]
+    # Malformed items fail the whole request at validation
+    assert client.post("/predict-eta/batch", json={"items": [{"restaurant_address": "MG Road"}]}).status_code == 422
+
+
+def test_batch_reports_errors_per_item(client, upstreams):
+    geocoded, queued = upstreams
+    items = [
+        eta_request(),
+        eta_request(delivery_address="Atlantis"),
+        eta_request(restaurant_address="Koramangala, Bengaluru", delivery_address="HSR Layout, Bengaluru"),
+        eta_request(vehicle_condition=7),
+        eta_request(vehicle_type="truck"),
+        eta_request(delivery_address="Hosur, Tamil Nadu"),
+        eta_request(),
+    ]
+    response = client.post("/predict-eta/batch", json={"items": [item.model_dump() for item in items]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (3, 4)
+    results = body["results"]
+    assert [item["index"] for item in results] == list(range(len(items)))
+    assert [item["status_code"] for item in results] == [200, 404, 200, 400, 400, 400, 200]
+    assert results[1]["error"] == "Address not found: Atlantis"
+    assert results[3]["error"] == "Vehicle condition must be 0-3"
+    assert results[4]["error"] == "Invalid vehicle type"
+    assert "hyperlocal limit" in results[5]["error"]
+    for index in (0, 2, 6):
+        assert results[index]["result"]["predicted_eta"] > 0 and results[index]["error"] is None
+
+    # Each distinct address is geocoded once, and only successful items are stored
+    assert sorted(geocoded) == sorted(set(geocoded))
+    assert len(queued) == 3
+    assert [row["prediction_id"] for row in queued] == [results[i]["result"]["prediction_id"] for i in (0, 2, 6)]
+
+
+def test_model_reload_invalidates_cached_responses(client, active_model, upstreams, monkeypatch):
+    fetched = []
+
+    async def get_google_directions(origin_lat, origin_lng, dest_lat, dest_lng):
+        fetched.append("directions")
+        return {"distance_km": 4.2, "duration_minutes": 14.0, "polyline": "abc", "source": "google"}
+
+    async def get_weather_data(lat, lng):
+        fetched.append("weather")
+        return {"condition": "sunny", "temperature": 28, "humidity": 55, "wind_speed": 3, "source": "openweather"}
+
+    async def put(row):
+        return True
+
+    cache = main.ETAResultCache(maxsize=100, ttl=600, cell_meters=150)
+    monkeypatch.setattr(main, "result_cache", cache)
+    monkeypatch.setattr(main, "get_google_directions", get_google_directions)
+    monkeypatch.setattr(main, "get_weather_data", get_weather_data)
+    monkeypatch.setattr(main.write_behind, "put", put)
+    monkeypatch.setattr(main, "MODEL_DIR", DEFAULT_MODEL_DIR)
+    # The lifespan registers the warmed-up components; it does not run under the test client
+    readiness = main.Readiness()
+    readiness.register("model")
+    monkeypatch.setattr(main, "readiness", readiness)
+
+    body = eta_request().model_dump()
+    before = predictions_by_path()
+    first = client.post("/predict-eta", json=body)
+    second = client.post("/predict-eta", json=body)
+    assert first.status_code == second.status_code == 200
+    assert second.json()["predicted_eta"] == first.json()["predicted_eta"]
+    assert fetched == ["directions", "weather"] and len(cache.entries) == 1
+    assert predictions_by_path().get("cached", 0) - before.get("cached", 0) == 1
+
+    # Swapping in a model version drops every cached response; the next request is predicted again
+    loaded, changed = asyncio.run(main.reload_model(force=True))
+    assert changed and main.registry.active is loaded
+    assert len(cache.entries) == 0 and cache.stats == {"invalidations": 1, "invalidated_entries": 1}
+    third = client.post("/predict-eta", json=body)
+    assert third.status_code == 200
+    assert fetched == ["directions", "weather"] * 2 and len(cache.entries) == 1
+    assert predictions_by_path().get("cached", 0) - before.get("cached", 0) == 1
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, func, select
+
+from persistence import WriteBehindQueue
+
+metadata = MetaData()
+events = Table("events", metadata, Column("id", Integer, primary_key=True), Column("name", String))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.sqlite3'}")
+    metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def stored(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(events)).scalar()
+
+
+def rows(count, start=0):
+    return [{"name": f"row-{i}"} for i in range(start, start + count)]
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_interval(engine):
+    async def scenario():
+        queue = WriteBehindQueue(engine, events, batch_size=3, flush_interval=30)
+        queue.start()
+        assert await queue.put_many(rows(3)) == 3
+        for _ in range(100):
+            if queue.stats["written"] == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert queue.stats["batches"] == 1 and queue.stats["last_flush_rows"] == 3
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert stored(engine) == 3
+
+
+def test_partial_batch_is_flushed_after_the_interval(engine):
+    async def scenario():
+        queue = WriteBehindQueue(engine, events, batch_size=100, flush_interval=0.05)
+        queue.start()
+        await queue.put(rows(1)[0])
+        await asyncio.sleep(0.01)
+        assert queue.stats["written"] == 0
+        await asyncio.sleep(0.3)
+        assert queue.stats["written"] == 1
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_full_backlog_drops_rows_after_the_enqueue_timeout(engine):
+    async def scenario():
+        # Not bound yet: rows wait in the backlog for the database
+        queue = WriteBehindQueue(None, events, max_backlog=2, enqueue_timeout=0.01)
+        queue.start()
+        assert await queue.put_many(rows(3)) == 2
+        assert queue.stats["dropped"] == 1 and queue.stats["backpressure_waits"] == 1
+        assert queue.metrics()["depth"] == 2
+        # Rows queued before the engine was bound go out once it is
+        queue.bind(engine)
+        await queue.stop()
+        assert queue.stats["written"] == 2
+
+    asyncio.run(scenario())
+    assert stored(engine) == 2
+
+
+def test_stop_drains_everything_queued(engine):
+    async def scenario():
+        queue = WriteBehindQueue(engine, events, batch_size=7, flush_interval=30)
+        queue.start()
+        await queue.put_many(rows(50))
+        await queue.stop()
+        assert queue.stats["written"] == 50 and queue.stats["batches"] == 8
+        assert not queue.metrics()["running"]
+
+    asyncio.run(scenario())
+    assert stored(engine) == 50
+
+
+def test_stop_before_the_database_is_ready_does_not_wait(engine):
+    async def scenario():
+        queue = WriteBehindQueue(None, events)
+        queue.start()
+        await queue.put_many(rows(3))
+        await asyncio.wait_for(queue.stop(), timeout=1)
+        assert queue.stats["written"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_rows_are_written_when_the_hook_fails(engine):
+    def failing_hook(connection, batch):
+        raise RuntimeError("rollup table missing")
+
+    async def scenario():
+        queue = WriteBehindQueue(engine, events, on_write=failing_hook)
+        queue.start()
+        await queue.put_many(rows(4))
+        await queue.stop()
+        assert queue.stats["hook_failed"] == 4 and queue.stats["written"] == 4 and queue.stats["failed"] == 0
+
+    asyncio.run(scenario())
+    assert stored(engine) == 4
+
+
+def test_put_requires_a_started_queue(engine):
+    with pytest.raises(RuntimeError):
+        asyncio.run(WriteBehindQueue(engine, events).put(rows(1)[0]))
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from quota import BACKGROUND, INTERACTIVE, ProviderBudget, UpstreamScheduler, in_background, upstream_priority
+from resilience import deadline, time_left
+
+
+def test_burst_is_granted_then_callers_queue_or_degrade():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        budget = ProviderBudget("google", rate=20, burst=2, max_wait=0.08)
+        start = loop.time()
+        # Two tokens in the bucket; the third caller waits 50 ms for one, the fourth would wait 100 ms
+        granted = await asyncio.gather(*(budget.acquire() for _ in range(4)))
+        assert granted == [True, True, True, False]
+        assert loop.time() - start >= 0.04
+        stats = budget.metrics()
+        assert (stats["granted_interactive"], stats["queued_interactive"], stats["degraded_interactive"]) == (2, 1, 1)
+        assert stats["waiting"] == {"interactive": 0, "background": 0}
+        # An explicit limit overrides the priority's
+        assert await budget.acquire(max_wait=0) is False
+
+    asyncio.run(scenario())
+
+
+def test_interactive_waiters_are_released_before_background_ones():
+    async def scenario():
+        budget = ProviderBudget("nominatim", rate=20, burst=1, max_wait=1, background_max_wait=1, background_reserve=0)
+        assert await budget.acquire()
+        released = []
+
+        async def call(priority, label):
+            await budget.acquire(priority)
+            released.append(label)
+
+        background = asyncio.ensure_future(call(BACKGROUND, "background"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(call(INTERACTIVE, "interactive"))
+        await asyncio.sleep(0)
+        assert budget.metrics()["waiting"] == {"interactive": 1, "background": 1}
+        await asyncio.gather(background, interactive)
+        assert released == ["interactive", "background"]
+
+    asyncio.run(scenario())
+
+
+def test_background_calls_leave_the_reserve_to_interactive_ones():
+    async def scenario():
+        budget = ProviderBudget("openweather", rate=1, burst=4, background_max_wait=0.01, background_reserve=0.5)
+        assert [await budget.acquire(BACKGROUND) for _ in range(3)] == [True, True, False]
+        assert [await budget.acquire(INTERACTIVE) for _ in range(2)] == [True, True]
+        assert budget.stats["granted_background"] == 2 and budget.stats["degraded_background"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_background_calls_are_served_when_the_burst_is_one():
+    async def scenario():
+        # Nominatim's default budget, and OpenWeather's once split across ten workers, hold a single token
+        assert await asyncio.wait_for(UpstreamScheduler()["nominatim"].acquire(BACKGROUND), timeout=1)
+        scheduler = UpstreamScheduler()
+        scheduler.share(10)
+        assert await asyncio.wait_for(scheduler["openweather"].acquire(BACKGROUND), timeout=1)
+
+        budget = ProviderBudget("nominatim", rate=20, burst=1, background_max_wait=1)
+        assert await budget.acquire(BACKGROUND)
+        # The next background call queues for the refilled token instead of waiting for a reserve it cannot get
+        assert await asyncio.wait_for(budget.acquire(BACKGROUND), timeout=0.5)
+        assert budget.stats["queued_background"] == 1 and not budget.waiters and budget.timer is None
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiters_are_skipped():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        budget = ProviderBudget("google", rate=20, burst=1, max_wait=1)
+        assert await budget.acquire()
+        start = loop.time()
+        gave_up = asyncio.ensure_future(budget.acquire())
+        waiting = asyncio.ensure_future(budget.acquire())
+        await asyncio.sleep(0)
+        gave_up.cancel()
+        assert await waiting
+        # The second waiter takes the first token instead of waiting for two
+        assert loop.time() - start < 0.09
+
+    asyncio.run(scenario())
+
+
+def test_throttling_halves_the_rate_and_successes_restore_it():
+    budget = ProviderBudget("google", rate=10, burst=5)
+    budget.record(throttled=True)
+    assert budget.rate == 5 and budget.tokens == pytest.approx(0, abs=0.01)
+    for _ in range(5):
+        budget.record(throttled=True)
+    # Backs off to at most a tenth of the configured rate
+    assert budget.rate == 1 and budget.stats["throttled"] == 6
+    budget.record(throttled=False)
+    assert budget.rate == pytest.approx(1.5)
+    for _ in range(30):
+        budget.record(throttled=False)
+    assert budget.rate == 10
+
+
+def test_share_splits_each_budget_between_processes():
+    scheduler = UpstreamScheduler({"google": (50, 50), "nominatim": (1, 1)})
+    scheduler.share(4)
+    google, nominatim = scheduler["google"], scheduler["nominatim"]
+    assert (google.configured_rate, google.rate, google.burst, google.tokens) == (12.5, 12.5, 12.5, 12.5)
+    # Every process keeps at least one token of burst
+    assert (nominatim.rate, nominatim.burst) == (0.25, 1.0)
+    assert set(scheduler.metrics()) == {"google", "nominatim"}
+
+
+def test_in_background_runs_at_background_priority_without_the_request_deadline():
+    async def refresh():
+        return upstream_priority.get(), time_left()
+
+    async def scenario():
+        with deadline(1.0):
+            assert upstream_priority.get() == INTERACTIVE and time_left() is not None
+            priority, left = await asyncio.ensure_future(in_background(refresh)())
+            assert (priority, left) == (BACKGROUND, None)
+            # The request's own context is untouched
+            assert upstream_priority.get() == INTERACTIVE and time_left() is not None
+
+    asyncio.run(scenario())
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, Hedge, deadline, request_deadline, time_left, within_deadline
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers_through_a_trial():
+    breaker = CircuitBreaker("google", failure_threshold=3, reset_seconds=0.05)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(failed=True)
+    # A success resets the count
+    breaker.record(failed=False)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    assert breaker.stats == {"opened": 1, "short_circuited": 1}
+
+    # After the reset period one trial is let through, and only one
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(failed=False)
+    assert breaker.metrics() == {"opened": 1, "short_circuited": 2, "state": "closed", "consecutive_failures": 0}
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker("openweather", failure_threshold=1, reset_seconds=0.05)
+    assert breaker.allow()
+    breaker.record(failed=True)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.stats["opened"] == 2
+    # The new open period starts at the failed trial
+    assert not breaker.allow()
+
+
+def test_abandoned_trial_lets_the_next_call_through():
+    breaker = CircuitBreaker("nominatim", failure_threshold=1, reset_seconds=0.0)
+    assert breaker.allow()
+    breaker.record(failed=True)
+    assert breaker.allow() and not breaker.allow()
+    breaker.abandon()
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.allow()
+
+
+def call(result=None, error=None, delay=0.0):
+    async def run():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return run
+
+
+def test_fast_primary_is_not_hedged():
+    hedge = Hedge("directions", delay=0.05)
+    backup = call("backup")
+    assert asyncio.run(hedge.run(call("primary"), backup)) == "primary"
+    assert hedge.stats == {"calls": 1, "hedged": 0, "backup_won": 0, "fallbacks": 0, "failed": 0}
+
+
+def test_primary_failing_before_the_delay_falls_back_at_once():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        hedge = Hedge("directions", delay=0.5)
+        start = loop.time()
+        assert await hedge.run(call(error=ConnectionError("reset")), call("backup")) == "backup"
+        assert loop.time() - start < 0.25
+        assert hedge.stats["fallbacks"] == 1 and hedge.stats["hedged"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        hedge = Hedge("directions", delay=0.02)
+        cancelled = []
+
+        async def slow_primary():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append("primary")
+                raise
+            return "primary"
+
+        assert await hedge.run(slow_primary, call("backup", delay=0.01)) == "backup"
+        await asyncio.sleep(0)
+        assert cancelled == ["primary"]
+        assert (hedge.stats["hedged"], hedge.stats["backup_won"]) == (1, 1)
+
+        # A hedged primary that answers first still wins
+        assert await hedge.run(call("primary", delay=0.03), call("backup", delay=0.5)) == "primary"
+        assert (hedge.stats["hedged"], hedge.stats["backup_won"]) == (2, 1)
+
+    asyncio.run(scenario())
+
+
+def test_both_calls_failing_raises_the_backup_error():
+    async def scenario():
+        hedge = Hedge("geocode", delay=0.01)
+        with pytest.raises(LookupError):
+            await hedge.run(call(error=TimeoutError(), delay=0.02), call(error=LookupError("no result"), delay=0.03))
+        with pytest.raises(LookupError):
+            await hedge.run(call(error=TimeoutError()), call(error=LookupError("no result")))
+        assert hedge.stats["failed"] == 2 and hedge.stats["fallbacks"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_deadline_applies_inside_the_block_and_to_the_tasks_it_starts():
+    async def remaining():
+        return time_left()
+
+    async def scenario():
+        assert time_left() is None
+        with deadline(0.5):
+            assert 0.4 < time_left() <= 0.5
+            assert 0.4 < await asyncio.ensure_future(remaining()) <= 0.5
+            with deadline(0.1):
+                assert time_left() <= 0.1
+            assert time_left() > 0.1
+        assert request_deadline.get() is None
+
+    asyncio.run(scenario())
+
+
+def test_within_deadline_sets_a_deadline_per_call():
+    @within_deadline(0.2)
+    async def endpoint(name):
+        return name, time_left()
+
+    name, left = asyncio.run(endpoint("predict_eta"))
+    assert name == "predict_eta" and 0.1 < left <= 0.2
+    assert endpoint.__name__ == "endpoint" and request_deadline.get() is None
@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+import routing
+from routing import RoutingEngine
+
+
+# Function to write a jittered street grid as OSM XML: mixed road classes, some one-way streets
+def write_grid_osm(path, size: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    node_id = lambda i, j: i * size + j + 1
+    lines = ['<?xml version="1.0"?>', '<osm version="0.6">']
+    for i in range(size):
+        for j in range(size):
+            lat = 12.90 + i * 0.0012 + rng.uniform(-2e-4, 2e-4)
+            lng = 77.55 + j * 0.0012 + rng.uniform(-2e-4, 2e-4)
+            lines.append(f'<node id="{node_id(i, j)}" lat="{lat:.7f}" lon="{lng:.7f}"/>')
+    way_id = 1
+    for i in range(size):
+        for horizontal in (True, False):
+            refs = [node_id(i, j) if horizontal else node_id(j, i) for j in range(size)]
+            highway = "primary" if i % 5 == 0 else rng.choice(["residential", "residential", "tertiary", "service"])
+            tags = f'<tag k="highway" v="{highway}"/>'
+            if rng.random() < 0.2:
+                tags += f'<tag k="oneway" v="{rng.choice(["yes", "-1"])}"/>'
+            lines.append(f'<way id="{way_id}">' + "".join(f'<nd ref="{r}"/>' for r in refs) + tags + "</way>")
+            way_id += 1
+    lines.append('<way id="999999"><nd ref="1"/><nd ref="2"/><tag k="building" v="yes"/></way>')
+    lines.append("</osm>")
+    path.write_text("\n".join(lines))
+
+
+@pytest.fixture(scope="module")
+def grid(tmp_path_factory):
+    path = tmp_path_factory.mktemp("osm") / "grid.osm"
+    write_grid_osm(path, 24)
+    lats, lngs, edges = routing.largest_component(*routing.parse_osm(str(path)))
+    return path, lats, lngs, edges
+
+
+def plain_dijkstra(n, edges, sources):
+    best = {}
+    for u, v, seconds, _ in edges:
+        best[(u, v)] = min(seconds, best.get((u, v), float("inf")))
+    pairs = np.array(list(best))
+    graph = csr_matrix((np.maximum(list(best.values()), routing.MIN_EDGE_SECONDS), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    return dijkstra(graph, indices=sources), best
+
+
+def test_contraction_hierarchy_matches_plain_dijkstra(grid):
+    path, lats, lngs, edges = grid
+    engine = RoutingEngine.from_osm(str(path), cache_path=str(path) + ".ch.npz")
+    n = len(lats)
+    rng = random.Random(7)
+    sources = rng.sample(range(n), 20)
+    expected, original = plain_dijkstra(n, edges, sources)
+
+    for row, source in enumerate(sources):
+        for target in rng.sample(range(n), 40):
+            result = engine.shortest_path(source, target)
+            if not np.isfinite(expected[row, target]):
+                assert result is None
+                continue
+            seconds, meters, nodes = result
+            assert seconds == pytest.approx(expected[row, target], rel=1e-9, abs=1e-4)
+            # The unpacked path runs over original road edges and adds up to the reported time
+            assert nodes[0] == source and nodes[-1] == target
+            assert sum(original[(a, b)] for a, b in zip(nodes, nodes[1:])) == pytest.approx(seconds, abs=1e-4)
+
+
+def test_cached_hierarchy_is_reused(grid, monkeypatch):
+    path = grid[0]
+    cache_path = str(path) + ".reuse.npz"
+    built = RoutingEngine.from_osm(str(path), cache_path=cache_path)
+
+    def fail(*args):
+        raise AssertionError("rebuilt despite a fresh cache")
+    monkeypatch.setattr(routing, "build_contraction_hierarchy", fail)
+    loaded = RoutingEngine.from_osm(str(path), cache_path=cache_path)
+    assert loaded.n_nodes == built.n_nodes and loaded.n_edges == built.n_edges
+    assert loaded.shortest_path(0, loaded.n_nodes - 1)[0] == pytest.approx(built.shortest_path(0, built.n_nodes - 1)[0])
+
+
+def test_route_snaps_coordinates_and_encodes_the_path(grid):
+    path, lats, lngs, _ = grid
+    engine = RoutingEngine.from_osm(str(path), cache_path=str(path) + ".ch.npz")
+    result = engine.route(float(lats[0]) + 1e-4, float(lngs[0]), float(lats[-1]), float(lngs[-1]) - 1e-4)
+    assert result["distance_km"] > 0 and result["duration_minutes"] > 0
+    assert result["polyline"]
+    assert routing.encode_polyline([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from quota import in_background
+from resilience import DeadlineExceeded, deadline
+from singleflight import SingleFlight
+
+
+class Upstream:
+    def __init__(self, result="ok", error=None, delay=0.02):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f"{self.result}-{call}"
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight, upstream = SingleFlight("geocode"), Upstream()
+        results = await asyncio.gather(*(flight.do("mg road", upstream) for _ in range(5)), flight.do("koramangala", upstream))
+        assert results == ["ok-1"] * 5 + ["ok-2"]
+        assert upstream.calls == 2
+        assert flight.metrics() == {
+            "calls": 2, "coalesced": 4, "deadline_exceeded": 0, "background_refreshes": 0, "refresh_errors": 0, "inflight": 0
+        }
+        # Once the call has finished the next caller starts a new one
+        assert await flight.do("mg road", upstream) == "ok-3"
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_waiting_caller():
+    async def scenario():
+        flight, upstream = SingleFlight("directions"), Upstream(error=TimeoutError("upstream timed out"))
+        results = await asyncio.gather(*(flight.do("route", upstream) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, TimeoutError) for result in results)
+        assert upstream.calls == 1 and not flight.inflight
+        # A failed call is not cached: the next caller retries
+        upstream.error = None
+        assert await flight.do("route", upstream) == "ok-2"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight, upstream = SingleFlight("weather"), Upstream(delay=0.05)
+        first = asyncio.ensure_future(flight.do("tile", upstream))
+        second = asyncio.ensure_future(flight.do("tile", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "ok-1"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+
+def test_background_refresh_joins_inflight_calls_and_counts_errors():
+    async def scenario():
+        flight, upstream = SingleFlight("geocode"), Upstream()
+        waiting = asyncio.ensure_future(flight.do("mg road", upstream))
+        await asyncio.sleep(0)
+        flight.refresh("mg road", upstream)
+        assert await waiting == "ok-1" and upstream.calls == 1
+        assert flight.stats["background_refreshes"] == 0
+
+        failing = Upstream(error=RuntimeError("quota exceeded"))
+        flight.refresh("mg road", failing)
+        await asyncio.sleep(0.05)
+        assert flight.stats["background_refreshes"] == 1 and flight.stats["refresh_errors"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_callers_joining_a_background_call_keep_their_own_deadline():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        flight, upstream = SingleFlight("weather"), Upstream(delay=0.5)
+        flight.refresh("tile", in_background(upstream))
+        await asyncio.sleep(0)
+        start = loop.time()
+        with deadline(0.05):
+            with pytest.raises(DeadlineExceeded):
+                await flight.do("tile", upstream)
+        assert loop.time() - start < 0.3
+        assert flight.stats["deadline_exceeded"] == 1 and "tile" in flight.inflight
+        # The shared call carries on for callers without a deadline
+        assert await flight.do("tile", upstream) == "ok-1" and upstream.calls == 1
+
+        # A caller that starts the call itself is bounded by its upstream calls, not cut off here
+        with deadline(0.01):
+            assert await flight.do("route", Upstream(delay=0.05)) == "ok-1"
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert
+
+import archive
+import train_model
+from main import DeliveryETA, DeliveryOutcome
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "models"
+    directory.mkdir()
+    for name in ("xgb_model.pkl", "preprocessor.pkl"):
+        shutil.copy(os.path.join(MODELS_DIR, name), directory / name)
+    monkeypatch.setattr(train_model, "MODEL_PATH", str(directory / "xgb_model.pkl"))
+    monkeypatch.setattr(train_model, "PREPROCESSOR_PATH", str(directory / "preprocessor.pkl"))
+    monkeypatch.setattr(train_model, "RETRAIN_CACHE_DIR", str(tmp_path / "retrain_cache"))
+    return directory
+
+
+def add_predictions(engine, count, created_at):
+    rows = [
+        {
+            "prediction_id": f"p{created_at:%Y%m%d}{i:05d}", "delivery_person_age": 30, "delivery_person_rating": 4.5,
+            "vehicle_type": "bike", "vehicle_condition": i % 4, "multiple_deliveries": 1,
+            "order_time": created_at, "predicted_eta": 25.0, "distance_km": 1.0 + i % 7, "weather_condition": "sunny",
+            "traffic_density": "low", "is_festival": False, "confidence": 0.8, "created_at": created_at,
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(DeliveryETA), rows)
+    return [row["prediction_id"] for row in rows]
+
+
+def add_outcomes(engine, prediction_ids):
+    with engine.begin() as connection:
+        connection.execute(
+            insert(DeliveryOutcome), [{"prediction_id": pid, "actual_minutes": 30.0} for pid in prediction_ids]
+        )
+
+
+def test_retrain_picks_up_late_outcomes_and_archived_rows(engine, model_dir, tmp_path):
+    state_path = str(tmp_path / "retrain_state.json")
+    archive_dir = str(tmp_path / "archive")
+    retrain = lambda: train_model.retrain_incremental(
+        engine, rounds=1, chunk_rows=7, min_rows=1, state_path=state_path, archive_dir=archive_dir
+    )
+
+    old = add_predictions(engine, 20, datetime.now(timezone.utc) - timedelta(days=60))
+    new = add_predictions(engine, 20, datetime.now(timezone.utc))
+    add_outcomes(engine, new)
+    report = retrain()
+    assert report["rows"] == 20 and report["archived_rows"] == 0
+
+    # Outcomes recorded after that run for older predictions (lower delivery_eta ids) are still learned from
+    add_outcomes(engine, old[:5])
+    report = retrain()
+    assert report["rows"] == 5
+
+    # Labelled rows moved to the archive before a run sees them are read back from it
+    add_outcomes(engine, old[5:10])
+    archive.archive_rows(engine, archive_dir, cutoff=datetime.now(timezone.utc) - timedelta(days=30))
+    report = retrain()
+    assert report["rows"] == 5 and report["archived_rows"] == 5
+    assert retrain() is None
+
+
+def test_legacy_watermark_is_migrated(engine, tmp_path):
+    ids = add_predictions(engine, 10, datetime.now(timezone.utc))
+    # Old state files recorded the highest labelled delivery_eta id learned from: here a run over rows 2-6
+    # (outcomes 1-5), followed by outcomes for rows 7-10 and a late one for row 1
+    add_outcomes(engine, ids[1:6])
+    add_outcomes(engine, ids[6:])
+    add_outcomes(engine, ids[:1])
+    state = train_model.migrate_retrain_state(engine, {"last_id": 6})
+    assert state["last_outcome_id"] == 5
+    assert train_model.migrate_retrain_state(engine, {"last_outcome_id": 3})["last_outcome_id"] == 3